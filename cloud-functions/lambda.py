@@ -25,203 +25,229 @@ PHONE_NUMBER = '+61432430383'  # Australian phone number format with country cod
 # IoT Topic for notifications
 IOT_NOTIFICATION_TOPIC = "home/cameras/notification"
  
+# Labels that make an event a warning; no later frame can raise it further
+PERSON_LABELS = ['Person', 'Human', 'Male', 'Female']
+VEHICLE_LABELS = ['Vehicle', 'Car']
+ 
 def lambda_handler(event, _):
     """
-    Process uploaded frames from the security camera, detect labels with Rekognition,
-    and send SMS notifications when important objects are detected.
+    Process event manifests uploaded by the security camera. Each manifest
+    lists the frames of one motion event; they are analysed together and at
+    most one set of notifications is sent per event.
     """
-    try:
-        # Extract S3 bucket and object information
-        bucket = event['Records'][0]['s3']['bucket']['name']
-        key = urllib.parse.unquote_plus(event['Records'][0]['s3']['object']['key'])
+    results = []
+    for record in event['Records']:
+        bucket = record['s3']['bucket']['name']
+        key = urllib.parse.unquote_plus(record['s3']['object']['key'])
         logger.info(f"Processing new upload: {bucket}/{key}")
         
-        # Only process files in the frames/ directory
-        if not key.startswith('frames/'):
-            logger.info(f"Skipping non-frame file: {key}")
-            return {
-                'statusCode': 200,
-                'body': json.dumps({'message': 'Not a frame file, skipping'})
+        # Frames are analysed through their event's manifest, not one by one
+        if not (key.startswith('events/') and key.endswith('/manifest.json')):
+            logger.info(f"Skipping non-manifest file: {key}")
+            results.append({'message': 'Not an event manifest, skipping', 'key': key})
+            continue
+        
+        results.append(process_manifest(bucket, key))
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps(results[0] if len(results) == 1 else results)
+    }
+
+def analyze_frame(bucket, key):
+    """
+    Detect labels in one frame and return the important ones.
+    """
+    response = rekognition.detect_labels(
+        Image={
+            'S3Object': {
+                'Bucket': bucket, 
+                'Name': key
             }
+        },
+        MaxLabels=10,
+        MinConfidence=MIN_CONFIDENCE
+    )
+    
+    # Print all detected labels
+    logger.info(f"All detected labels for {key}:")
+    for label in response['Labels']:
+        logger.info(f"  - {label['Name']}: {label['Confidence']:.2f}%")
+    
+    # Filter for important labels
+    return [
+        {'name': label['Name'], 'confidence': label['Confidence']}
+        for label in response['Labels'] if label['Name'] in IMPORTANT_LABELS
+    ]
+
+def process_manifest(bucket, manifest_key):
+    """
+    Analyse all frames of one event and notify once if anything important was seen.
+    """
+    try:
+        manifest = json.loads(s3.get_object(Bucket=bucket, Key=manifest_key)['Body'].read())
+        timestamp = manifest['event_id']
+        video_key = (manifest.get('video') or {}).get('key')
+        frame_keys = [frame['key'] for frame in manifest.get('frames', [])]
+        logger.info(f"Event {timestamp} from {manifest.get('device_id')}: {len(frame_keys)} frames, video {video_key}")
         
-        # Get timestamp directory from key
-        # Format: frames/20230510_123045/frame_0.jpg
-        key_parts = key.split('/')
-        if len(key_parts) >= 3:
-            timestamp = key_parts[1]
-            video_key = f"clips/motion_{timestamp}.mp4"
-            logger.info(f"Associated video file: {video_key}")
-        else:
-            video_key = None
-            logger.warning(f"Could not determine associated video for frame: {key}")
+        # Keep the highest confidence per label and remember the frame that showed it
+        best_detections = {}
+        best_frame = None
+        for frame_key in frame_keys:
+            try:
+                detections = analyze_frame(bucket, frame_key)
+            except Exception as frame_error:
+                logger.error(f"Error analysing frame {frame_key}: {str(frame_error)}")
+                continue
+            for detection in detections:
+                previous = best_detections.get(detection['name'])
+                if previous is None or detection['confidence'] > previous['confidence']:
+                    best_detections[detection['name']] = detection
+                    if best_frame is None or detection['confidence'] > best_frame[1]:
+                        best_frame = (frame_key, detection['confidence'])
+            # A person is the most severe result; the remaining frames cannot change the alert
+            if any(detection['name'] in PERSON_LABELS for detection in detections):
+                break
         
-        # Analyze the frame using Rekognition
-        response = rekognition.detect_labels(
-            Image={
-                'S3Object': {
-                    'Bucket': bucket, 
-                    'Name': key
-                }
-            },
-            MaxLabels=10,
-            MinConfidence=MIN_CONFIDENCE
-        )
+        important_detections = sorted(best_detections.values(), key=lambda d: d['confidence'], reverse=True)
+        if not important_detections:
+            logger.info(f"No important labels detected in event {timestamp}")
+            return {
+                'message': 'No important objects detected',
+                'manifest': manifest_key,
+                'frames': frame_keys
+            }
         
-        # Print all detected labels
-        logger.info(f"All detected labels for {key}:")
-        for label in response['Labels']:
-            logger.info(f"  - {label['Name']}: {label['Confidence']:.2f}%")
+        key = best_frame[0]
+        logger.info(f"Important labels detected in event {timestamp}:")
+        for detection in important_detections:
+            logger.info(f"  - {detection['name']}: {detection['confidence']:.2f}%")
         
-        # Filter for important labels
-        important_detections = []
-        for label in response['Labels']:
-            if label['Name'] in IMPORTANT_LABELS:
-                important_detections.append({
-                    'name': label['Name'],
-                    'confidence': label['Confidence']
-                })
+        # Generate signed URLs for frame and video (valid for 24 hours)
+        expire_time = 3600 * 24
         
-        # Check if important labels were detected
-        if important_detections:
-            logger.info(f"Important labels detected in {key}:")
-            for detection in important_detections:
-                logger.info(f"  - {detection['name']}: {detection['confidence']:.2f}%")
-            
-            # Generate signed URLs for frame and video (valid for 24 hours)
-            expire_time = 3600 * 24
-            
-            frame_url = s3.generate_presigned_url(
+        frame_url = s3.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': bucket, 'Key': key},
+            ExpiresIn=expire_time
+        )
+        
+        video_url = None
+        if video_key:
+            video_url = s3.generate_presigned_url(
                 'get_object',
-                Params={'Bucket': bucket, 'Key': key},
+                Params={'Bucket': bucket, 'Key': video_key},
                 ExpiresIn=expire_time
             )
+        
+        # Prepare result with important detections
+        result = {
+            'message': 'Important objects detected',
+            'manifest': manifest_key,
+            'frame': key,
+            'video': video_key,
+            'detections': important_detections,
+            'urls': {
+                'frame': frame_url,
+                'video': video_url
+            }
+        }
+        
+        # Create a message with detected objects for notifications
+        detected_objects = ", ".join([f"{detection['name']} ({detection['confidence']:.1f}%)" 
+                                   for detection in important_detections])
+        
+        # Event IDs are dated in UTC by the device
+        timestamp_formatted = timestamp.replace('_', ' ').replace('T', ' ') + ' UTC'
+        notification_message = f"Security Alert: {detected_objects} detected at {timestamp_formatted}"
+        
+        # 1. Publish to IoT Topic
+        try:
+            # Determine notification type based on detected labels
+            notification_type = "warning"  # Default
             
-            video_url = None
-            if video_key:
-                video_url = s3.generate_presigned_url(
-                    'get_object',
-                    Params={'Bucket': bucket, 'Key': video_key},
-                    ExpiresIn=expire_time
-                )
+            # Person = warning, Vehicle = info, Other = info
+            if any(d['name'] in PERSON_LABELS for d in important_detections):
+                notification_type = "warning"
+            elif any(d['name'] in VEHICLE_LABELS for d in important_detections):
+                notification_type = "info"
             
-            # Prepare result with important detections
-            result = {
-                'message': 'Important objects detected',
-                'frame': key,
-                'video': video_key,
-                'detections': important_detections,
-                'urls': {
-                    'frame': frame_url,
-                    'video': video_url
+            # Prepare the IoT notification payload
+            iot_payload = {
+                "message": notification_message,
+                "type": notification_type,
+                "timestamp": datetime.now().isoformat(),
+                "deviceId": manifest.get('device_id', "security-camera"),
+                "metadata": {
+                    "detections": important_detections,
+                    "frameKey": key,
+                    "videoKey": video_key,
+                    "radar": manifest.get('radar'),
+                    "urls": {
+                        "frame": frame_url,
+                        "video": video_url if video_url else None
+                    }
                 }
             }
             
-            # Create a message with detected objects for notifications
-            detected_objects = ", ".join([f"{detection['name']} ({detection['confidence']:.1f}%)" 
-                                       for detection in important_detections])
-            
-            timestamp_formatted = timestamp.replace('_', ' ').replace('T', ' ')
-            notification_message = f"Security Alert: {detected_objects} detected at {timestamp_formatted}"
+            # Publish to IoT topic
+            iot_client.publish(
+                topic=IOT_NOTIFICATION_TOPIC,
+                qos=1,
+                payload=json.dumps(iot_payload)
+            )
             
-            # 1. Publish to IoT Topic
-            try:
-                # Determine notification type based on detected labels
-                notification_type = "warning"  # Default
-                
-                # Person = warning, Vehicle = info, Other = info
-                if any(d['name'] in ['Person', 'Human', 'Male', 'Female'] for d in important_detections):
-                    notification_type = "warning"
-                elif any(d['name'] in ['Vehicle', 'Car'] for d in important_detections):
-                    notification_type = "info"
-                
-                # Prepare the IoT notification payload
-                iot_payload = {
-                    "message": notification_message,
-                    "type": notification_type,
-                    "timestamp": datetime.now().isoformat(),
-                    "deviceId": "security-camera",
-                    "metadata": {
-                        "detections": important_detections,
-                        "frameKey": key,
-                        "videoKey": video_key,
-                        "urls": {
-                            "frame": frame_url,
-                            "video": video_url if video_url else None
-                        }
-                    }
-                }
-                
-                # Publish to IoT topic
-                iot_response = iot_client.publish(
-                    topic=IOT_NOTIFICATION_TOPIC,
-                    qos=1,
-                    payload=json.dumps(iot_payload)
-                )
-                
-                logger.info(f"Published to IoT topic: {IOT_NOTIFICATION_TOPIC}")
-                result['iot_notification'] = {
-                    'status': 'sent',
-                    'topic': IOT_NOTIFICATION_TOPIC
-                }
-            except Exception as iot_error:
-                logger.error(f"Error publishing to IoT topic: {str(iot_error)}")
-                result['iot_notification'] = {
-                    'status': 'failed',
-                    'error': str(iot_error)
-                }
+            logger.info(f"Published to IoT topic: {IOT_NOTIFICATION_TOPIC}")
+            result['iot_notification'] = {
+                'status': 'sent',
+                'topic': IOT_NOTIFICATION_TOPIC
+            }
+        except Exception as iot_error:
+            logger.error(f"Error publishing to IoT topic: {str(iot_error)}")
+            result['iot_notification'] = {
+                'status': 'failed',
+                'error': str(iot_error)
+            }
+        
+        # 2. Send SMS notification (existing functionality)
+        try:
+            # Create SMS message
+            sms_message = f"Security Alert: {detected_objects} detected at {timestamp_formatted}."
             
-            # 2. Send SMS notification (existing functionality)
-            try:
-                # Create SMS message
-                sms_message = f"Security Alert: {detected_objects} detected at {timestamp_formatted}."
-                
-                # Send the SMS
-                sns_response = sns.publish(
-                    PhoneNumber=PHONE_NUMBER,
-                    Message=sms_message,
-                    MessageAttributes={
-                        'AWS.SNS.SMS.SenderID': {
-                            'DataType': 'String',
-                            'StringValue': 'SecCam'
-                        },
-                        'AWS.SNS.SMS.SMSType': {
-                            'DataType': 'String',
-                            'StringValue': 'Transactional'
-                        }
+            # Send the SMS
+            sns_response = sns.publish(
+                PhoneNumber=PHONE_NUMBER,
+                Message=sms_message,
+                MessageAttributes={
+                    'AWS.SNS.SMS.SenderID': {
+                        'DataType': 'String',
+                        'StringValue': 'SecCam'
+                    },
+                    'AWS.SNS.SMS.SMSType': {
+                        'DataType': 'String',
+                        'StringValue': 'Transactional'
                     }
-                )
-                logger.info(f"SMS notification sent. MessageId: {sns_response['MessageId']}")
-                
-                # Add SMS info to result
-                result['sms_notification'] = {
-                    'status': 'sent',
-                    'phone': PHONE_NUMBER,
-                    'messageId': sns_response['MessageId']
-                }
-            except Exception as sms_error:
-                logger.error(f"Error sending SMS notification: {str(sms_error)}")
-                result['sms_notification'] = {
-                    'status': 'failed',
-                    'error': str(sms_error)
                 }
+            )
+            logger.info(f"SMS notification sent. MessageId: {sns_response['MessageId']}")
             
-            logger.info(f"Processing complete. Result: {json.dumps(result)}")
-            
-            return {
-                'statusCode': 200,
-                'body': json.dumps(result)
+            # Add SMS info to result
+            result['sms_notification'] = {
+                'status': 'sent',
+                'phone': PHONE_NUMBER,
+                'messageId': sns_response['MessageId']
             }
-        else:
-            logger.info(f"No important labels detected in {key}")
-            
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'message': 'No important objects detected',
-                    'frame': key
-                })
+        except Exception as sms_error:
+            logger.error(f"Error sending SMS notification: {str(sms_error)}")
+            result['sms_notification'] = {
+                'status': 'failed',
+                'error': str(sms_error)
             }
+        
+        logger.info(f"Processing complete. Result: {json.dumps(result)}")
+        return result
             
     except Exception as e:
-        logger.error(f"Error processing frame: {str(e)}")
+        logger.error(f"Error processing manifest: {str(e)}")
         raise e
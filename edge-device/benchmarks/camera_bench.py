@@ -0,0 +1,147 @@
+"""
+Off-device benchmarks for the camera, stream and record paths.
+
+Runs against the mock camera backend, so no Raspberry Pi hardware is needed:
+
+    cd edge-device
+    python benchmarks/camera_bench.py stream --viewers 5 --seconds 10
+    python benchmarks/camera_bench.py encode --seconds 10 --bitrate 4000000
+    python benchmarks/camera_bench.py event
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from camera import CameraManager, VideoRecorder
+from camera.backend import MOCK_BACKEND
+from utils import extract_frames_from_video
+
+def start_camera(args):
+    """Create and initialize a camera manager on the mock backend."""
+    camera_manager = CameraManager(backend=MOCK_BACKEND, source=args.source)
+    if not camera_manager.initialize():
+        sys.exit("Failed to initialize mock camera")
+    return camera_manager
+
+def read_stream(url, seconds, counts, index):
+    """Read an MJPEG stream for a number of seconds, counting frames."""
+    deadline = time.monotonic() + seconds
+    with urllib.request.urlopen(url) as response:
+        while time.monotonic() < deadline:
+            line = response.readline()
+            if not line:
+                break
+            if line.startswith(b"--frame"):
+                counts[index] += 1
+
+def bench_stream(args):
+    """Measure delivered frame rate and server CPU time for N viewers."""
+    from streaming import LiveStreamServer
+
+    camera_manager = start_camera(args)
+    server = LiveStreamServer(port=args.port)
+    server.set_camera(camera_manager.get_camera())
+    server.start_server()
+    time.sleep(1)
+
+    counts = [0] * args.viewers
+    url = f"http://127.0.0.1:{args.port}/video_feed"
+    threads = [
+        threading.Thread(target=read_stream, args=(url, args.seconds, counts, i), daemon=True)
+        for i in range(args.viewers)
+    ]
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.monotonic() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    print(f"viewers={args.viewers} seconds={wall:.1f}")
+    for i, count in enumerate(counts):
+        print(f"  viewer {i}: {count / wall:.1f} fps")
+    print(f"process CPU: {cpu / wall * 100:.0f}% of one core")
+    camera_manager.shutdown()
+
+def bench_encode(args):
+    """Measure H.264 encode cost for one recording."""
+    camera_manager = start_camera(args)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_filename = os.path.join(tmp_dir, "bench.mp4")
+        settings = {"bitrate": args.bitrate, "size": (args.width, args.height), "iperiod": args.iperiod}
+        cpu_start = time.process_time()
+        wall_start = time.monotonic()
+        VideoRecorder.record_video(camera_manager.get_camera(), video_filename, args.seconds, settings)
+        wall = time.monotonic() - wall_start
+        cpu = time.process_time() - cpu_start
+        size = os.path.getsize(video_filename) if os.path.exists(video_filename) else 0
+
+    print(f"recorded {args.seconds}s at {args.width}x{args.height}, bitrate={args.bitrate}")
+    print(f"wall={wall:.2f}s cpu={cpu:.2f}s ({cpu / wall * 100:.0f}% of one core)")
+    print(f"file size={size / 1024:.0f} KB ({size * 8 / max(args.seconds, 1) / 1000:.0f} kbit/s)")
+    camera_manager.shutdown()
+
+def bench_event(args):
+    """Measure local latency from a motion trigger to frames and clip on disk."""
+    camera_manager = start_camera(args)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        frames_dir = os.path.join(tmp_dir, "frames")
+        video_filename = os.path.join(tmp_dir, "event.mp4")
+
+        trigger = time.monotonic()
+        futures = camera_manager.capture_burst(frames_dir, "bench", num_frames=args.frames, interval=0.1)
+        futures[0].result()
+        first_frame = time.monotonic() - trigger
+        for future in futures:
+            future.result()
+        all_frames = time.monotonic() - trigger
+
+        VideoRecorder.record_video(camera_manager.get_camera(), video_filename, args.seconds)
+        clip_ready = time.monotonic() - trigger
+        extract_frames_from_video(video_filename, frames_dir, "extracted", num_frames=args.frames)
+        extracted = time.monotonic() - trigger
+
+    print(f"first frame on disk: {first_frame * 1000:.0f} ms")
+    print(f"all {args.frames} burst frames on disk: {all_frames * 1000:.0f} ms")
+    print(f"{args.seconds}s clip on disk: {clip_ready * 1000:.0f} ms")
+    print(f"frames extracted from clip: {extracted * 1000:.0f} ms")
+    camera_manager.shutdown()
+
+def main():
+    """Parse arguments and run the selected benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", help="Video file for the mock camera (synthetic frames if omitted)")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    stream_parser = subparsers.add_parser("stream", help="MJPEG stream throughput")
+    stream_parser.add_argument("--viewers", type=int, default=1)
+    stream_parser.add_argument("--seconds", type=float, default=10)
+    stream_parser.add_argument("--port", type=int, default=8090)
+    stream_parser.set_defaults(func=bench_stream)
+
+    encode_parser = subparsers.add_parser("encode", help="H.264 recording cost")
+    encode_parser.add_argument("--seconds", type=int, default=10)
+    encode_parser.add_argument("--bitrate", type=int, default=10000000)
+    encode_parser.add_argument("--width", type=int, default=1280)
+    encode_parser.add_argument("--height", type=int, default=720)
+    encode_parser.add_argument("--iperiod", type=int, default=15)
+    encode_parser.set_defaults(func=bench_encode)
+
+    event_parser = subparsers.add_parser("event", help="Motion event latency up to local artifacts")
+    event_parser.add_argument("--seconds", type=int, default=5)
+    event_parser.add_argument("--frames", type=int, default=3)
+    event_parser.set_defaults(func=bench_event)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
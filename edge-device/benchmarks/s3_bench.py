@@ -0,0 +1,326 @@
+"""
+Off-device S3 upload benchmarks against the local S3 stand-in.
+
+Runs S3Client and the upload queue against benchmarks/s3_standin.py with
+injected latency, bandwidth and errors, so no AWS account is needed:
+
+    cd edge-device
+    python benchmarks/s3_bench.py clip --clip-mib 32 --bandwidth-kib 2048
+    python benchmarks/s3_bench.py frames --frames 200 --error-rate 0.02
+    python benchmarks/s3_bench.py events --events 4
+    python benchmarks/s3_bench.py outage --outage 10
+    python benchmarks/s3_bench.py all --json results.json --baseline previous.json
+
+Reports throughput and p50/p95/p99 latencies per workload. --json saves
+them with the commit they were measured on; --baseline prints the change
+against an earlier --json run with the same options.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from s3_standin import S3StandIn
+from cloud.multipart_journal import MultipartJournal
+from cloud.s3_client import PARTS_RESUMED, S3Client
+from cloud.upload_queue import UploadQueue
+from utils import logger
+
+MIB = 1024 * 1024
+BUCKET = "bench-bucket"
+SERVER_STATS = ("requests", "connections", "bytes_received", "injected_errors", "dropped_requests")
+
+def percentile(values, fraction):
+    """Nearest-rank percentile, None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def percentiles(values, prefix):
+    """p50, p95, p99 and maximum of a list of seconds."""
+    return {
+        f"{prefix}_{name}_s": percentile(values, fraction)
+        for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))
+    }
+
+def summarize(latencies, num_bytes, wall, failed):
+    """Throughput and upload latency percentiles of one workload."""
+    result = {
+        "uploads": len(latencies),
+        "failed": failed,
+        "bytes": num_bytes,
+        "seconds": wall,
+        "throughput_kib_s": num_bytes / 1024 / max(wall, 1e-6)
+    }
+    result.update(percentiles(latencies, "latency"))
+    return result
+
+def make_file(path, size):
+    """Write a file of random (incompressible, unique) bytes."""
+    with open(path, "wb") as f:
+        f.write(os.urandom(size))
+    return path
+
+def start_standin(args):
+    """Start a stand-in with the network conditions from the arguments."""
+    return S3StandIn(
+        latency=args.latency, jitter=args.jitter, handshake=args.handshake,
+        bandwidth=args.bandwidth_kib * 1024 or None, error_rate=args.error_rate, seed=args.seed
+    ).start()
+
+def make_client(args, standin, journal_path=None):
+    """Create an S3Client for the stand-in and collect its per-upload latencies.
+
+    Returns:
+        tuple: (S3Client, list the upload seconds are appended to)
+    """
+    client = S3Client(
+        BUCKET,
+        upload_workers=args.workers,
+        multipart_threshold=args.part_mib * MIB,
+        multipart_chunksize=args.part_mib * MIB,
+        max_concurrency=args.concurrency,
+        multipart_journal=MultipartJournal(journal_path) if journal_path else None,
+        endpoint_url=standin.url
+    )
+    latencies = []
+    client.add_upload_observer(lambda local_file, num_bytes, seconds: latencies.append(seconds))
+    return client, latencies
+
+def bench_clip(args, standin, tmp_dir):
+    """Upload one large clip, repeated, one upload at a time."""
+    client, latencies = make_client(args, standin)
+    clip = make_file(os.path.join(tmp_dir, "clip.mp4"), int(args.clip_mib * MIB))
+    wall_start = time.monotonic()
+    urls = [client.upload_file(clip, f"bench/clip_{i}.mp4", check_existing=False) for i in range(args.repeat)]
+    wall = time.monotonic() - wall_start
+    client.shutdown()
+    uploaded = sum(1 for url in urls if url)
+    return summarize(latencies, uploaded * os.path.getsize(clip), wall, len(urls) - uploaded)
+
+def bench_frames(args, standin, tmp_dir):
+    """Upload many small frames concurrently on the upload pool."""
+    client, latencies = make_client(args, standin)
+    frames = [
+        make_file(os.path.join(tmp_dir, f"frame_{i}.jpg"), int(args.frame_kib * 1024)) for i in range(args.frames)
+    ]
+    wall_start = time.monotonic()
+    urls = client.upload_batch([(frame, f"bench/frames/frame_{i}.jpg") for i, frame in enumerate(frames)])
+    wall = time.monotonic() - wall_start
+    client.shutdown()
+    uploaded = sum(1 for url in urls if url)
+    return summarize(latencies, uploaded * int(args.frame_kib * 1024), wall, len(urls) - uploaded)
+
+def run_events(args, standin, tmp_dir, outage=False):
+    """Enqueue events (frames and a clip each) on an upload queue and time them.
+
+    Returns:
+        tuple: (result dict, monotonic time the outage ended or None,
+            monotonic time the last event finished or None)
+    """
+    db_path = os.path.join(tmp_dir, "bench.db")
+    client, latencies = make_client(args, standin, db_path)
+    queue = UploadQueue(
+        db_path, client, max_in_flight=args.workers, base_delay=args.retry_base, max_delay=args.retry_max
+    )
+    clip = make_file(os.path.join(tmp_dir, "event.mp4"), int(args.clip_mib * MIB))
+    frames = [
+        make_file(os.path.join(tmp_dir, f"event_frame_{i}.jpg"), int(args.frame_kib * 1024))
+        for i in range(args.event_frames)
+    ]
+    event_bytes = os.path.getsize(clip) + sum(os.path.getsize(frame) for frame in frames)
+
+    enqueued = {}
+    completed = {}
+    all_done = threading.Event()
+
+    def on_event(event_id, metadata, uploads):
+        completed[event_id] = (time.monotonic(), sum(1 for upload in uploads if upload["url"] is None))
+        if len(completed) == args.events:
+            all_done.set()
+
+    queue.add_event_listener(on_event)
+    queue.start()
+    resumed_start = PARTS_RESUMED.value
+    outage_end = []
+
+    def run_outage():
+        time.sleep(args.outage_at)
+        standin.set_down(True)
+        time.sleep(args.outage)
+        standin.set_down(False)
+        outage_end.append(time.monotonic())
+
+    wall_start = time.monotonic()
+    if outage:
+        threading.Thread(target=run_outage, daemon=True).start()
+    for i in range(args.events):
+        event_id = f"bench_{i}"
+        uploads = [("frame", frame, f"bench/{event_id}/frame_{j}.jpg") for j, frame in enumerate(frames)]
+        uploads.append(("video", clip, f"bench/{event_id}/clip.mp4"))
+        enqueued[event_id] = time.monotonic()
+        queue.enqueue_event(event_id, uploads)
+        if args.interval:
+            time.sleep(args.interval)
+    if not all_done.wait(args.timeout):
+        print(f"  timed out after {args.timeout}s with {len(completed)}/{args.events} events finished")
+    wall = time.monotonic() - wall_start
+    queue.stop()
+    client.shutdown()
+
+    failed = sum(failures for _, failures in completed.values())
+    num_bytes = len(completed) * event_bytes
+    result = summarize(latencies, num_bytes, wall, failed)
+    result["events"] = len(completed)
+    result.update(percentiles(
+        [done_at - enqueued[event_id] for event_id, (done_at, _) in completed.items()], "event"
+    ))
+    result["parts_resumed"] = PARTS_RESUMED.value - resumed_start
+    last_done = max((done_at for done_at, _ in completed.values()), default=None)
+    return result, outage_end[0] if outage_end else None, last_done
+
+def bench_events(args, standin, tmp_dir):
+    """Concurrent events through the upload queue, as on the device."""
+    return run_events(args, standin, tmp_dir)[0]
+
+def bench_outage(args, standin, tmp_dir):
+    """Events through the upload queue with the link down for a while."""
+    result, outage_end, last_done = run_events(args, standin, tmp_dir, outage=True)
+    result["dropped_requests"] = standin.snapshot().get("dropped_requests", 0)
+    if not result["dropped_requests"]:
+        print("  warning: the outage dropped no requests, so nothing was measured; "
+              "move --outage-at to while uploads are running")
+    # Time from the link coming back until the queue had caught up
+    result["recovery_s"] = None
+    if outage_end is not None and last_done is not None:
+        result["recovery_s"] = max(0.0, last_done - outage_end)
+    return result
+
+WORKLOADS = {
+    "clip": bench_clip,
+    "frames": bench_frames,
+    "events": bench_events,
+    "outage": bench_outage
+}
+
+def git_revision():
+    """Commit of the tree being measured, with -dirty for local changes."""
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def format_value(value):
+    """Format a metric for the report."""
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+def print_result(name, result, baseline=None):
+    """Print one workload's metrics, with the change against a baseline run."""
+    print(f"{name}:")
+    for metric, value in result.items():
+        if metric == "server":
+            continue
+        line = f"  {metric}: {format_value(value)}"
+        previous = (baseline or {}).get(metric)
+        if isinstance(value, (int, float)) and isinstance(previous, (int, float)) and previous:
+            line += f" ({(value - previous) / previous * 100:+.1f}% vs {format_value(previous)})"
+        print(line)
+    print("  server: " + ", ".join(f"{stat}={result['server'].get(stat, 0)}" for stat in SERVER_STATS))
+
+def main():
+    """Parse arguments, run the selected workloads and report."""
+    common = argparse.ArgumentParser(add_help=False)
+    network = common.add_argument_group("stand-in network conditions")
+    network.add_argument("--latency", type=float, default=0.03, help="Seconds added to every response")
+    network.add_argument("--jitter", type=float, default=0.01, help="Mean extra delay per response in seconds")
+    network.add_argument("--handshake", type=float, default=0.05, help="Seconds per new connection")
+    network.add_argument("--bandwidth-kib", type=float, default=2048, help="Shared upload KiB/s, 0 for unlimited")
+    network.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failed with a 500")
+    network.add_argument("--seed", type=int, default=1)
+    workload = common.add_argument_group("workloads")
+    workload.add_argument("--clip-mib", type=float, default=16, help="Clip size")
+    workload.add_argument("--repeat", type=int, default=3, help="Clip uploads in the clip workload")
+    workload.add_argument("--frames", type=int, default=100, help="Frames in the frames workload")
+    workload.add_argument("--frame-kib", type=float, default=150, help="Frame size")
+    workload.add_argument("--events", type=int, default=4, help="Events in the events and outage workloads")
+    workload.add_argument("--event-frames", type=int, default=3, help="Frames per event")
+    workload.add_argument("--interval", type=float, default=0.0, help="Seconds between enqueued events")
+    workload.add_argument("--outage-at", type=float, default=2.0, help="Seconds into the outage workload the link drops")
+    workload.add_argument("--outage", type=float, default=10.0, help="Seconds the link stays down")
+    workload.add_argument("--timeout", type=float, default=600.0, help="Seconds to wait for queued events")
+    client = common.add_argument_group("client")
+    client.add_argument("--workers", type=int, default=3, help="Concurrent uploads (S3_UPLOAD_WORKERS)")
+    client.add_argument("--part-mib", type=int, default=8, help="Multipart threshold and part size")
+    client.add_argument("--concurrency", type=int, default=2, help="Parts of one file in flight")
+    client.add_argument("--retry-base", type=float, default=0.5, help="Upload queue retry delay")
+    client.add_argument("--retry-max", type=float, default=5.0, help="Upload queue maximum retry delay")
+    output = common.add_argument_group("output")
+    output.add_argument("--json", help="Save the results to this file")
+    output.add_argument("--baseline", help="Compare with results saved by an earlier --json run")
+    output.add_argument("--verbose", action="store_true", help="Show the client's log output")
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    subparsers.add_parser("clip", parents=[common], help="Single large clip, repeated")
+    subparsers.add_parser("frames", parents=[common], help="Many small frames uploaded concurrently")
+    subparsers.add_parser("events", parents=[common], help="Concurrent events through the upload queue")
+    subparsers.add_parser("outage", parents=[common], help="Events through an outage and the recovery")
+    subparsers.add_parser("all", parents=[common], help="All workloads in turn")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.DEBUG if args.verbose else logging.CRITICAL)
+    # The stand-in accepts any credentials
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "standin")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "standin")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    options = {
+        name: value for name, value in vars(args).items()
+        if name not in ("benchmark", "json", "baseline", "verbose")
+    }
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        changed = sorted(name for name, value in baseline.get("options", {}).items() if options.get(name) != value)
+        if changed:
+            print(f"warning: options differ from the baseline ({baseline.get('commit')}): {', '.join(changed)}")
+
+    names = list(WORKLOADS) if args.benchmark == "all" else [args.benchmark]
+    results = {}
+    for name in names:
+        standin = start_standin(args)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            result = WORKLOADS[name](args, standin, tmp_dir)
+        standin.stop()
+        result["server"] = standin.snapshot()
+        results[name] = result
+        print_result(name, result, baseline.get("results", {}).get(name))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "commit": git_revision(),
+                "measured_at": datetime.now().isoformat(),
+                "options": options,
+                "results": results
+            }, f, indent=2)
+        print(f"results saved to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+"""
+Local S3-compatible stand-in for off-device upload benchmarks.
+
+Serves the subset of the S3 REST API that S3Client uses (put, head, copy
+and get object, head bucket, multipart uploads) from memory, path-style,
+over plain HTTP on localhost. Latency, connection setup cost, a shared
+uplink bandwidth, random server errors and outages can be injected:
+
+    cd edge-device
+    python benchmarks/s3_standin.py --port 9000 --latency 0.05 --bandwidth-kib 1024 --error-rate 0.01
+
+and point the device at it with S3_ENDPOINT_URL = "http://<host>:9000".
+Any credentials are accepted; signatures are not checked.
+"""
+import argparse
+import hashlib
+import random
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ElementTree
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+READ_CHUNK_SIZE = 64 * 1024
+XML_HEADER = b'<?xml version="1.0" encoding="UTF-8"?>\n'
+XML_NAMESPACE = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+class StandInServer(ThreadingHTTPServer):
+    """HTTP server with room for bursts of new connections."""
+
+    daemon_threads = True
+    request_queue_size = 64
+
+class S3StandIn:
+    """In-memory S3 stand-in with injected network conditions."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, handshake=0.0,
+                 bandwidth=None, error_rate=0.0, seed=None):
+        """Initialize the stand-in and bind its port.
+
+        Args:
+            host: Interface to listen on
+            port: Port to listen on, 0 for any free port
+            latency: Seconds added to every response
+            jitter: Mean of an exponentially distributed extra delay per response
+            handshake: Seconds added when a connection is opened, like a TLS handshake
+            bandwidth: Request body bytes per second over all connections, None for unlimited
+            error_rate: Fraction of requests answered with a 500 InternalError
+            seed: Seed for the injected jitter and errors
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.handshake = handshake
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.down = False
+
+        self.objects = {}
+        self.uploads = {}
+        self.stats = Counter()
+        self.state_lock = threading.Lock()
+        self.link_lock = threading.Lock()
+        self.link_free_at = 0.0
+
+        self.server = StandInServer((host, port), S3StandInHandler)
+        self.server.standin = self
+        self.server_thread = None
+
+    @property
+    def url(self):
+        """Endpoint URL for S3Client(endpoint_url=...)."""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Start serving in a background thread.
+
+        Returns:
+            S3StandIn: self, for chaining
+        """
+        self.server_thread = threading.Thread(target=self.server.serve_forever, name="s3-standin", daemon=True)
+        self.server_thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def set_down(self, down):
+        """Start or end an outage.
+
+        While down, connections are dropped without a response, including
+        those in the middle of sending a request body.
+        """
+        self.down = down
+
+    def count(self, name, amount=1):
+        """Add to a statistics counter."""
+        with self.state_lock:
+            self.stats[name] += amount
+
+    def snapshot(self):
+        """Get a copy of the statistics.
+
+        Returns:
+            dict: Counters such as requests, per-operation counts, bytes_received,
+                connections, injected_errors and dropped_requests
+        """
+        with self.state_lock:
+            return dict(self.stats)
+
+    def throttle(self, num_bytes):
+        """Hold a reader until the shared link has carried num_bytes more."""
+        if not self.bandwidth:
+            return
+        with self.link_lock:
+            now = time.monotonic()
+            self.link_free_at = max(now, self.link_free_at) + num_bytes / self.bandwidth
+            wait = self.link_free_at - now
+        time.sleep(wait)
+
+    def response_delay(self):
+        """Get the injected delay for one response in seconds."""
+        with self.state_lock:
+            extra = self.random.expovariate(1.0 / self.jitter) if self.jitter else 0.0
+        return self.latency + extra
+
+    def inject_error(self):
+        """Decide whether to fail the current request."""
+        if not self.error_rate:
+            return False
+        with self.state_lock:
+            return self.random.random() < self.error_rate
+
+class S3StandInHandler(BaseHTTPRequestHandler):
+    """Request handler for S3StandIn; the instance is server.standin."""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "S3StandIn"
+
+    def setup(self):
+        """Account for connection setup."""
+        standin = self.server.standin
+        standin.count("connections")
+        if standin.handshake:
+            time.sleep(standin.handshake)
+        super().setup()
+
+    def log_message(self, format, *args):
+        """Keep benchmark output clean."""
+
+    def do_HEAD(self):
+        self._dispatch("HEAD")
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method):
+        """Read the request, apply the injected conditions and route it."""
+        standin = self.server.standin
+        if standin.down:
+            self._drop()
+            return
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query, keep_blank_values=True)
+        bucket, _, key = url.path.lstrip("/").partition("/")
+        key = unquote(key)
+        body = self._read_body()
+        if body is None:
+            self._drop()
+            return
+        standin.count("requests")
+        standin.count("bytes_received", len(body))
+
+        delay = standin.response_delay()
+        if delay:
+            time.sleep(delay)
+        if standin.down:
+            self._drop()
+            return
+        if standin.inject_error():
+            standin.count("injected_errors")
+            self._send_error(500, "InternalError", "Injected error")
+            return
+
+        if method == "HEAD" and not key:
+            operation = self._head_bucket
+        elif method == "HEAD":
+            operation = self._head_object
+        elif method == "GET" and key:
+            operation = self._get_object
+        elif method == "PUT" and "partNumber" in query:
+            operation = self._upload_part
+        elif method == "PUT" and self.headers.get("x-amz-copy-source"):
+            operation = self._copy_object
+        elif method == "PUT" and key:
+            operation = self._put_object
+        elif method == "POST" and "uploads" in query:
+            operation = self._create_multipart_upload
+        elif method == "POST" and "uploadId" in query:
+            operation = self._complete_multipart_upload
+        elif method == "DELETE" and "uploadId" in query:
+            operation = self._abort_multipart_upload
+        elif method == "DELETE" and key:
+            operation = self._delete_object
+        else:
+            self._send_error(501, "NotImplemented", f"{method} {url.path} is not supported by the stand-in")
+            return
+        standin.count(operation.__name__.lstrip("_"))
+        operation(bucket, key, {name: values[0] for name, values in query.items()}, body)
+
+    def _drop(self):
+        """The link is down: the client sees the connection drop."""
+        self.server.standin.count("dropped_requests")
+        self.close_connection = True
+
+    def _read_body(self):
+        """Read the request body at the stand-in's bandwidth.
+
+        Handles Content-Length and chunked bodies, and decodes aws-chunked
+        content encoding.
+
+        Returns:
+            bytes or None: The body, None if the link went down while reading it
+        """
+        standin = self.server.standin
+        data = bytearray()
+        if "chunked" in self.headers.get("Transfer-Encoding", ""):
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    # Trailers up to the empty line
+                    while self.rfile.readline().strip():
+                        pass
+                    break
+                chunk = self.rfile.read(size)
+                self.rfile.readline()
+                standin.throttle(len(chunk))
+                if standin.down:
+                    return None
+                data += chunk
+        else:
+            remaining = int(self.headers.get("Content-Length") or 0)
+            while remaining > 0:
+                chunk = self.rfile.read(min(READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                standin.throttle(len(chunk))
+                if standin.down:
+                    return None
+                data += chunk
+                remaining -= len(chunk)
+        if "aws-chunked" in self.headers.get("Content-Encoding", ""):
+            data = self._decode_aws_chunked(bytes(data))
+        return bytes(data)
+
+    def _decode_aws_chunked(self, data):
+        """Strip aws-chunked framing (size;signature lines and trailers)."""
+        decoded = bytearray()
+        position = 0
+        while position < len(data):
+            line_end = data.index(b"\r\n", position)
+            size = int(data[position:line_end].split(b";")[0], 16)
+            position = line_end + 2
+            if size == 0:
+                break
+            decoded += data[position:position + size]
+            position += size + 2
+        return bytes(decoded)
+
+    def _metadata(self):
+        """Get the x-amz-meta-* headers of the request."""
+        return {
+            name[len("x-amz-meta-"):].lower(): value
+            for name, value in self.headers.items() if name.lower().startswith("x-amz-meta-")
+        }
+
+    def _send(self, status, body=b"", headers=None):
+        """Send a response; every response has a length, so connections are kept alive."""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_xml(self, root_tag, fields):
+        """Send a 200 response with a flat S3 XML document."""
+        root = ElementTree.Element(root_tag, xmlns=XML_NAMESPACE)
+        for name, value in fields.items():
+            ElementTree.SubElement(root, name).text = str(value)
+        self._send(200, XML_HEADER + ElementTree.tostring(root), {"Content-Type": "application/xml"})
+
+    def _send_error(self, status, code, message):
+        """Send an S3 error document."""
+        root = ElementTree.Element("Error")
+        ElementTree.SubElement(root, "Code").text = code
+        ElementTree.SubElement(root, "Message").text = message
+        ElementTree.SubElement(root, "RequestId").text = uuid.uuid4().hex
+        self._send(status, XML_HEADER + ElementTree.tostring(root), {"Content-Type": "application/xml"})
+
+    def _object_headers(self, stored):
+        """Headers describing a stored object."""
+        headers = {
+            "ETag": stored["etag"],
+            "Content-Type": stored["content_type"],
+            "Last-Modified": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(stored["modified"]))
+        }
+        headers.update({f"x-amz-meta-{name}": value for name, value in stored["metadata"].items()})
+        return headers
+
+    def _store(self, bucket, key, data, metadata, etag=None, content_type=None):
+        """Store an object and return its ETag."""
+        etag = etag or f'"{hashlib.md5(data).hexdigest()}"'
+        with self.server.standin.state_lock:
+            self.server.standin.objects[(bucket, key)] = {
+                "data": data, "metadata": metadata, "etag": etag, "modified": time.time(),
+                "content_type": content_type or "binary/octet-stream"
+            }
+        return etag
+
+    def _lookup(self, bucket, key):
+        """Get a stored object, or None."""
+        with self.server.standin.state_lock:
+            return self.server.standin.objects.get((bucket, key))
+
+    def _head_bucket(self, bucket, key, query, body):
+        self._send(200)
+
+    def _head_object(self, bucket, key, query, body):
+        stored = self._lookup(bucket, key)
+        if stored is None:
+            self._send(404)
+            return
+        self.send_response(200)
+        for name, value in self._object_headers(stored).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(stored["data"])))
+        self.end_headers()
+
+    def _get_object(self, bucket, key, query, body):
+        stored = self._lookup(bucket, key)
+        if stored is None:
+            self._send_error(404, "NoSuchKey", "The specified key does not exist.")
+            return
+        self._send(200, stored["data"], self._object_headers(stored))
+
+    def _put_object(self, bucket, key, query, body):
+        etag = self._store(bucket, key, body, self._metadata(), content_type=self.headers.get("Content-Type"))
+        self._send(200, headers={"ETag": etag})
+
+    def _copy_object(self, bucket, key, query, body):
+        source_bucket, _, source_key = unquote(self.headers["x-amz-copy-source"]).lstrip("/").partition("/")
+        source = self._lookup(source_bucket, source_key)
+        if source is None:
+            self._send_error(404, "NoSuchKey", "The specified key does not exist.")
+            return
+        metadata = source["metadata"]
+        content_type = source["content_type"]
+        if self.headers.get("x-amz-metadata-directive", "COPY").upper() == "REPLACE":
+            # As in S3, everything not sent with the copy is reset
+            metadata = self._metadata()
+            content_type = self.headers.get("Content-Type")
+        etag = self._store(bucket, key, source["data"], metadata, source["etag"], content_type)
+        self._send_xml("CopyObjectResult", {
+            "LastModified": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()), "ETag": etag
+        })
+
+    def _delete_object(self, bucket, key, query, body):
+        with self.server.standin.state_lock:
+            self.server.standin.objects.pop((bucket, key), None)
+        self._send(204)
+
+    def _create_multipart_upload(self, bucket, key, query, body):
+        upload_id = uuid.uuid4().hex
+        with self.server.standin.state_lock:
+            self.server.standin.uploads[upload_id] = {
+                "bucket": bucket, "key": key, "metadata": self._metadata(), "parts": {},
+                "content_type": self.headers.get("Content-Type")
+            }
+        self._send_xml("InitiateMultipartUploadResult", {"Bucket": bucket, "Key": key, "UploadId": upload_id})
+
+    def _upload_part(self, bucket, key, query, body):
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        with self.server.standin.state_lock:
+            upload = self.server.standin.uploads.get(query.get("uploadId"))
+            if upload is not None:
+                upload["parts"][int(query["partNumber"])] = (etag, body)
+        if upload is None:
+            self._send_error(404, "NoSuchUpload", "The specified upload does not exist.")
+            return
+        self._send(200, headers={"ETag": etag})
+
+    def _complete_multipart_upload(self, bucket, key, query, body):
+        part_numbers = [
+            int(element.text) for element in ElementTree.fromstring(body).iter()
+            if element.tag.endswith("PartNumber")
+        ]
+        with self.server.standin.state_lock:
+            upload = self.server.standin.uploads.get(query.get("uploadId"))
+            if upload is not None and all(number in upload["parts"] for number in part_numbers):
+                del self.server.standin.uploads[query["uploadId"]]
+        if upload is None:
+            self._send_error(404, "NoSuchUpload", "The specified upload does not exist.")
+            return
+        if not all(number in upload["parts"] for number in part_numbers):
+            self._send_error(400, "InvalidPart", "One or more of the specified parts could not be found.")
+            return
+        parts = [upload["parts"][number] for number in part_numbers]
+        digest = hashlib.md5(b"".join(bytes.fromhex(etag.strip('"')) for etag, _ in parts)).hexdigest()
+        etag = self._store(
+            bucket, key, b"".join(data for _, data in parts), upload["metadata"], f'"{digest}-{len(parts)}"',
+            upload["content_type"]
+        )
+        self._send_xml("CompleteMultipartUploadResult", {
+            "Location": f"{self.server.standin.url}/{bucket}/{key}", "Bucket": bucket, "Key": key, "ETag": etag
+        })
+
+    def _abort_multipart_upload(self, bucket, key, query, body):
+        with self.server.standin.state_lock:
+            upload = self.server.standin.uploads.pop(query.get("uploadId"), None)
+        if upload is None:
+            self._send_error(404, "NoSuchUpload", "The specified upload does not exist.")
+            return
+        self._send(204)
+
+def main():
+    """Run the stand-in until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Mean extra delay per response in seconds")
+    parser.add_argument("--handshake", type=float, default=0.0, help="Seconds added per new connection")
+    parser.add_argument("--bandwidth-kib", type=float, default=0, help="Shared upload KiB/s, 0 for unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failed with a 500")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    standin = S3StandIn(
+        host=args.host, port=args.port, latency=args.latency, jitter=args.jitter, handshake=args.handshake,
+        bandwidth=args.bandwidth_kib * 1024 or None, error_rate=args.error_rate, seed=args.seed
+    ).start()
+    print(f"S3 stand-in listening on {standin.url}")
+    try:
+        while True:
+            time.sleep(10)
+            print(standin.snapshot())
+    except KeyboardInterrupt:
+        standin.stop()
+
+if __name__ == "__main__":
+    main()
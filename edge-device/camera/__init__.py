@@ -4,5 +4,6 @@ Camera module initialization
 
 from camera.camera_manager import CameraManager
 from camera.video_recorder import VideoRecorder
+from camera.encoder_controller import EncoderController
 
-__all__ = ['CameraManager', 'VideoRecorder']
+__all__ = ['CameraManager', 'VideoRecorder', 'EncoderController']
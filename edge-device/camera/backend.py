@@ -0,0 +1,59 @@
+"""
+Camera backend selection for the IoT security camera system.
+
+The "picamera2" backend drives the Raspberry Pi camera; the "mock" backend
+provides synthetic or video-file frames so the camera, stream and record
+paths can run on any Linux machine.
+"""
+from camera.mock_camera import MockCamera, MockH264Encoder, MockFileOutput
+
+PICAMERA2_BACKEND = "picamera2"
+MOCK_BACKEND = "mock"
+
+def create_camera(backend=PICAMERA2_BACKEND, source=None, framerate=30):
+    """Create a camera instance for the selected backend.
+
+    Args:
+        backend: "picamera2" or "mock"
+        source: Video file looped by the mock backend (synthetic frames if None)
+        framerate: Frame rate of the mock backend
+
+    Returns:
+        Picamera2 or MockCamera: New camera instance
+    """
+    if backend == PICAMERA2_BACKEND:
+        from picamera2 import Picamera2
+        return Picamera2()
+    if backend == MOCK_BACKEND:
+        return MockCamera(source=source, framerate=framerate)
+    raise ValueError(f"Unknown camera backend: {backend}")
+
+def create_h264_encoder(camera, **kwargs):
+    """Create an H.264 encoder matching the camera's backend.
+
+    Args:
+        camera: Camera instance from create_camera
+        **kwargs: H264Encoder parameters (bitrate, repeat, iperiod)
+
+    Returns:
+        H264Encoder or MockH264Encoder: New encoder
+    """
+    if isinstance(camera, MockCamera):
+        return MockH264Encoder(**kwargs)
+    from picamera2.encoders import H264Encoder
+    return H264Encoder(**kwargs)
+
+def create_file_output(camera, output_filename):
+    """Create an MP4 file output matching the camera's backend.
+
+    Args:
+        camera: Camera instance from create_camera
+        output_filename: MP4 file to write
+
+    Returns:
+        FfmpegOutput or MockFileOutput: New output
+    """
+    if isinstance(camera, MockCamera):
+        return MockFileOutput(output_filename, framerate=camera.framerate)
+    from picamera2.outputs import FfmpegOutput
+    return FfmpegOutput(output_filename)
@@ -1,26 +1,53 @@
 """
 Camera manager for the IoT security camera system.
 """
+import os
+import queue
 import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 import cv2
-from picamera2 import Picamera2
+import numpy as np
+from camera.backend import create_camera, PICAMERA2_BACKEND
+from utils.checksums import write_file
 from utils.logger import logger
 
 class CameraManager:
     """Manages the Raspberry Pi camera initialization and capture."""
     
-    def __init__(self):
-        """Initialize camera manager."""
+    def __init__(self, overlay=None, burst_interval=0.5, jpeg_quality=90, encode_workers=2,
+                 backend=PICAMERA2_BACKEND, source=None):
+        """Initialize camera manager.
+        
+        Args:
+            overlay: Optional TimestampOverlay drawn onto captured frames
+            burst_interval: Default delay between burst frames in seconds
+            jpeg_quality: Default JPEG quality (0-100) for captured frames
+            encode_workers: Number of threads encoding and writing JPEGs
+            backend: Camera backend, "picamera2" or "mock"
+            source: Video file looped by the mock backend (synthetic frames if None)
+        """
         self.camera = None
+        self.backend = backend
+        self.source = source
+        self.overlay = overlay
+        self.burst_interval = burst_interval
+        self.jpeg_quality = jpeg_quality
+        
+        # Bursts are grabbed on one thread and encoded on a small pool so the
+        # detection thread is never blocked on the camera or the SD card
+        self.capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="burst-capture")
+        self.encode_executor = ThreadPoolExecutor(max_workers=encode_workers, thread_name_prefix="burst-encode")
+        self.buffer_pool = queue.SimpleQueue()
         
     def initialize(self):
-        """Initialize and configure the Pi camera.
+        """Initialize and configure the camera.
         
         Returns:
             bool: True if initialization was successful, False otherwise
         """
         try:
-            logger.info("Initializing Pi camera...")
+            logger.info(f"Initializing camera ({self.backend} backend)...")
             
             # First, make sure any existing camera instance is properly closed
             if self.camera is not None:
@@ -33,7 +60,7 @@ class CameraManager:
                     logger.warning(f"Error closing existing camera: {e}")
 
             # Create a new camera instance
-            self.camera = Picamera2()
+            self.camera = create_camera(self.backend, source=self.source)
             
             # Create configurations
             video_config = self.camera.create_video_configuration()
@@ -49,7 +76,7 @@ class CameraManager:
             # Allow camera to warm up
             time.sleep(2)
             
-            logger.info("Pi camera initialized successfully")
+            logger.info("Camera initialized successfully")
             return True
             
         except Exception as e:
@@ -81,51 +108,141 @@ class CameraManager:
         """Get the camera instance.
         
         Returns:
-            Picamera2 or None: Camera instance if initialized, None otherwise
+            Picamera2, MockCamera or None: Camera instance if initialized, None otherwise
         """
         return self.camera
                 
-    def capture_frames(self, frames_dir, timestamp, num_frames=3):
-        """Capture frames directly from the camera.
+    def _acquire_buffer(self, shape, dtype):
+        """Get a reusable frame buffer of the given shape from the pool."""
+        try:
+            while True:
+                buffer = self.buffer_pool.get_nowait()
+                if buffer.shape == shape and buffer.dtype == dtype:
+                    return buffer
+        except queue.Empty:
+            return np.empty(shape, dtype=dtype)
+    
+    def _encode_frame(self, buffer, frame_filename, jpeg_quality):
+        """Encode a buffered frame to JPEG, write it and return the buffer to the pool."""
+        try:
+            flag, encoded_image = cv2.imencode(".jpg", buffer, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+            if not flag:
+                raise IOError(f"Could not encode {frame_filename}")
+            # Hashed as it is written, so the upload need not read it again
+            write_file(frame_filename, encoded_image.tobytes())
+            logger.info(f"Saved burst frame to {frame_filename}")
+            return frame_filename
+        finally:
+            self.buffer_pool.put(buffer)
+    
+    def capture_burst(self, frames_dir, timestamp, num_frames=3, interval=None,
+                      jpeg_quality=None, callback=None):
+        """Capture a burst of frames without blocking the caller.
+        
+        Frames are grabbed into pooled buffers at the given interval and are
+        JPEG encoded and written on a thread pool.
         
         Args:
             frames_dir: Directory to save captured frames
             timestamp: Timestamp to use in frame filenames
             num_frames: Number of frames to capture
-            
+            interval: Delay between frames in seconds (default: burst_interval)
+            jpeg_quality: JPEG quality 0-100 (default: jpeg_quality)
+            callback: Optional function called with the list of written
+                filenames once every frame has finished
+                
         Returns:
-            list: List of captured frame filenames
+            list: One Future per frame, resolving to the written filename
         """
-        import os
+        interval = self.burst_interval if interval is None else interval
+        jpeg_quality = self.jpeg_quality if jpeg_quality is None else jpeg_quality
+        futures = [Future() for _ in range(num_frames)]
         
-        # Create frames directory if it doesn't exist
-        if not os.path.exists(frames_dir):
-            os.makedirs(frames_dir)
+        if callback:
+            remaining = [num_frames]
+            remaining_lock = threading.Lock()
+            
+            def frame_done(_):
+                with remaining_lock:
+                    remaining[0] -= 1
+                    if remaining[0] > 0:
+                        return
+                filenames = [f.result() for f in futures if f.exception() is None]
+                try:
+                    callback(filenames)
+                except Exception as e:
+                    logger.error(f"Error in burst capture callback: {e}")
+            
+            for future in futures:
+                future.add_done_callback(frame_done)
         
-        frame_filenames = []
+        def chain(future, encode_future):
+            # Propagate the encode result into the future handed to the caller
+            if encode_future.exception() is not None:
+                future.set_exception(encode_future.exception())
+            else:
+                future.set_result(encode_future.result())
         
-        try:
-            if not self.camera:
+        def run_burst():
+            camera = self.camera
+            if not camera:
+                error = RuntimeError("Camera not initialized")
                 logger.error("Cannot capture frames: Camera not initialized")
-                return []
-                
-            logger.info(f"Capturing {num_frames} frames directly from camera...")
+                for future in futures:
+                    future.set_exception(error)
+                return
             
-            # Capture frames with a small delay between them
-            for i in range(num_frames):
-                # Capture a frame
-                frame = self.camera.capture_array()
-                
-                # Save the frame
-                frame_filename = os.path.join(frames_dir, f"frame_{timestamp}_{i}.jpg")
-                cv2.imwrite(frame_filename, frame)
-                frame_filenames.append(frame_filename)
-                logger.info(f"Captured and saved frame {i} to {frame_filename}")
-                
-                # Small delay between frames
-                time.sleep(0.5)
-                
-            return frame_filenames
-        except Exception as e:
-            logger.error(f"Error capturing frames directly: {e}")
-            return []
+            try:
+                os.makedirs(frames_dir, exist_ok=True)
+            except OSError as e:
+                logger.error(f"Cannot capture frames: {e}")
+                for future in futures:
+                    future.set_exception(e)
+                return
+            logger.info(f"Capturing burst of {num_frames} frames at {interval}s intervals...")
+            next_capture = time.monotonic()
+            for i, future in enumerate(futures):
+                try:
+                    delay = next_capture - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_capture += interval
+                    
+                    frame = camera.capture_array()
+                    buffer = self._acquire_buffer(frame.shape, frame.dtype)
+                    np.copyto(buffer, frame)
+                    if self.overlay:
+                        self.overlay.apply(buffer)
+                    
+                    frame_filename = os.path.join(frames_dir, f"frame_{timestamp}_{i}.jpg")
+                    encode_future = self.encode_executor.submit(
+                        self._encode_frame, buffer, frame_filename, jpeg_quality
+                    )
+                    encode_future.add_done_callback(lambda f, future=future: chain(future, f))
+                except Exception as e:
+                    logger.error(f"Error capturing burst frame {i}: {e}")
+                    future.set_exception(e)
+        
+        self.capture_executor.submit(run_burst)
+        return futures
+    
+    def capture_frames(self, frames_dir, timestamp, num_frames=3):
+        """Capture frames directly from the camera.
+        
+        Blocking wrapper around capture_burst for callers that need the files.
+        
+        Args:
+            frames_dir: Directory to save captured frames
+            timestamp: Timestamp to use in frame filenames
+            num_frames: Number of frames to capture
+            
+        Returns:
+            list: List of captured frame filenames
+        """
+        frame_filenames = []
+        for i, future in enumerate(self.capture_burst(frames_dir, timestamp, num_frames)):
+            try:
+                frame_filenames.append(future.result())
+            except Exception as e:
+                logger.error(f"Error capturing frame {i} directly: {e}")
+        return frame_filenames
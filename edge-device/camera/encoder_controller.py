@@ -0,0 +1,204 @@
+"""
+Adaptive encoder controller for the IoT security camera system.
+"""
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from utils.logger import logger
+
+class EncoderController:
+    """Picks bitrate, resolution and GOP length for each recording.
+
+    The decision is driven by the recently measured upload throughput, the
+    free space on the clips volume and the bytes still waiting to be uploaded.
+    """
+
+    def __init__(self, clips_dir, min_bitrate=1000000, max_bitrate=10000000,
+                 resolutions=((640, 480), (1280, 720), (1920, 1080)),
+                 min_iperiod=15, max_iperiod=60, upload_window=60,
+                 min_free_space=500 * 1024 * 1024, bits_per_pixel=0.1,
+                 framerate=30, history_size=10, storage_manager=None):
+        """Initialize the encoder controller.
+
+        Args:
+            clips_dir: Directory where recorded clips are stored
+            min_bitrate: Lowest bitrate that will ever be chosen (bits/s)
+            max_bitrate: Highest bitrate that will ever be chosen (bits/s)
+            resolutions: Candidate (width, height) sizes, smallest first
+            min_iperiod: Shortest GOP length (frames), used at max bitrate
+            max_iperiod: Longest GOP length (frames), used at min bitrate
+            upload_window: Seconds we allow for a clip and the backlog to upload
+            min_free_space: Bytes to always keep free on the clips volume
+            bits_per_pixel: Bits per pixel per frame needed for a usable image
+            framerate: Expected recording frame rate
+            history_size: Number of recent uploads used to estimate throughput
+            storage_manager: Optional StorageManager providing headroom and backlog
+        """
+        self.clips_dir = clips_dir
+        self.min_bitrate = min_bitrate
+        self.max_bitrate = max_bitrate
+        self.resolutions = sorted(resolutions, key=lambda size: size[0] * size[1])
+        self.min_iperiod = min_iperiod
+        self.max_iperiod = max_iperiod
+        self.upload_window = upload_window
+        self.min_free_space = min_free_space
+        self.bits_per_pixel = bits_per_pixel
+        self.framerate = framerate
+        self.storage_manager = storage_manager
+
+        self.upload_history = deque(maxlen=history_size)
+        # Backlog bookkeeping when there is no storage manager to ask
+        self.uploaded_files = set()
+        self.lock = threading.Lock()
+
+    def record_upload(self, local_file, num_bytes, seconds):
+        """Record a completed upload so throughput can be estimated.
+
+        Args:
+            local_file: Path of the uploaded file
+            num_bytes: Size of the upload in bytes
+            seconds: Time the upload took
+        """
+        finished_at = time.monotonic()
+        with self.lock:
+            if seconds > 0:
+                self.upload_history.append((finished_at - seconds, finished_at, num_bytes))
+            if not self.storage_manager:
+                self.uploaded_files.add(os.path.abspath(local_file))
+
+    def get_upload_throughput(self):
+        """Get the recent upload throughput of the link.
+
+        Uploads overlap (batch pool, queue workers), each getting only part
+        of the link, so the bytes of the recent uploads are divided by the
+        wall-clock time during which at least one of them was running rather
+        than by the sum of their durations.
+
+        Returns:
+            float or None: Bytes per second, or None if nothing was measured yet
+        """
+        with self.lock:
+            history = sorted(self.upload_history)
+        total_bytes = 0
+        busy_seconds = 0.0
+        busy_until = None
+        for started_at, finished_at, num_bytes in history:
+            total_bytes += num_bytes
+            if busy_until is None or started_at > busy_until:
+                busy_seconds += finished_at - started_at
+                busy_until = finished_at
+            elif finished_at > busy_until:
+                busy_seconds += finished_at - busy_until
+                busy_until = finished_at
+        if busy_seconds <= 0:
+            return None
+        return total_bytes / busy_seconds
+
+    def get_free_space(self):
+        """Get the bytes a new clip may use on the clips volume.
+
+        Returns:
+            int: Storage headroom if a storage manager is set, otherwise
+                free bytes beyond the reserved free space
+        """
+        if self.storage_manager:
+            return self.storage_manager.get_headroom()
+        return max(shutil.disk_usage(self.clips_dir).free - self.min_free_space, 0)
+
+    def get_backlog_bytes(self):
+        """Get the number of clip bytes that have not been uploaded yet.
+
+        Returns:
+            int: Backlog size in bytes
+        """
+        if self.storage_manager:
+            return self.storage_manager.get_pending_bytes(self.clips_dir)
+        
+        backlog = 0
+        present = set()
+        with self.lock:
+            uploaded_files = set(self.uploaded_files)
+        try:
+            for entry in os.scandir(self.clips_dir):
+                if not entry.is_file():
+                    continue
+                path = os.path.abspath(entry.path)
+                present.add(path)
+                if path not in uploaded_files:
+                    backlog += entry.stat().st_size
+        except FileNotFoundError:
+            pass
+        with self.lock:
+            # Forget uploaded files that have since been deleted
+            self.uploaded_files &= present | (self.uploaded_files - uploaded_files)
+        return backlog
+
+    def select_settings(self, duration):
+        """Choose encoder settings for the next recording.
+
+        Args:
+            duration: Planned recording duration in seconds
+
+        Returns:
+            dict or None: Encoder settings with 'bitrate', 'size' and 'iperiod'
+                keys, or None if not even a minimum bitrate clip would fit
+        """
+        throughput = self.get_upload_throughput()
+        free_space = self.get_free_space()
+        backlog = self.get_backlog_bytes()
+
+        bitrate = self.max_bitrate
+        limited_by = "max"
+
+        # Fit this clip into what the uplink can move within the upload window,
+        # after the clips already waiting in the backlog
+        if throughput is not None:
+            upload_budget = max(throughput * self.upload_window - backlog, 0)
+            upload_bitrate = upload_budget * 8 / duration
+            if upload_bitrate < bitrate:
+                bitrate = upload_bitrate
+                limited_by = "upload"
+
+        # Never write a clip that would eat into the reserved free space
+        disk_bitrate = free_space * 8 / duration
+        if disk_bitrate < bitrate:
+            bitrate = disk_bitrate
+            limited_by = "disk"
+        
+        if disk_bitrate < self.min_bitrate:
+            logger.warning(
+                f"Refusing to record: {free_space // 1024} KB of storage headroom "
+                f"cannot hold a {duration}s clip at the minimum bitrate"
+            )
+            return None
+
+        bitrate = int(min(max(bitrate, self.min_bitrate), self.max_bitrate))
+
+        # Largest resolution the bitrate can still encode cleanly
+        size = self.resolutions[0]
+        for candidate in self.resolutions:
+            if candidate[0] * candidate[1] * self.framerate * self.bits_per_pixel <= bitrate:
+                size = candidate
+
+        # Longer GOPs at low bitrates so fewer bits go to keyframes
+        if self.max_bitrate > self.min_bitrate:
+            fraction = (bitrate - self.min_bitrate) / (self.max_bitrate - self.min_bitrate)
+        else:
+            fraction = 1.0
+        iperiod = int(round(self.max_iperiod - fraction * (self.max_iperiod - self.min_iperiod)))
+
+        settings = {
+            "bitrate": bitrate,
+            "size": size,
+            "iperiod": iperiod
+        }
+
+        throughput_text = f"{throughput * 8 / 1000:.0f} kbit/s" if throughput is not None else "unknown"
+        logger.info(
+            f"Encoder settings: bitrate={bitrate} size={size[0]}x{size[1]} iperiod={iperiod} "
+            f"(limited by {limited_by}; upload={throughput_text}, "
+            f"headroom={free_space // (1024 * 1024)} MB, backlog={backlog // 1024} KB)"
+        )
+        return settings
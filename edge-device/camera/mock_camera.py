@@ -0,0 +1,339 @@
+"""
+Mock camera backend for running the camera, stream and record paths off-device.
+"""
+import threading
+import time
+import cv2
+import numpy as np
+from camera.outputs import EncoderOutput, H264Muxer, TIMESTAMP_BASE
+from utils.logger import logger
+
+class MockCamera:
+    """Stand-in for Picamera2 that produces synthetic or video-file frames.
+
+    Implements the subset of the Picamera2 API used by this project
+    (configure, start/stop, capture_array, start/stop_recording and
+    start/stop_encoder), paced at the configured frame rate so stream and
+    encode throughput can be benchmarked on a normal Linux machine.
+    """
+
+    def __init__(self, source=None, framerate=30):
+        """Initialize the mock camera.
+
+        Args:
+            source: Optional path to a video file to loop; synthetic frames otherwise
+            framerate: Frames per second delivered by the camera
+        """
+        self.source = source
+        self.framerate = framerate
+        self.camera_config = None
+        self.started = False
+        self.encoders = []
+
+        self.capture = None
+        self.capture_lock = threading.Lock()
+        self.start_time = None
+        self.last_frame_index = -1
+
+    def create_video_configuration(self, main=None, **kwargs):
+        """Create a video configuration.
+
+        Args:
+            main: Optional dict of main stream parameters such as 'size'
+            **kwargs: Other Picamera2 parameters (ignored)
+
+        Returns:
+            dict: Camera configuration
+        """
+        main_config = {"size": (1280, 720), "format": "RGB888"}
+        main_config.update(main or {})
+        return {"use_case": "video", "main": main_config}
+
+    def create_preview_configuration(self, main=None, **kwargs):
+        """Create a preview configuration.
+
+        Args:
+            main: Optional dict of main stream parameters such as 'size'
+            **kwargs: Other Picamera2 parameters (ignored)
+
+        Returns:
+            dict: Camera configuration
+        """
+        main_config = {"size": (640, 480), "format": "RGB888"}
+        main_config.update(main or {})
+        return {"use_case": "preview", "main": main_config}
+
+    def configure(self, camera_config):
+        """Apply a camera configuration.
+
+        Args:
+            camera_config: Configuration from create_*_configuration
+        """
+        if self.started:
+            raise RuntimeError("Camera must be stopped before configuring")
+        self.camera_config = camera_config
+
+    def start(self):
+        """Start delivering frames."""
+        if self.camera_config is None:
+            self.configure(self.create_preview_configuration())
+        if self.source and self.capture is None:
+            self.capture = cv2.VideoCapture(self.source)
+            if not self.capture.isOpened():
+                raise RuntimeError(f"Could not open mock camera source: {self.source}")
+        self.start_time = time.monotonic()
+        self.last_frame_index = -1
+        self.started = True
+
+    def stop(self):
+        """Stop delivering frames and any running encoders."""
+        self.stop_encoder()
+        self.started = False
+
+    def close(self):
+        """Release the camera."""
+        self.stop()
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+    def _render_frame(self, frame_index):
+        """Produce the RGB frame for a given frame index."""
+        width, height = self.camera_config["main"]["size"]
+        if self.capture is not None:
+            with self.capture_lock:
+                ok, frame = self.capture.read()
+                if not ok:
+                    self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    ok, frame = self.capture.read()
+            if ok:
+                if frame.shape[1] != width or frame.shape[0] != height:
+                    frame = cv2.resize(frame, (width, height))
+                return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+        # Moving gradient with a bouncing block, so encoders see real motion
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        shift = (frame_index * 4) % 256
+        frame[:, :, 0] = ((np.arange(width, dtype=np.uint16) + shift) % 256).astype(np.uint8)
+        frame[:, :, 1] = ((np.arange(height, dtype=np.uint16) + shift) % 256).astype(np.uint8)[:, np.newaxis]
+        frame[:, :, 2] = 128
+        block = max(height // 6, 8)
+        x = (frame_index * 8) % max(width - block, 1)
+        y = (frame_index * 5) % max(height - block, 1)
+        frame[y:y + block, x:x + block] = 255
+        return frame
+
+    def _wait_for_frame(self, after_index):
+        """Block until the frame after the given index is due and return its index."""
+        period = 1.0 / self.framerate
+        frame_index = after_index + 1
+        delay = self.start_time + frame_index * period - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            # Skip frames we were too slow to collect, as a real sensor would
+            frame_index = int((time.monotonic() - self.start_time) / period)
+        return frame_index
+
+    def capture_array(self, name="main"):
+        """Capture the next frame.
+
+        Args:
+            name: Stream name (only 'main' is supported)
+
+        Returns:
+            numpy.ndarray: HxWx3 RGB frame
+        """
+        if not self.started:
+            raise RuntimeError("Camera is not started")
+        self.last_frame_index = self._wait_for_frame(self.last_frame_index)
+        return self._render_frame(self.last_frame_index)
+
+    def start_encoder(self, encoder, output=None, name="main", **kwargs):
+        """Start an encoder on the main stream.
+
+        Args:
+            encoder: MockH264Encoder instance
+            output: Output receiving encoded frames
+            name: Stream name (only 'main' is supported)
+            **kwargs: Other Picamera2 parameters (ignored)
+        """
+        if output is not None:
+            encoder.output = output
+        encoder.start(self)
+        self.encoders.append(encoder)
+
+    def stop_encoder(self, encoders=None):
+        """Stop running encoders.
+
+        Args:
+            encoders: Encoder or list of encoders to stop (default: all)
+        """
+        if encoders is None:
+            encoders = list(self.encoders)
+        elif not isinstance(encoders, (list, tuple)):
+            encoders = [encoders]
+        for encoder in encoders:
+            encoder.stop()
+            if encoder in self.encoders:
+                self.encoders.remove(encoder)
+
+    def start_recording(self, encoder, output, config=None, quality=None, name="main"):
+        """Start the camera and record to an output.
+
+        Args:
+            encoder: MockH264Encoder instance
+            output: Output receiving encoded frames
+            config: Optional configuration to apply first
+            quality: Unused, present for API compatibility
+            name: Stream name (only 'main' is supported)
+        """
+        if config is not None:
+            self.configure(config)
+        if not self.started:
+            self.start()
+        self.start_encoder(encoder, output, name=name)
+
+    def stop_recording(self):
+        """Stop all encoders and the camera."""
+        self.stop()
+
+
+class MockH264Encoder:
+    """Software H.264 encoder with the Picamera2 H264Encoder interface.
+
+    Frames are encoded with PyAV (libx264) and handed to the output as
+    Annex B byte strings, as the hardware encoder does.
+    """
+
+    def __init__(self, bitrate=None, repeat=False, iperiod=None, **kwargs):
+        """Initialize the encoder.
+
+        Args:
+            bitrate: Target bitrate in bits/s
+            repeat: Unused, present for API compatibility
+            iperiod: Frames between keyframes
+            **kwargs: Other H264Encoder parameters (ignored)
+        """
+        self.bitrate = bitrate
+        self.iperiod = iperiod
+        self.output = None
+        self.running = False
+        self.thread = None
+        self.frames_encoded = 0
+        self.encode_seconds = 0.0
+
+    def start(self, camera):
+        """Start encoding frames from a mock camera.
+
+        Args:
+            camera: MockCamera delivering the frames
+        """
+        import av
+
+        width, height = camera.camera_config["main"]["size"]
+        self.codec = av.CodecContext.create("libx264", "w")
+        self.codec.width = width
+        self.codec.height = height
+        self.codec.pix_fmt = "yuv420p"
+        self.codec.time_base = TIMESTAMP_BASE
+        self.codec.framerate = camera.framerate
+        if self.bitrate:
+            self.codec.bit_rate = self.bitrate
+        if self.iperiod:
+            self.codec.gop_size = self.iperiod
+        self.codec.options = {"preset": "ultrafast", "tune": "zerolatency"}
+
+        if self.output is not None:
+            self.output.start()
+        self.running = True
+        self.thread = threading.Thread(target=self._encode_loop, args=(camera,), daemon=True)
+        self.thread.start()
+
+    def _encode_loop(self, camera):
+        """Encode camera frames until stopped."""
+        import av
+
+        frame_index = -1
+        first_index = None
+        while self.running:
+            frame_index = camera._wait_for_frame(frame_index)
+            if first_index is None:
+                first_index = frame_index
+            rgb = camera._render_frame(frame_index)
+
+            start = time.perf_counter()
+            video_frame = av.VideoFrame.from_ndarray(rgb, format="rgb24")
+            video_frame.pts = int((frame_index - first_index) * 1000000 / camera.framerate)
+            packets = self.codec.encode(video_frame)
+            self.encode_seconds += time.perf_counter() - start
+            self.frames_encoded += 1
+            self._emit(packets)
+
+        self._emit(self.codec.encode(None))
+
+    def _emit(self, packets):
+        """Send encoded packets to the output."""
+        if self.output is None:
+            return
+        for packet in packets:
+            self.output.outputframe(bytes(packet), packet.is_keyframe, packet.pts)
+
+    def stop(self):
+        """Stop encoding and close the output."""
+        if not self.running:
+            return
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        if self.output is not None:
+            self.output.stop()
+        if self.frames_encoded:
+            logger.info(
+                f"Mock encoder: {self.frames_encoded} frames, "
+                f"{self.encode_seconds * 1000 / self.frames_encoded:.1f} ms/frame"
+            )
+
+
+class MockFileOutput(EncoderOutput):
+    """Writes Annex B H.264 frames to an MP4 file with PyAV.
+
+    Takes the place of Picamera2's FfmpegOutput with the mock backend.
+    """
+
+    def __init__(self, output_filename, framerate=30):
+        """Initialize the output.
+
+        Args:
+            output_filename: MP4 file to write
+            framerate: Nominal frame rate of the stream
+        """
+        super().__init__()
+        self.output_filename = output_filename
+        self.framerate = framerate
+        self.muxer = None
+
+    def start(self):
+        """Open the output file."""
+        super().start()
+        self.muxer = H264Muxer(self.output_filename, framerate=self.framerate)
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+        """Mux one encoded frame.
+
+        Args:
+            frame: Annex B H.264 bytes
+            keyframe: Whether the frame is a keyframe
+            timestamp: Presentation timestamp in microseconds
+            packet: Unused, present for API compatibility
+            audio: Unused, present for API compatibility
+        """
+        if self.muxer is not None:
+            self.muxer.mux(frame, keyframe, timestamp)
+
+    def stop(self):
+        """Finish and close the output file."""
+        super().stop()
+        if self.muxer is not None:
+            self.muxer.close()
+            self.muxer = None
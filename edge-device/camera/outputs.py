@@ -0,0 +1,131 @@
+"""
+Encoder outputs shared by the camera backends.
+"""
+from fractions import Fraction
+
+# Encoders hand frames to outputs with timestamps in microseconds
+TIMESTAMP_BASE = Fraction(1, 1000000)
+
+try:
+    from picamera2.outputs import Output as EncoderOutput
+except ImportError:
+    class EncoderOutput:
+        """Stand-in for picamera2's Output base class on the mock backend."""
+
+        def __init__(self, pts=None):
+            """Initialize the output.
+
+            Args:
+                pts: Unused, present for API compatibility
+            """
+            self.recording = False
+
+        def start(self):
+            """Start accepting frames."""
+            self.recording = True
+
+        def stop(self):
+            """Stop accepting frames."""
+            self.recording = False
+
+        def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+            """Accept one encoded frame (ignored by the base class)."""
+
+
+class H264Muxer:
+    """Muxes Annex B H.264 frames from an encoder into a container with PyAV."""
+
+    def __init__(self, file, container_format=None, framerate=30, options=None):
+        """Open the container.
+
+        Args:
+            file: Filename or writable file-like object
+            container_format: Container format such as 'mp4' or 'mpegts'
+                (guessed from the filename if None)
+            framerate: Nominal frame rate of the stream
+            options: Optional muxer options, e.g. {'movflags': 'frag_keyframe+empty_moov'}
+        """
+        import av
+
+        self.container = av.open(file, "w", format=container_format, options=options or {})
+        self.stream = self.container.add_stream("h264", rate=framerate)
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def mux(self, frame, keyframe, timestamp):
+        """Mux one encoded frame.
+
+        Args:
+            frame: Annex B H.264 bytes
+            keyframe: Whether the frame is a keyframe
+            timestamp: Presentation timestamp in microseconds
+        """
+        import av
+
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+        packet = av.Packet(frame)
+        packet.pts = packet.dts = timestamp
+        packet.time_base = TIMESTAMP_BASE
+        packet.is_keyframe = keyframe
+        packet.stream = self.stream
+        self.container.mux(packet)
+
+    def close(self):
+        """Write the trailer and close the container."""
+        self.container.close()
+
+
+class FragmentedMp4Output(EncoderOutput):
+    """Muxes H.264 frames into a fragmented MP4 written to a file-like object.
+
+    Fragmented MP4 is written strictly front to back (no index rewritten at
+    the end), so the target only needs write() and close(), e.g. an upload
+    stream instead of a file on the SD card.
+    """
+
+    def __init__(self, file, framerate=30):
+        """Initialize the output.
+
+        Args:
+            file: Writable object with write() and close(); closed by stop()
+            framerate: Nominal frame rate of the stream
+        """
+        super().__init__()
+        self.file = file
+        self.framerate = framerate
+        self.muxer = None
+
+    def start(self):
+        """Start the container."""
+        super().start()
+        self.muxer = H264Muxer(
+            self.file,
+            container_format="mp4",
+            framerate=self.framerate,
+            options={"movflags": "frag_keyframe+empty_moov+default_base_moof"}
+        )
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+        """Mux one encoded frame.
+
+        Args:
+            frame: Annex B H.264 bytes
+            keyframe: Whether the frame is a keyframe
+            timestamp: Presentation timestamp in microseconds
+            packet: Unused, present for API compatibility
+            audio: Unused, present for API compatibility
+        """
+        if self.muxer is not None and not audio:
+            self.muxer.mux(frame, keyframe, timestamp)
+
+    def stop(self):
+        """Finish the container and close the target."""
+        super().stop()
+        try:
+            if self.muxer is not None:
+                self.muxer.close()
+                self.muxer = None
+        finally:
+            self.file.close()
@@ -1,22 +1,25 @@
 """
 Video recorder for the IoT security camera system.
 """
-from picamera2.encoders import H264Encoder
-from picamera2.outputs import FfmpegOutput
 from time import sleep
+from camera.backend import create_h264_encoder, create_file_output
 from utils.logger import logger
 
 class VideoRecorder:
     """Records video using the Pi camera."""
     
     @staticmethod
-    def record_video(camera, video_filename, duration):
+    def record_video(camera, video_filename, duration, encoder_settings=None, output=None):
         """Record a video clip directly to MP4 format.
         
         Args:
-            camera: Picamera2 instance
+            camera: Picamera2 or MockCamera instance
             video_filename: Output video filename
             duration: Recording duration in seconds
+            encoder_settings: Optional dict with 'bitrate', 'size' and 'iperiod'
+                keys, as chosen by EncoderController
+            output: Optional encoder output to record to instead of an MP4
+                file at video_filename, e.g. a FragmentedMp4Output
             
         Returns:
             str or None: Path to the recorded video if successful, None otherwise
@@ -26,9 +29,26 @@ class VideoRecorder:
                 logger.error("Cannot record video: Camera is not initialized")
                 return None
             
+            settings = encoder_settings or {}
+            
+            # Switch the main stream resolution if the controller asked for a different one
+            size = settings.get("size")
+            if size is not None and tuple(camera.camera_config["main"]["size"]) != tuple(size):
+                camera.stop()
+                camera.configure(camera.create_video_configuration(main={"size": tuple(size)}))
+                camera.start()
+                logger.info(f"Reconfigured camera to {size[0]}x{size[1]} for recording")
+            
             # Configure encoder with parameters to help with timestamp issues
-            encoder = H264Encoder(bitrate=10000000, repeat=False, iperiod=15)
-            camera.start_recording(encoder, FfmpegOutput(video_filename))
+            encoder = create_h264_encoder(
+                camera,
+                bitrate=settings.get("bitrate", 10000000),
+                repeat=False,
+                iperiod=settings.get("iperiod", 15)
+            )
+            if output is None:
+                output = create_file_output(camera, video_filename)
+            camera.start_recording(encoder, output)
             logger.info(f'Started recording to {video_filename}')
 
             sleep(duration)
@@ -4,5 +4,9 @@ Cloud services module initialization
 
 from cloud.mqtt_client import MQTTClient
 from cloud.s3_client import S3Client
+from cloud.upload_queue import UploadQueue
+from cloud.multipart_journal import MultipartJournal
+from cloud.streaming_upload import StreamingUpload
+from cloud.event_index import EventIndex
 
-__all__ = ['MQTTClient', 'S3Client']
+__all__ = ['MQTTClient', 'S3Client', 'UploadQueue', 'MultipartJournal', 'StreamingUpload', 'EventIndex']
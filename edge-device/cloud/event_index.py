@@ -0,0 +1,115 @@
+"""
+Per-day event index for the IoT security camera system.
+"""
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from utils.checksums import write_file
+from utils.logger import logger
+
+class EventIndex:
+    """Local, append-only log of each day's events and its compacted form.
+
+    Every event appends one JSON line to the day's log; the compacted
+    index (one JSON document with the day's events, oldest first) is
+    rewritten from it and uploaded as a single object, so a reader gets a
+    day of events with one GET instead of listing and presigning the
+    clips prefix. The log is the source of truth: an index upload that is
+    lost or overtaken is corrected by the next one.
+    """
+
+    def __init__(self, index_dir, device_id, retention_days=7):
+        """Initialize the index.
+
+        Args:
+            index_dir: Directory of the per-day logs and compacted indexes
+            device_id: Device the events belong to
+            retention_days: Days a local index is kept; older ones are final in S3
+        """
+        self.index_dir = index_dir
+        self.device_id = device_id
+        self.retention_days = retention_days
+        os.makedirs(index_dir, exist_ok=True)
+
+    def add_event(self, day, entry):
+        """Append an event and rewrite the day's compacted index.
+
+        Args:
+            day: Day of the event as 'YYYYMMDD' (UTC)
+            entry: JSON-serializable dict with at least 'event_id'; an entry
+                with the event_id of an earlier one replaces it
+
+        Returns:
+            str or None: Path of the compacted index to upload, None on failure
+        """
+        log_file = os.path.join(self.index_dir, f"{day}.jsonl")
+        index_file = os.path.join(self.index_dir, f"{day}.json")
+        try:
+            line = json.dumps(entry, separators=(",", ":")).encode() + b"\n"
+            with open(log_file, "ab+") as f:
+                if f.seek(0, os.SEEK_END) > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        # Do not glue the new entry onto a line torn by a crash
+                        line = b"\n" + line
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+            entries, num_lines = self._read_log(log_file)
+            if num_lines > len(entries):
+                # Replaced or unreadable lines: compact the log as well
+                self._replace(log_file, "".join(
+                    json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries.values()
+                ).encode())
+
+            index = {
+                "device_id": self.device_id,
+                "date": f"{day[:4]}-{day[4:6]}-{day[6:8]}",
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+                "events": sorted(entries.values(), key=lambda event: event["event_id"])
+            }
+            # Replaced atomically: the upload queue may be reading the previous version
+            self._replace(index_file, json.dumps(index, separators=(",", ":")).encode())
+            logger.info(f"Event index for {index['date']} now lists {len(entries)} events")
+        except Exception as e:
+            logger.error(f"Error updating event index for {day}: {e}")
+            return None
+        self._prune()
+        return index_file
+
+    def _read_log(self, log_file):
+        """Read a day's log.
+
+        Returns:
+            tuple: (dict of the latest entry by event_id, number of lines)
+        """
+        entries = {}
+        num_lines = 0
+        with open(log_file) as f:
+            for line in f:
+                num_lines += 1
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line torn by a crash during the append
+                    continue
+                entries[entry["event_id"]] = entry
+        return entries, num_lines
+
+    def _replace(self, path, data):
+        """Write a file under a temporary name and move it into place."""
+        temp_file = f"{path}.tmp"
+        write_file(temp_file, data)
+        os.replace(temp_file, path)
+
+    def _prune(self):
+        """Remove local indexes older than retention_days."""
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=self.retention_days)).strftime("%Y%m%d")
+        for filename in os.listdir(self.index_dir):
+            day = filename.split(".")[0]
+            if len(day) == 8 and day.isdigit() and day < cutoff:
+                try:
+                    os.remove(os.path.join(self.index_dir, filename))
+                except OSError as e:
+                    logger.warning(f"Could not remove old event index {filename}: {e}")
@@ -0,0 +1,137 @@
+"""
+Journal of in-progress S3 multipart uploads for the IoT security camera system.
+"""
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from utils.logger import logger
+
+MultipartUpload = namedtuple(
+    "MultipartUpload", ["s3_key", "upload_id", "local_file", "file_size", "part_size", "sha256", "created_at"]
+)
+
+class MultipartJournal:
+    """Crash-safe record of multipart upload IDs and completed part ETags.
+
+    S3 keeps the parts of an unfinished multipart upload, so with the upload
+    ID and the ETags of the parts sent so far an upload interrupted by a
+    reboot or a dropped link continues at the next part instead of byte 0.
+    """
+
+    def __init__(self, db_path):
+        """Open the journal.
+
+        Args:
+            db_path: Path of the SQLite database (may be shared with the upload queue)
+        """
+        self.journal_lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        with self.journal_lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=FULL")
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS multipart_uploads (
+                    s3_key TEXT PRIMARY KEY,
+                    upload_id TEXT NOT NULL,
+                    local_file TEXT NOT NULL,
+                    file_size INTEGER NOT NULL,
+                    part_size INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS multipart_parts (
+                    upload_id TEXT NOT NULL,
+                    part_number INTEGER NOT NULL,
+                    etag TEXT NOT NULL,
+                    PRIMARY KEY (upload_id, part_number)
+                );
+            """)
+
+    def get_upload(self, s3_key):
+        """Get the unfinished upload of an object key.
+
+        Args:
+            s3_key: S3 object key
+
+        Returns:
+            MultipartUpload or None: Journaled upload, None if there is none
+        """
+        with self.journal_lock:
+            row = self.connection.execute(
+                "SELECT * FROM multipart_uploads WHERE s3_key = ?", (s3_key,)
+            ).fetchone()
+        return MultipartUpload(**dict(row)) if row else None
+
+    def start_upload(self, upload):
+        """Record a newly created multipart upload.
+
+        Args:
+            upload: MultipartUpload
+        """
+        with self.journal_lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO multipart_uploads VALUES (?, ?, ?, ?, ?, ?, ?)", tuple(upload)
+            )
+
+    def add_part(self, upload_id, part_number, etag):
+        """Record a completed part.
+
+        Args:
+            upload_id: Multipart upload ID
+            part_number: Part number (from 1)
+            etag: ETag S3 returned for the part
+        """
+        with self.journal_lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO multipart_parts VALUES (?, ?, ?)", (upload_id, part_number, etag)
+            )
+
+    def get_parts(self, upload_id):
+        """Get the completed parts of an upload.
+
+        Args:
+            upload_id: Multipart upload ID
+
+        Returns:
+            dict: ETag by part number
+        """
+        with self.journal_lock:
+            rows = self.connection.execute(
+                "SELECT part_number, etag FROM multipart_parts WHERE upload_id = ?", (upload_id,)
+            ).fetchall()
+        return {row["part_number"]: row["etag"] for row in rows}
+
+    def forget(self, upload_id):
+        """Remove a completed or aborted upload and its parts.
+
+        Args:
+            upload_id: Multipart upload ID
+        """
+        with self.journal_lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.execute("DELETE FROM multipart_parts WHERE upload_id = ?", (upload_id,))
+                self.connection.execute("DELETE FROM multipart_uploads WHERE upload_id = ?", (upload_id,))
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def get_stale_uploads(self, max_age):
+        """Get uploads started longer ago than max_age.
+
+        Args:
+            max_age: Age in seconds
+
+        Returns:
+            list: MultipartUpload entries
+        """
+        with self.journal_lock:
+            rows = self.connection.execute(
+                "SELECT * FROM multipart_uploads WHERE created_at < ?", (time.time() - max_age,)
+            ).fetchall()
+        if rows:
+            logger.info(f"Found {len(rows)} stale multipart uploads")
+        return [MultipartUpload(**dict(row)) for row in rows]
@@ -1,42 +1,663 @@
 """
 S3 client for the IoT security camera system.
 """
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from cloud.multipart_journal import MultipartUpload
+from utils.bandwidth import ThrottledBody
+from utils.checksums import get_checksum, get_recorded_checksum, record_checksum
 from utils.logger import logger
+from utils.metrics import registry
+
+UPLOAD_SECONDS = registry.histogram(
+    "s3_upload_seconds", "Time to upload one file to S3",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+)
+UPLOADED_BYTES = registry.counter("s3_uploaded_bytes_total", "Bytes uploaded to S3")
+UPLOAD_FAILURES = registry.counter("s3_upload_failures_total", "Failed S3 uploads")
+UPLOADS_SKIPPED = registry.counter("s3_uploads_skipped_total", "Uploads skipped because the object was already in S3")
+PARTS_RESUMED = registry.counter("s3_multipart_parts_resumed_total", "Multipart parts not resent after an interrupted upload")
+UPLOAD_THROUGHPUT = registry.histogram(
+    "s3_upload_throughput_bytes_per_second", "Per-file S3 upload throughput",
+    buckets=(16384, 65536, 131072, 262144, 524288, 1048576, 2097152, 4194304, 8388608)
+)
+UPLOAD_START_SECONDS = {
+    pool: registry.histogram(
+        "s3_upload_start_seconds", "Time from starting an upload to its first body byte on the wire",
+        buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0), labels={"pool": pool}
+    )
+    for pool in ("cold", "warm")
+}
+PREWARMS = registry.counter("s3_prewarms_total", "Connection pool pre-warms")
+PREWARM_SECONDS = registry.histogram(
+    "s3_prewarm_seconds", "Time to open the pre-warmed connections",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+def _signal_not_transferring(request, operation_name, **kwargs):
+    """request-created hook: the body is about to be read for checksums, not sent."""
+    if operation_name in ("PutObject", "UploadPart") and hasattr(request.body, "signal_not_transferring"):
+        request.body.signal_not_transferring()
+
+def _signal_transferring(request, operation_name, **kwargs):
+    """request-created hook: the body is about to be sent.
+    
+    The same as the handlers s3transfer registers for its own bodies, kept
+    here because s3transfer.utils is not a public interface.
+    """
+    if operation_name in ("PutObject", "UploadPart"):
+        # Flexible checksums wrap the body in an AwsChunkedWrapper, which keeps it as _raw
+        body = getattr(request.body, "_raw", request.body)
+        if hasattr(body, "signal_transferring"):
+            body.signal_transferring()
+
+class UploadStart:
+    """Transfer callback that records when an upload's first body byte is sent.
+    
+    The time up to then is the request setup: DNS, TCP and TLS on a cold
+    connection, next to nothing on a pooled one.
+    """
+    
+    def __init__(self, pool_state, bandwidth=None):
+        """Start timing.
+        
+        Args:
+            pool_state: 'cold' or 'warm', the metrics label
+            bandwidth: Optional BandwidthConsumer the bytes are passed on to
+        """
+        self.histogram = UPLOAD_START_SECONDS[pool_state]
+        self.bandwidth = bandwidth
+        self.start_time = time.monotonic()
+        self.first_byte_time = None
+    
+    def acquire(self, num_bytes):
+        """Called as bytes are sent; same signature as BandwidthConsumer.acquire."""
+        if self.first_byte_time is None:
+            self.first_byte_time = time.monotonic()
+            self.histogram.observe(self.first_byte_time - self.start_time)
+        if self.bandwidth is not None:
+            self.bandwidth.acquire(num_bytes)
+    
+    __call__ = acquire
 
 class S3Client:
     """Client for AWS S3 storage operations."""
     
-    def __init__(self, bucket_name):
+    def __init__(self, bucket_name, upload_workers=3, multipart_threshold=8 * 1024 * 1024,
+                 multipart_chunksize=8 * 1024 * 1024, max_concurrency=2, max_upload_memory=32 * 1024 * 1024,
+                 bandwidth=None, multipart_journal=None, max_pool_connections=10, prewarm_connections=3,
+                 pool_idle_timeout=20.0, device_id="camera", endpoint_url=None):
         """Initialize the S3 client.
         
         Args:
             bucket_name: Name of the S3 bucket
+            upload_workers: Files uploaded concurrently by upload_batch
+            multipart_threshold: File size in bytes from which multipart upload is used
+            multipart_chunksize: Multipart part size in bytes (at least 5 MiB)
+            max_concurrency: Parts of one file uploaded concurrently
+            max_upload_memory: Cap in bytes on part data buffered per file
+            bandwidth: Optional BandwidthConsumer that uploads draw from
+            multipart_journal: Optional MultipartJournal; when set, multipart
+                uploads resume after a failure or restart
+            max_pool_connections: HTTP connections kept open to S3
+            prewarm_connections: Connections prewarm() opens
+            pool_idle_timeout: Seconds after which idle pooled connections are
+                assumed closed by S3
+            device_id: Device whose objects this client names, see event_key()
+            endpoint_url: Optional S3-compatible endpoint instead of AWS, e.g.
+                the stand-in in benchmarks/s3_standin.py
         """
         self.bucket_name = bucket_name
-        self.client = boto3.client('s3')
+        self.device_id = device_id
+        self.endpoint_url = endpoint_url
+        # Keepalive holds pooled connections open between bursts of uploads;
+        # S3-compatible endpoints generally only serve path-style requests
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, config=Config(
+            max_pool_connections=max_pool_connections, tcp_keepalive=True,
+            s3={"addressing_style": "path"} if endpoint_url else None
+        ))
+        self.upload_observers = []
+        # Set once HEAD is found to be denied, so the warning is logged only once
+        self.head_denied = False
+        self.bandwidth = bandwidth
+        self.multipart_journal = multipart_journal
+        
+        # Let throttled part bodies tell checksum reads from the actual send,
+        # the same hooks the managed transfer registers for its own bodies
+        self.client.meta.events.register_first(
+            'request-created.s3', _signal_not_transferring, unique_id='s3upload-not-transferring'
+        )
+        self.client.meta.events.register_last(
+            'request-created.s3', _signal_transferring, unique_id='s3upload-transferring'
+        )
+        
+        # Few, large parts: a Pi uplink is slow and each part costs CPU and memory
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency
+        )
+        self.transfer_config.max_in_memory_upload_chunks = max(1, max_upload_memory // multipart_chunksize)
+        self.upload_executor = ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix="s3-upload")
+        
+        self.prewarm_connections = min(prewarm_connections, max_pool_connections)
+        self.pool_idle_timeout = pool_idle_timeout
+        self.prewarm_executor = ThreadPoolExecutor(max_workers=self.prewarm_connections, thread_name_prefix="s3-prewarm")
+        self.prewarm_lock = threading.Lock()
+        self.prewarming = False
+        self.last_response = 0.0
+        self.client.meta.events.register('after-call.s3', self._on_response, unique_id='s3upload-last-response')
         logger.info(f"S3 client initialized for bucket: {bucket_name}")
         
-    def upload_file(self, local_file, s3_key):
+    def upload_file(self, local_file, s3_key, part_callback=None, check_existing=True):
         """Upload a file to S3.
         
+        Every object carries the file's SHA-256 in its 'sha256' metadata.
+        Unless the file has a recorded checksum or check_existing needs the
+        digest up front, the file is hashed as it is read for sending
+        rather than read twice.
+        
         Args:
             local_file: Path to local file
             s3_key: S3 object key (path in bucket)
+            part_callback: Optional function called before each multipart part;
+                it may block to pause the upload at a part boundary
+            check_existing: Skip the upload if the object already exists with
+                the same checksum (costs one HEAD request)
             
         Returns:
             str or None: S3 URL if successful, None otherwise
         """
         logger.info(f"Uploading {local_file} to S3 bucket {self.bucket_name}")
         try:
-            self.client.upload_file(local_file, self.bucket_name, s3_key)
-            s3_url = f"https://{self.bucket_name}.s3.amazonaws.com/{s3_key}"
-            logger.info(f"Upload complete: {s3_url}")
+            num_bytes = os.path.getsize(local_file)
+            if check_existing:
+                sha256 = get_checksum(local_file)
+            else:
+                sha256 = get_recorded_checksum(local_file)
+            s3_url = self.get_url(s3_key)
+            if check_existing and self.object_matches(s3_key, sha256):
+                UPLOADS_SKIPPED.inc()
+                logger.info(f"Skipping upload, {s3_url} is already up to date")
+                self._notify_upload_observers(local_file, num_bytes, 0.0)
+                return s3_url
+            
+            start_time = time.monotonic()
+            upload_start = UploadStart(self.pool_state(), self.bandwidth)
+            multipart = num_bytes >= self.transfer_config.multipart_threshold
+            # A journaled upload (e.g. from a StreamingUpload) continues part by part at any size
+            resumable = self.multipart_journal is not None and self.multipart_journal.get_upload(s3_key) is not None
+            with self.bandwidth.busy() if self.bandwidth is not None else nullcontext():
+                if resumable or (multipart and (
+                    part_callback is not None or self.multipart_journal is not None or sha256 is None
+                )):
+                    self._upload_parts(local_file, s3_key, sha256, part_callback, upload_start)
+                elif sha256 is None:
+                    self._put_small_file(local_file, s3_key, upload_start)
+                else:
+                    # The transfer reports bytes as they are sent; blocking there paces the upload
+                    self.client.upload_file(
+                        local_file, self.bucket_name, s3_key, Config=self.transfer_config, Callback=upload_start,
+                        ExtraArgs={"Metadata": {"sha256": sha256}, "ContentType": self.content_type(s3_key)}
+                    )
+            elapsed = time.monotonic() - start_time
+            UPLOAD_SECONDS.observe(elapsed)
+            UPLOADED_BYTES.inc(num_bytes)
+            UPLOAD_THROUGHPUT.observe(num_bytes / max(elapsed, 1e-6))
+            logger.info(
+                f"Upload complete: {s3_url} ({num_bytes / 1024:.0f} KiB in {elapsed:.2f}s, "
+                f"{num_bytes / 1024 / max(elapsed, 1e-6):.0f} KiB/s)"
+            )
+            self._notify_upload_observers(local_file, num_bytes, elapsed)
             return s3_url
         except Exception as e:
             logger.error(f"Error uploading to S3: {e}")
+            UPLOAD_FAILURES.inc()
             return None
+    
+    def get_url(self, s3_key):
+        """Get the URL of an object in the bucket.
+        
+        Args:
+            s3_key: S3 object key (path in bucket)
+            
+        Returns:
+            str: S3 URL
+        """
+        if self.endpoint_url:
+            return f"{self.endpoint_url.rstrip('/')}/{self.bucket_name}/{s3_key}"
+        return f"https://{self.bucket_name}.s3.amazonaws.com/{s3_key}"
+    
+    def event_key(self, prefix, event_id, name):
+        """Get the key of an event artifact, partitioned by device and day.
+        
+        E.g. clips/<device>/2025/05/20/motion_20250520_024522.mp4, so a
+        day's objects can be listed without listing everything before it.
+        
+        Args:
+            prefix: Top-level prefix, e.g. 'clips', 'frames' or 'events'
+            event_id: Event identifier starting with its date ('YYYYMMDD_HHMMSS')
+            name: Rest of the key below the day
+            
+        Returns:
+            str: S3 object key
+        """
+        return f"{prefix}/{self.device_id}/{event_id[:4]}/{event_id[4:6]}/{event_id[6:8]}/{name}"
+    
+    def index_key(self, day):
+        """Get the key of the per-day event index.
+        
+        Args:
+            day: Day as 'YYYYMMDD'
+            
+        Returns:
+            str: S3 object key, e.g. index/<device>/2025/05/20.json
+        """
+        return f"index/{self.device_id}/{day[:4]}/{day[4:6]}/{day[6:8]}.json"
+    
+    def content_type(self, s3_key):
+        """Get the Content-Type to store an object with, e.g. video/mp4 for playback in browsers.
+        
+        Args:
+            s3_key: S3 object key (path in bucket)
+            
+        Returns:
+            str: MIME type guessed from the key's extension
+        """
+        return mimetypes.guess_type(s3_key)[0] or "application/octet-stream"
+    
+    def set_checksum_metadata(self, s3_key, sha256):
+        """Store a checksum on an object that was created without it.
+        
+        A server-side copy onto itself, so no object data is sent again. A
+        copy with MetadataDirective REPLACE resets everything not passed, so
+        the object's Content-Type and other metadata are carried over.
+        
+        Args:
+            s3_key: S3 object key (path in bucket)
+            sha256: Hex SHA-256 of the object
+        """
+        try:
+            current = self.client.head_object(Bucket=self.bucket_name, Key=s3_key)
+            content_type = current.get("ContentType") or self.content_type(s3_key)
+            metadata = dict(current.get("Metadata", {}))
+        except ClientError:
+            # HEAD denied by a put-only policy: set what the device itself would have
+            content_type = self.content_type(s3_key)
+            metadata = {}
+        metadata["sha256"] = sha256
+        self.client.copy_object(
+            Bucket=self.bucket_name,
+            Key=s3_key,
+            CopySource={"Bucket": self.bucket_name, "Key": s3_key},
+            ContentType=content_type,
+            Metadata=metadata,
+            MetadataDirective="REPLACE"
+        )
+    
+    def object_matches(self, s3_key, sha256):
+        """Check whether an object exists with the given checksum.
+        
+        Args:
+            s3_key: S3 object key (path in bucket)
+            sha256: Hex SHA-256 of the local file
+            
+        Returns:
+            bool: True if the object exists and its 'sha256' metadata matches;
+                False if it is missing or cannot be checked (HEAD denied by a
+                put-only policy), in which case the file is uploaded anyway
+        """
+        try:
+            response = self.client.head_object(Bucket=self.bucket_name, Key=s3_key)
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code in ("404", "NoSuchKey", "NotFound"):
+                return False
+            if code in ("403", "AccessDenied", "Forbidden"):
+                if not self.head_denied:
+                    self.head_denied = True
+                    logger.warning(
+                        f"Not allowed to read objects in {self.bucket_name}, "
+                        f"retried uploads cannot skip objects already in S3"
+                    )
+                return False
+            raise
+        return response.get("Metadata", {}).get("sha256") == sha256
+    
+    def _put_small_file(self, local_file, s3_key, progress=None):
+        """Upload a file below the multipart threshold from a single read.
+        
+        The file is read into memory once, hashed for the 'sha256' metadata
+        and sent from there, so it is not read a second time to hash it.
+        
+        Args:
+            local_file: Path to local file
+            s3_key: S3 object key (path in bucket)
+            progress: Optional UploadStart the body reports to
+        """
+        with open(local_file, "rb") as f:
+            data = f.read()
+        sha256 = hashlib.sha256(data).hexdigest()
+        consumer = progress if progress is not None else self.bandwidth
+        self.client.put_object(
+            Bucket=self.bucket_name,
+            Key=s3_key,
+            Body=ThrottledBody(data, consumer) if consumer is not None else data,
+            Metadata={"sha256": sha256},
+            ContentType=self.content_type(s3_key)
+        )
+        record_checksum(local_file, sha256)
+    
+    def _is_same_version(self, upload, local_file, file_size, sha256):
+        """Check whether a journaled upload was started from the current version of a file.
+        
+        Args:
+            upload: MultipartUpload from the journal
+            local_file: Path to local file
+            file_size: Current size of the file
+            sha256: Hex SHA-256 of the file, None if not computed
+            
+        Returns:
+            bool: True if the journaled parts can be reused
+        """
+        if upload.file_size != file_size:
+            return False
+        if upload.sha256 and sha256:
+            return upload.sha256 == sha256
+        # Started (or continued) without the digest: the file must not have changed since
+        return os.path.getmtime(local_file) <= upload.created_at
+    
+    def _resume_or_create_upload(self, local_file, s3_key, sha256):
+        """Find the journaled upload of this file version, or start a new one.
+        
+        Returns:
+            tuple: (upload ID, dict of ETag by completed part number, part size,
+                whether an earlier upload is resumed)
+        """
+        file_size = os.path.getsize(local_file)
+        part_size = self.transfer_config.multipart_chunksize
+        journal = self.multipart_journal
+        if journal is not None:
+            previous = journal.get_upload(s3_key)
+            if previous is not None:
+                if self._is_same_version(previous, local_file, file_size, sha256):
+                    # Keep the part size the upload was started with, or the journaled parts would not line up
+                    parts = journal.get_parts(previous.upload_id)
+                    PARTS_RESUMED.inc(len(parts))
+                    logger.info(f"Resuming upload of {s3_key} after {len(parts)} completed parts")
+                    return previous.upload_id, parts, previous.part_size, True
+                # The file changed since; its parts are of no use
+                self._abort_upload(previous)
+        
+        # Without the digest yet, the metadata is added once the upload is complete
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=s3_key, Metadata={"sha256": sha256} if sha256 else {},
+            ContentType=self.content_type(s3_key)
+        )["UploadId"]
+        if journal is not None:
+            journal.start_upload(MultipartUpload(
+                s3_key, upload_id, os.path.abspath(local_file), file_size, part_size, sha256 or "", time.time()
+            ))
+        return upload_id, {}, part_size, False
+    
+    def _upload_parts(self, local_file, s3_key, sha256, part_callback=None, progress=None):
+        """Multipart-upload a file one part at a time.
+        
+        Unlike the managed transfer, this gives the caller a hook between
+        parts and journals each completed part, so a later attempt resumes
+        at the first missing part; only one part is held in memory.
+        
+        Args:
+            local_file: Path to local file
+            s3_key: S3 object key (path in bucket)
+            sha256: Hex SHA-256 of the file, stored as object metadata; None
+                to hash the parts as they are read and add it when complete
+            part_callback: Optional function called before each part
+            progress: Optional UploadStart the part bodies report to
+        """
+        upload_id, etags, part_size, resumed = self._resume_or_create_upload(local_file, s3_key, sha256)
+        hasher = hashlib.sha256() if sha256 is None else None
+        try:
+            parts = []
+            num_parts = max(1, -(-os.path.getsize(local_file) // part_size))
+            with open(local_file, "rb") as f:
+                for part_number in range(1, num_parts + 1):
+                    if part_number in etags:
+                        if hasher is not None:
+                            # Only read to complete the digest
+                            f.seek((part_number - 1) * part_size)
+                            hasher.update(f.read(part_size))
+                        parts.append({"PartNumber": part_number, "ETag": etags[part_number]})
+                        continue
+                    f.seek((part_number - 1) * part_size)
+                    data = f.read(part_size)
+                    if hasher is not None:
+                        hasher.update(data)
+                    if part_callback is not None:
+                        part_callback()
+                    etag = self.send_part(s3_key, upload_id, part_number, data, progress)
+                    parts.append({"PartNumber": part_number, "ETag": etag})
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts}
+            )
+            if self.multipart_journal is not None:
+                self.multipart_journal.forget(upload_id)
+            if hasher is not None:
+                sha256 = hasher.hexdigest()
+                record_checksum(local_file, sha256)
+            if resumed or hasher is not None:
+                # Created before the checksum was known, e.g. by a StreamingUpload
+                self.set_checksum_metadata(s3_key, sha256)
+        except ClientError as e:
+            if self.multipart_journal is not None and e.response.get("Error", {}).get("Code") == "NoSuchUpload":
+                # Expired or aborted on the S3 side: the next attempt starts over
+                self.multipart_journal.forget(upload_id)
+            elif self.multipart_journal is None:
+                self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id)
+            raise
+        except Exception:
+            # Keep journaled parts for the next attempt; without a journal they are lost anyway
+            if self.multipart_journal is None:
+                self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id)
+            raise
+    
+    def send_part(self, s3_key, upload_id, part_number, data, progress=None):
+        """Upload and journal one part of a multipart upload.
+        
+        Args:
+            s3_key: S3 object key (path in bucket)
+            upload_id: Multipart upload ID
+            part_number: Part number (from 1)
+            data: Part bytes
+            progress: Optional UploadStart (or BandwidthConsumer) the body
+                reports to instead of the client's bandwidth consumer
+            
+        Returns:
+            str: ETag of the part
+        """
+        consumer = progress if progress is not None else self.bandwidth
+        if consumer is not None:
+            data = ThrottledBody(data, consumer)
+        response = self.client.upload_part(
+            Bucket=self.bucket_name,
+            Key=s3_key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=data
+        )
+        if self.multipart_journal is not None:
+            self.multipart_journal.add_part(upload_id, part_number, response["ETag"])
+        return response["ETag"]
+    
+    def _abort_upload(self, upload):
+        """Abort a journaled multipart upload and forget it.
+        
+        Args:
+            upload: MultipartUpload from the journal
+        """
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=upload.s3_key, UploadId=upload.upload_id)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "NoSuchUpload":
+                raise
+        self.multipart_journal.forget(upload.upload_id)
+        logger.info(f"Aborted multipart upload of {upload.s3_key}")
+    
+    def abort_stale_uploads(self, max_age):
+        """Abort journaled multipart uploads that were never finished.
+        
+        Their parts are billed storage in S3 until aborted, e.g. when the
+        local file was evicted before the upload could complete.
+        
+        Args:
+            max_age: Age in seconds after which an upload is given up
+        """
+        if self.multipart_journal is None:
+            return
+        for upload in self.multipart_journal.get_stale_uploads(max_age):
+            try:
+                self._abort_upload(upload)
+            except Exception as e:
+                logger.error(f"Error aborting multipart upload of {upload.s3_key}: {e}")
+    
+    def _on_response(self, **kwargs):
+        """Note when S3 last answered; connections idle longer may be closed."""
+        self.last_response = time.monotonic()
+    
+    def pool_state(self):
+        """Guess whether pooled connections are still open.
+        
+        Returns:
+            str: 'warm' if S3 answered a request within pool_idle_timeout, 'cold' otherwise
+        """
+        return "warm" if time.monotonic() - self.last_response < self.pool_idle_timeout else "cold"
+    
+    def prewarm(self):
+        """Open pooled connections ahead of an upload, without blocking.
+        
+        Sends prewarm_connections concurrent HEAD Bucket requests so that many
+        connections complete DNS, TCP and TLS before the first upload needs
+        them. Does nothing while the pool is still warm or a pre-warm is
+        running. The requests may be denied (the camera role need not have
+        s3:ListBucket); the connection is open either way.
+        
+        Returns:
+            bool: True if a pre-warm was started
+        """
+        with self.prewarm_lock:
+            if self.prewarming or self.pool_state() == "warm":
+                return False
+            self.prewarming = True
+        PREWARMS.inc()
+        start_time = time.monotonic()
+        futures = [self.prewarm_executor.submit(self._prewarm_connection) for _ in range(self.prewarm_connections)]
+        
+        def finished(_):
+            if all(future.done() for future in futures):
+                with self.prewarm_lock:
+                    if not self.prewarming:
+                        return
+                    self.prewarming = False
+                elapsed = time.monotonic() - start_time
+                PREWARM_SECONDS.observe(elapsed)
+                logger.debug(f"Pre-warmed {len(futures)} S3 connections in {elapsed:.2f}s")
+        
+        for future in futures:
+            future.add_done_callback(finished)
+        return True
+    
+    def _prewarm_connection(self):
+        """Send one cheap request so its connection is set up and pooled."""
+        try:
+            self.client.head_bucket(Bucket=self.bucket_name)
+        except ClientError:
+            # A 403 still leaves an open connection behind
+            pass
+        except Exception as e:
+            logger.warning(f"Error pre-warming S3 connection: {e}")
+    
+    def add_upload_observer(self, callback):
+        """Register a callback for completed uploads.
+        
+        Args:
+            callback: Function called as callback(local_file, num_bytes, seconds);
+                seconds is 0 when the object was already in S3
+        """
+        self.upload_observers.append(callback)
+    
+    def _notify_upload_observers(self, local_file, num_bytes, seconds):
+        """Notify registered observers of a completed upload."""
+        for callback in self.upload_observers:
+            try:
+                callback(local_file, num_bytes, seconds)
+            except Exception as e:
+                logger.error(f"Error in upload observer: {e}")
+            
+    def submit_upload(self, local_file, s3_key):
+        """Upload a file on the upload pool.
+        
+        Args:
+            local_file: Path to local file
+            s3_key: S3 object key (path in bucket)
+            
+        Returns:
+            concurrent.futures.Future: Resolves to the S3 URL, or None on failure
+        """
+        return self.upload_executor.submit(self.upload_file, local_file, s3_key)
+    
+    def upload_batch(self, uploads):
+        """Upload several files concurrently on the bounded upload pool.
+        
+        Logs the batch throughput next to the process CPU load: per-file rates
+        well below the batch rate with low CPU point at the uplink, high CPU
+        points at the Pi.
+        
+        Args:
+            uploads: List of (local_file, s3_key) tuples
             
+        Returns:
+            list: S3 URL or None for each upload, in input order
+        """
+        if not uploads:
+            return []
+        cpu_start = time.process_time()
+        wall_start = time.monotonic()
+        # Sizes are taken before submitting: once an upload finishes, storage
+        # eviction may delete the file before the batch is summed up
+        sizes = [self._file_size(local_file) for local_file, _ in uploads]
+        futures = [self.submit_upload(local_file, s3_key) for local_file, s3_key in uploads]
+        urls = [future.result() for future in futures]
+        wall = time.monotonic() - wall_start
+        cpu = time.process_time() - cpu_start
+        
+        total_bytes = sum(size for size, url in zip(sizes, urls) if url)
+        logger.info(
+            f"Uploaded {sum(1 for url in urls if url)}/{len(uploads)} files, {total_bytes / 1024:.0f} KiB "
+            f"in {wall:.2f}s ({total_bytes / 1024 / max(wall, 1e-6):.0f} KiB/s, "
+            f"CPU {cpu / max(wall, 1e-6) * 100:.0f}% of one core)"
+        )
+        return urls
+    
+    @staticmethod
+    def _file_size(local_file):
+        """Size of a local file in bytes, or 0 if it cannot be read."""
+        try:
+            return os.path.getsize(local_file)
+        except OSError:
+            return 0
+    
     def upload_files(self, file_paths, s3_prefix):
         """Upload multiple files to S3 with the same prefix.
         
@@ -47,14 +668,11 @@ class S3Client:
         Returns:
             list: List of successful S3 URLs
         """
-        urls = []
-        for file_path in file_paths:
-            # Extract the filename from the path
-            filename = file_path.split('/')[-1]
-            # Create the S3 key with the prefix
-            s3_key = f"{s3_prefix}/{filename}"
-            # Upload the file
-            url = self.upload_file(file_path, s3_key)
-            if url:
-                urls.append(url)
-        return urls
+        # Create the S3 keys from the filenames and the prefix
+        uploads = [(file_path, f"{s3_prefix}/{os.path.basename(file_path)}") for file_path in file_paths]
+        return [url for url in self.upload_batch(uploads) if url]
+    
+    def shutdown(self):
+        """Wait for queued uploads to finish and release the upload pool."""
+        self.upload_executor.shutdown(wait=True)
+        self.prewarm_executor.shutdown(wait=False)
@@ -0,0 +1,316 @@
+"""
+Streaming S3 upload of recordings for the IoT security camera system.
+"""
+import hashlib
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import nullcontext
+from cloud.multipart_journal import MultipartUpload
+from utils.checksums import record_checksum
+from utils.logger import logger
+from utils.metrics import registry
+
+STREAMED_BYTES = registry.counter("s3_streamed_bytes_total", "Recording bytes uploaded while recording")
+SPILLED_BYTES = registry.counter("s3_stream_spilled_bytes_total", "Recording bytes spilled to local storage")
+STREAM_FALLBACKS = registry.counter(
+    "s3_stream_fallbacks_total", "Streamed recordings handed to the upload queue to finish"
+)
+
+class StreamingUpload:
+    """File-like target that uploads what is written as a multipart upload.
+
+    Written bytes collect in an in-memory part buffer; full parts are
+    uploaded in order by a background thread. While the network keeps up,
+    nothing touches local storage. When it falls behind (more than
+    max_buffered_bytes of parts waiting), further parts are written to a
+    spill file at their offset in the object and read back when their turn
+    comes. If a part cannot be uploaded, the rest is spilled as well: the
+    spill file then holds every part not yet in S3 (a sparse file, holes
+    where parts were uploaded) and, with the multipart journal, the upload
+    queue finishes the upload from it.
+
+    Without a multipart journal the uploaded parts could not be skipped on
+    a retry, so every part is also written to the spill file.
+    """
+
+    def __init__(self, s3_client, s3_key, spill_file, part_size=5 * 1024 * 1024,
+                 max_buffered_bytes=16 * 1024 * 1024, part_attempts=3):
+        """Start the upload.
+
+        Args:
+            s3_client: S3Client used for the upload
+            s3_key: S3 object key (path in bucket)
+            spill_file: Local path used if the network falls behind
+            part_size: Part size in bytes (at least 5 MiB)
+            max_buffered_bytes: Part data held in memory before parts are spilled
+            part_attempts: Attempts per part before giving the upload to the queue
+        """
+        self.s3_client = s3_client
+        self.s3_key = s3_key
+        self.spill_file = spill_file
+        self.part_size = part_size
+        self.max_buffered_bytes = max_buffered_bytes
+        self.part_attempts = part_attempts
+        self.write_through = s3_client.multipart_journal is None
+
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.buffer = bytearray()
+        self.next_part_number = 1
+        self.buffered_bytes = 0
+        self.spill_fd = None
+        self.upload_id = None
+        self.parts = []
+        self.failed = False
+        self.spill_error = None
+        self.closed = False
+        self.aborted = False
+        self.upload_lock = threading.Lock()
+        self.part_queue = queue.Queue()
+        self.future = Future()
+        self.started_at = time.time()
+
+        self.upload_thread = threading.Thread(target=self._upload_loop, name=f"stream-{s3_key}", daemon=True)
+        self.upload_thread.start()
+
+    @property
+    def sha256(self):
+        """Hex SHA-256 of everything written so far."""
+        return self.hasher.hexdigest()
+
+    def write(self, data):
+        """Append bytes to the object.
+
+        Args:
+            data: Bytes to append
+
+        Returns:
+            int: Number of bytes written
+        """
+        self.hasher.update(data)
+        self.size += len(data)
+        self.buffer += data
+        while len(self.buffer) >= self.part_size:
+            self._queue_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+        return len(data)
+
+    def close(self):
+        """Finish writing; the upload completes in the background.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the S3 URL, or to None if
+                the upload has to be finished from the spill file
+        """
+        if not self.closed:
+            self.closed = True
+            if self.buffer or self.size == 0:
+                # The last part may be smaller than part_size
+                self._queue_part(bytes(self.buffer))
+                self.buffer = bytearray()
+            self.part_queue.put(None)
+        return self.future
+
+    def abort(self):
+        """Give up the upload, e.g. when the recording failed.
+
+        Returns:
+            concurrent.futures.Future: Resolves to None once the parts and the
+                spill file have been discarded
+        """
+        self.aborted = True
+        self.failed = True
+        return self.close()
+
+    def _spill(self, part_number, data):
+        """Write a part to the spill file at its offset in the object.
+
+        Errors (e.g. a full disk) are recorded rather than raised, since this
+        also runs on the thread writing the recording: the upload can still
+        complete from memory, but can no longer fall back to the spill file.
+
+        Returns:
+            bool: True if the part was written
+        """
+        try:
+            with self.upload_lock:
+                if self.spill_fd is None:
+                    self.spill_fd = os.open(self.spill_file, os.O_RDWR | os.O_CREAT, 0o644)
+            os.pwrite(self.spill_fd, data, (part_number - 1) * self.part_size)
+        except OSError as e:
+            logger.error(f"Error spilling part {part_number} of {self.s3_key}: {e}")
+            self.spill_error = e
+            return False
+        SPILLED_BYTES.inc(len(data))
+        return True
+
+    def _queue_part(self, data):
+        """Hand a full part to the upload thread, in memory or through the spill file."""
+        part_number = self.next_part_number
+        self.next_part_number += 1
+        with self.upload_lock:
+            in_memory = not self.failed and self.buffered_bytes + len(data) <= self.max_buffered_bytes
+            if in_memory:
+                self.buffered_bytes += len(data)
+        if self.write_through or not in_memory:
+            if not self._spill(part_number, data) and not in_memory:
+                # The part is nowhere, so the object can no longer be completed
+                with self.upload_lock:
+                    self.failed = True
+                return
+        if not in_memory and self.failed:
+            return
+        self.part_queue.put((part_number, data if in_memory else None, len(data)))
+
+    def _send_part(self, part_number, data):
+        """Upload one part, retrying a few times.
+
+        Returns:
+            bool: True if the part was uploaded
+        """
+        for attempt in range(1, self.part_attempts + 1):
+            try:
+                etag = self.s3_client.send_part(self.s3_key, self.upload_id, part_number, data)
+                self.parts.append({"PartNumber": part_number, "ETag": etag})
+                STREAMED_BYTES.inc(len(data))
+                return True
+            except Exception as e:
+                logger.warning(f"Error streaming part {part_number} of {self.s3_key} (attempt {attempt}): {e}")
+                if attempt < self.part_attempts:
+                    time.sleep(min(2 ** attempt, 10))
+        return False
+
+    def _start(self):
+        """Create the multipart upload and journal it."""
+        try:
+            self.upload_id = self.s3_client.client.create_multipart_upload(
+                Bucket=self.s3_client.bucket_name, Key=self.s3_key, ContentType=self.s3_client.content_type(self.s3_key)
+            )["UploadId"]
+        except Exception as e:
+            logger.warning(f"Could not start streaming upload of {self.s3_key}: {e}")
+            self.failed = True
+            return
+        if self.s3_client.multipart_journal is not None:
+            # Size and checksum are filled in if the upload has to be finished from the spill file
+            self.s3_client.multipart_journal.start_upload(MultipartUpload(
+                self.s3_key, self.upload_id, os.path.abspath(self.spill_file), 0, self.part_size, "",
+                self.started_at
+            ))
+
+    def _upload_loop(self):
+        """Upload queued parts in order, then complete or fall back.
+
+        Any unexpected error resolves the future with the exception, so the
+        recorder waiting on it is never left hanging.
+        """
+        try:
+            self._start()
+            bandwidth = self.s3_client.bandwidth
+            while True:
+                item = self.part_queue.get()
+                if item is None:
+                    break
+                part_number, data, length = item
+                if data is not None:
+                    with self.upload_lock:
+                        self.buffered_bytes -= length
+                else:
+                    data = os.pread(self.spill_fd, length, (part_number - 1) * self.part_size)
+
+                if not self.failed:
+                    with bandwidth.busy() if bandwidth is not None else nullcontext():
+                        if self._send_part(part_number, data):
+                            continue
+                    logger.warning(f"Streaming upload of {self.s3_key} fell behind, spilling the rest")
+                    with self.upload_lock:
+                        self.failed = True
+                if item[1] is not None and not self.write_through and not self.aborted:
+                    self._spill(part_number, data)
+            self._finish()
+        except Exception as e:
+            logger.error(f"Streaming upload of {self.s3_key} failed: {e}")
+            with self.upload_lock:
+                # Later parts go straight to the spill file, as nothing reads the queue
+                self.failed = True
+            if not self.future.done():
+                self.future.set_exception(e)
+
+    def _discard(self):
+        """Abort the multipart upload and remove the spill file."""
+        try:
+            if self.upload_id is not None:
+                self.s3_client.client.abort_multipart_upload(
+                    Bucket=self.s3_client.bucket_name, Key=self.s3_key, UploadId=self.upload_id
+                )
+                if self.s3_client.multipart_journal is not None:
+                    self.s3_client.multipart_journal.forget(self.upload_id)
+            if self.spill_fd is not None:
+                os.close(self.spill_fd)
+                os.remove(self.spill_file)
+        except Exception as e:
+            logger.error(f"Error discarding streaming upload of {self.s3_key}: {e}")
+        logger.info(f"Discarded streaming upload of {self.s3_key}")
+        self.future.set_result(None)
+
+    def _finish(self):
+        """Complete the upload, or leave the spill file for the upload queue."""
+        if self.aborted:
+            self._discard()
+            return
+        if not self.failed:
+            try:
+                self.s3_client.client.complete_multipart_upload(
+                    Bucket=self.s3_client.bucket_name,
+                    Key=self.s3_key,
+                    UploadId=self.upload_id,
+                    MultipartUpload={"Parts": sorted(self.parts, key=lambda part: part["PartNumber"])}
+                )
+                if self.s3_client.multipart_journal is not None:
+                    self.s3_client.multipart_journal.forget(self.upload_id)
+                self.s3_client.set_checksum_metadata(self.s3_key, self.sha256)
+                if self.spill_fd is not None:
+                    os.close(self.spill_fd)
+                    os.remove(self.spill_file)
+                logger.info(
+                    f"Streamed {self.size / 1024:.0f} KiB to {self.s3_key} in {len(self.parts)} parts, "
+                    f"finished {time.time() - self.started_at:.1f}s after the recording started"
+                )
+                self.future.set_result(self.s3_client.get_url(self.s3_key))
+                return
+            except Exception as e:
+                logger.warning(f"Could not complete streaming upload of {self.s3_key}: {e}")
+
+        STREAM_FALLBACKS.inc()
+        try:
+            if self.spill_error is not None:
+                raise IOError(f"Spill file {self.spill_file} is incomplete: {self.spill_error}")
+            # Every part not in S3 is in the spill file; pad it to the object size
+            if self.spill_fd is None:
+                self.spill_fd = os.open(self.spill_file, os.O_RDWR | os.O_CREAT, 0o644)
+            os.ftruncate(self.spill_fd, self.size)
+            os.fsync(self.spill_fd)
+            os.close(self.spill_fd)
+            journal = self.s3_client.multipart_journal
+            if journal is not None and self.upload_id is not None and self.parts:
+                # The file has holes where parts were uploaded, so it cannot be hashed again
+                if not record_checksum(self.spill_file, self.sha256):
+                    raise IOError(f"Cannot record the checksum of {self.spill_file}")
+                journal.start_upload(MultipartUpload(
+                    self.s3_key, self.upload_id, os.path.abspath(self.spill_file), self.size, self.part_size,
+                    self.sha256, self.started_at
+                ))
+            else:
+                if journal is None and self.upload_id is not None:
+                    # The spill file holds every part; the queue uploads it from scratch
+                    self.s3_client.client.abort_multipart_upload(
+                        Bucket=self.s3_client.bucket_name, Key=self.s3_key, UploadId=self.upload_id
+                    )
+                record_checksum(self.spill_file, self.sha256)
+            logger.info(f"Upload of {self.s3_key} continues from {self.spill_file} ({len(self.parts)} parts in S3)")
+            self.future.set_result(None)
+        except Exception as e:
+            logger.error(f"Streaming upload of {self.s3_key} failed: {e}")
+            self.future.set_exception(e)
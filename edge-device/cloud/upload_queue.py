@@ -0,0 +1,554 @@
+"""
+Durable upload queue for the IoT security camera system.
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from utils.checksums import get_recorded_checksum
+from utils.logger import logger
+from utils.metrics import registry
+
+# Upload priority classes, lowest value first
+PRIORITY_ALERT_FRAME = 0
+PRIORITY_MANIFEST = 1
+PRIORITY_VIDEO = 2
+PRIORITY_BACKLOG = 3
+KIND_PRIORITIES = {
+    "frame": PRIORITY_ALERT_FRAME,
+    "manifest": PRIORITY_MANIFEST,
+    "index": PRIORITY_MANIFEST,
+    "video": PRIORITY_VIDEO
+}
+
+TIME_TO_FIRST_ALERT = registry.histogram(
+    "upload_time_to_first_alert_seconds", "Time from detection to the first alert frame in S3",
+    buckets=(1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 120.0, 300.0)
+)
+TIME_TO_EVENT_UPLOADED = registry.histogram(
+    "upload_time_to_event_uploaded_seconds", "Time from detection to all artifacts of an event in S3",
+    buckets=(5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+)
+# A manifest triggers the cloud analysis of its event's frames, so it may
+# only start once none of them is still outstanding; a day index lists the
+# event's objects, so it waits for all of them
+READY_SQL = (
+    "(kind != 'manifest' OR NOT EXISTS (SELECT 1 FROM uploads AS frame "
+    "WHERE frame.event_id = uploads.event_id AND frame.kind = 'frame' "
+    "AND frame.status IN ('pending', 'uploading'))) "
+    "AND (kind != 'index' OR NOT EXISTS (SELECT 1 FROM uploads AS artifact "
+    "WHERE artifact.event_id = uploads.event_id AND artifact.kind != 'index' "
+    "AND artifact.status IN ('pending', 'uploading', 'deferred')))"
+)
+
+PREEMPTIONS = registry.counter("upload_preemptions_total", "Uploads paused at a part boundary for higher-priority work")
+
+class UploadQueue:
+    """Crash-safe SQLite journal of pending S3 uploads.
+
+    The detection path only inserts rows; a dispatcher thread uploads due
+    items through the S3 client and retries failures with
+    capped exponential backoff and jitter. Due uploads are started by
+    priority class (alert frames, manifests and day indexes, video, then
+    backlog older than backlog_age); an event's manifest waits until its
+    frames are in S3 and its day index until its other uploads have
+    finished, and a running multipart upload pauses at its next part
+    boundary while higher-priority work is waiting. Rows that were in flight when the
+    device went down are retried after restart. When every upload of an event
+    has finished, the registered event listeners are called, e.g. to send the
+    MQTT alert; the event is only marked completed afterwards, so a crash in
+    between repeats the notification rather than losing it.
+
+    An upload can also be journaled as deferred, for an artifact that is
+    being uploaded elsewhere (e.g. streamed while recording): it holds its
+    event open until resolve_deferred() records its URL or releases it to
+    be uploaded from its local file. After a restart it is uploaded from
+    its local file if that already holds the complete object, and marked
+    failed otherwise.
+    """
+
+    def __init__(self, db_path, s3_client, max_in_flight=3, base_delay=2.0, max_delay=300.0,
+                 backlog_age=600.0):
+        """Initialize the upload queue.
+
+        Args:
+            db_path: Path of the SQLite journal
+            s3_client: S3Client used for the uploads
+            max_in_flight: Uploads running at the same time
+            base_delay: Retry delay in seconds after the first failure
+            max_delay: Upper bound in seconds for the retry delay
+            backlog_age: Seconds after which an upload drops to the backlog class
+        """
+        self.db_path = db_path
+        self.s3_client = s3_client
+        self.max_in_flight = max_in_flight
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.backlog_age = backlog_age
+        self.event_listeners = []
+
+        self.queue_lock = threading.Lock()
+        self.wakeup = threading.Condition(self.queue_lock)
+        self.active = {}
+        self.completing = set()
+        self.first_alert_events = set()
+        self.running = False
+        self.dispatcher_thread = None
+
+        self.connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self._create_schema()
+
+    def _create_schema(self):
+        """Create the journal tables and requeue uploads interrupted by a crash."""
+        with self.queue_lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=FULL")
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS events (
+                    event_id TEXT PRIMARY KEY,
+                    metadata TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    completed INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS uploads (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event_id TEXT,
+                    kind TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 3,
+                    local_file TEXT NOT NULL,
+                    s3_key TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    url TEXT,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS uploads_due ON uploads (status, next_attempt_at);
+            """)
+            columns = [row["name"] for row in self.connection.execute("PRAGMA table_info(uploads)")]
+            if "priority" not in columns:
+                # Journals written before priorities existed: treat them as backlog
+                self.connection.execute(
+                    f"ALTER TABLE uploads ADD COLUMN priority INTEGER NOT NULL DEFAULT {PRIORITY_BACKLOG}"
+                )
+            # The object may already be (partly) in S3, which the next attempt checks
+            requeued = self.connection.execute(
+                "UPDATE uploads SET status = 'pending', last_error = 'interrupted by restart' "
+                "WHERE status = 'uploading'"
+            ).rowcount
+            deferred = self.connection.execute(
+                "SELECT id, local_file, s3_key FROM uploads WHERE status = 'deferred'"
+            ).fetchall()
+            resumed = [row["id"] for row in deferred if self._is_handed_over(row["local_file"], row["s3_key"])]
+            self.connection.executemany(
+                "UPDATE uploads SET status = 'pending', last_error = 'interrupted by restart' WHERE id = ?",
+                [(upload_id,) for upload_id in resumed]
+            )
+            # The rest of a deferred upload lived in the process that went down
+            lost = self.connection.execute(
+                "UPDATE uploads SET status = 'failed', last_error = 'interrupted by restart' "
+                "WHERE status = 'deferred'"
+            ).rowcount
+        if requeued:
+            logger.info(f"Requeued {requeued} uploads interrupted by a restart")
+        if resumed:
+            logger.info(f"Requeued {len(resumed)} deferred uploads from their local files")
+        if lost:
+            logger.warning(f"Lost {lost} deferred uploads interrupted by a restart")
+
+    def _is_handed_over(self, local_file, s3_key):
+        """Check whether a deferred upload can be finished from its local file.
+
+        A streaming upload that falls behind leaves every part not yet in S3
+        in its spill file, records the file's checksum and journals the full
+        object size. Until then the file is a partial recording (sparse where
+        parts were sent), which must not be uploaded as the object.
+
+        Args:
+            local_file: Local file of the deferred upload
+            s3_key: S3 key of the deferred upload
+
+        Returns:
+            bool: True if the file holds the complete object
+        """
+        try:
+            file_size = os.path.getsize(local_file)
+        except OSError:
+            return False
+        if get_recorded_checksum(local_file) is None:
+            return False
+        journal = self.s3_client.multipart_journal
+        upload = journal.get_upload(s3_key) if journal is not None else None
+        return upload is None or upload.file_size == file_size
+
+    def enqueue_event(self, event_id, uploads, metadata=None, deferred=()):
+        """Journal all uploads of an event in one transaction.
+
+        Args:
+            event_id: Unique event identifier
+            uploads: List of (kind, local_file, s3_key) tuples; kind 'frame',
+                'manifest', 'index' or 'video' sets the priority class
+            metadata: Optional JSON-serializable dict passed to event listeners;
+                a 'detected_at' time.time() value enables time-to-alert metrics
+            deferred: S3 keys of uploads that wait for resolve_deferred()
+
+        Returns:
+            bool: True if the event was journaled, False otherwise
+        """
+        now = time.time()
+        try:
+            with self.queue_lock:
+                self.connection.execute("BEGIN IMMEDIATE")
+                try:
+                    self.connection.execute(
+                        "INSERT INTO events (event_id, metadata, created_at) VALUES (?, ?, ?)",
+                        (event_id, json.dumps(metadata or {}), now)
+                    )
+                    self.connection.executemany(
+                        "INSERT INTO uploads (event_id, kind, priority, local_file, s3_key, status, next_attempt_at, "
+                        "created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        [(event_id, kind, KIND_PRIORITIES.get(kind, PRIORITY_BACKLOG), os.path.abspath(local_file),
+                          s3_key, "deferred" if s3_key in deferred else "pending", now, now)
+                         for kind, local_file, s3_key in uploads]
+                    )
+                    self.connection.execute("COMMIT")
+                except Exception:
+                    self.connection.execute("ROLLBACK")
+                    raise
+                self.wakeup.notify_all()
+            logger.info(f"Queued {len(uploads)} uploads for event {event_id}")
+            if not uploads:
+                self._check_event(event_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error queueing uploads for event {event_id}: {e}")
+            return False
+
+    def resolve_deferred(self, event_id, s3_key, url=None, error=None):
+        """Finish a deferred upload.
+
+        Args:
+            event_id: Event identifier passed to enqueue_event
+            s3_key: S3 key of the deferred upload
+            url: S3 URL if the artifact was uploaded elsewhere
+            error: Error message if the artifact is lost; with neither url nor
+                error the queue uploads it from its local file
+        """
+        if url:
+            status = "done"
+        elif error:
+            status = "failed"
+        else:
+            status = "pending"
+        with self.queue_lock:
+            self.connection.execute(
+                "UPDATE uploads SET status = ?, url = ?, last_error = ?, next_attempt_at = ? "
+                "WHERE event_id = ? AND s3_key = ? AND status = 'deferred'",
+                (status, url, error, time.time(), event_id, s3_key)
+            )
+            self.wakeup.notify_all()
+        if status != "pending":
+            self._check_event(event_id)
+
+    def add_event_listener(self, callback):
+        """Register a callback for events whose uploads have all finished.
+
+        Args:
+            callback: Function called as callback(event_id, metadata, uploads),
+                where uploads is a list of dicts with kind, local_file, s3_key
+                and url (None if the upload was abandoned)
+        """
+        self.event_listeners.append(callback)
+
+    def get_pending_count(self):
+        """Get the number of uploads not finished yet.
+
+        Returns:
+            int: Pending and in-flight uploads
+        """
+        with self.queue_lock:
+            row = self.connection.execute(
+                "SELECT COUNT(*) FROM uploads WHERE status IN ('pending', 'uploading', 'deferred')"
+            ).fetchone()
+        return row[0]
+
+    def get_uploading_files(self):
+        """Get the local files of the uploads in flight.
+
+        Returns:
+            set: Absolute paths, e.g. to keep them from being evicted
+        """
+        with self.queue_lock:
+            rows = self.connection.execute(
+                "SELECT local_file FROM uploads WHERE status = 'uploading'"
+            ).fetchall()
+        return {row["local_file"] for row in rows}
+
+    def get_retry_delay(self, attempts):
+        """Get the delay before the next attempt.
+
+        Exponential in the number of failed attempts, capped at max_delay,
+        with jitter so uploads that failed together do not retry together.
+
+        Args:
+            attempts: Failed attempts so far
+
+        Returns:
+            float: Delay in seconds
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** max(attempts - 1, 0))
+        return random.uniform(delay / 2, delay)
+
+    def start(self):
+        """Start the dispatcher thread."""
+        if self.running:
+            return
+        self.running = True
+        self.dispatcher_thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self.dispatcher_thread.start()
+        logger.info("Upload queue started")
+
+        # Events whose uploads finished before a crash but were never notified
+        with self.queue_lock:
+            event_ids = [row[0] for row in self.connection.execute(
+                "SELECT event_id FROM events WHERE completed = 0"
+            )]
+        for event_id in event_ids:
+            self._check_event(event_id)
+
+    def stop(self, timeout=5.0):
+        """Stop dispatching; unfinished uploads stay journaled for next start.
+
+        Args:
+            timeout: Seconds to wait for the dispatcher thread
+        """
+        with self.queue_lock:
+            self.running = False
+            self.wakeup.notify_all()
+        if self.dispatcher_thread is not None:
+            self.dispatcher_thread.join(timeout)
+        logger.info("Upload queue stopped")
+
+    def _effective_priority_sql(self):
+        """SQL expression and parameter for an upload's current priority class."""
+        return "CASE WHEN created_at < ? THEN ? ELSE priority END", (time.time() - self.backlog_age, PRIORITY_BACKLOG)
+
+    def _claim_due_uploads(self):
+        """Mark the most urgent due uploads as in flight, up to the free slots.
+
+        Must be called with queue_lock held.
+
+        Returns:
+            tuple: (list of (row, priority) claimed, seconds until the next upload is due or None)
+        """
+        free_slots = self.max_in_flight - len(self.active)
+        now = time.time()
+        claimed = []
+        if free_slots > 0:
+            priority_sql, params = self._effective_priority_sql()
+            rows = self.connection.execute(
+                f"SELECT *, {priority_sql} AS effective_priority FROM uploads "
+                f"WHERE status = 'pending' AND next_attempt_at <= ? AND {READY_SQL} "
+                "ORDER BY effective_priority, next_attempt_at, id LIMIT ?",
+                params + (now, free_slots)
+            ).fetchall()
+            for row in rows:
+                self.connection.execute("UPDATE uploads SET status = 'uploading' WHERE id = ?", (row["id"],))
+                self.active[row["id"]] = row["effective_priority"]
+                claimed.append((row, row["effective_priority"]))
+
+        next_row = self.connection.execute(
+            # Blocked manifests are woken by their last frame finishing
+            f"SELECT MIN(next_attempt_at) FROM uploads WHERE status = 'pending' AND {READY_SQL}"
+        ).fetchone()
+        wait = None if next_row[0] is None else max(next_row[0] - now, 0.0)
+        return claimed, wait
+
+    def _higher_priority_waiting(self, priority):
+        """Check for running or due uploads more urgent than a priority class.
+
+        Must be called with queue_lock held.
+        """
+        if any(active_priority < priority for active_priority in self.active.values()):
+            return True
+        priority_sql, params = self._effective_priority_sql()
+        row = self.connection.execute(
+            f"SELECT 1 FROM uploads WHERE status = 'pending' AND next_attempt_at <= ? AND {READY_SQL} "
+            f"AND {priority_sql} < ? LIMIT 1",
+            (time.time(),) + params + (priority,)
+        ).fetchone()
+        return row is not None
+
+    def _wait_for_turn(self, upload_id, priority):
+        """Part-boundary hook: pause this upload while more urgent work is waiting.
+
+        The paused upload gives up its slot, so the dispatcher can start the
+        urgent uploads, and takes a slot again before its next part.
+
+        Args:
+            upload_id: Journal id of the running upload
+            priority: Its priority class
+        """
+        with self.queue_lock:
+            if not self._higher_priority_waiting(priority):
+                return
+            self.active.pop(upload_id, None)
+            self.wakeup.notify_all()
+            PREEMPTIONS.inc()
+            logger.info(f"Pausing upload {upload_id} for higher-priority uploads")
+            while self.running and (self._higher_priority_waiting(priority) or len(self.active) >= self.max_in_flight):
+                self.wakeup.wait(1.0)
+            self.active[upload_id] = priority
+        logger.info(f"Resuming upload {upload_id}")
+
+    def _dispatch_loop(self):
+        """Hand due uploads to the S3 client until stopped."""
+        while True:
+            with self.queue_lock:
+                if not self.running:
+                    return
+                try:
+                    claimed, wait = self._claim_due_uploads()
+                except Exception as e:
+                    logger.error(f"Error reading upload queue: {e}")
+                    claimed, wait = [], 5.0
+                if not claimed:
+                    # Woken early by enqueue_event, a finished or paused upload, or stop
+                    self.wakeup.wait(wait if wait is not None else 60.0)
+                    continue
+            for row, priority in claimed:
+                self._start_upload(row, priority)
+
+    def _start_upload(self, row, priority):
+        """Start one claimed upload on its own thread.
+
+        Uploads get a thread each rather than a pool slot: a paused upload
+        keeps its thread, and the urgent uploads it yields to must not queue
+        behind it. The number running is bounded by max_in_flight.
+        """
+        if not os.path.exists(row["local_file"]):
+            logger.error(f"Abandoning upload of missing file {row['local_file']}")
+            self._finish_upload(row, None, "file missing", retry=False)
+            return
+        threading.Thread(
+            target=self._run_upload,
+            args=(row, priority),
+            name=f"upload-{row['id']}",
+            daemon=True
+        ).start()
+
+    def _run_upload(self, row, priority):
+        """Upload one file and record the result."""
+        try:
+            url = self.s3_client.upload_file(
+                row["local_file"],
+                row["s3_key"],
+                part_callback=lambda: self._wait_for_turn(row["id"], priority),
+                # A first attempt cannot find its object in S3; skip the HEAD request
+                check_existing=row["last_error"] is not None
+            )
+            error = None if url else "upload failed"
+        except Exception as e:
+            url, error = None, str(e)
+        self._finish_upload(row, url, error, retry=url is None)
+
+    def _finish_upload(self, row, url, error, retry):
+        """Journal an upload result and complete its event if it was the last one."""
+        attempts = row["attempts"] + 1
+        with self.queue_lock:
+            self.active.pop(row["id"], None)
+            if url:
+                self.connection.execute(
+                    "UPDATE uploads SET status = 'done', attempts = ?, url = ?, last_error = NULL WHERE id = ?",
+                    (attempts, url, row["id"])
+                )
+            elif retry:
+                delay = self.get_retry_delay(attempts)
+                self.connection.execute(
+                    "UPDATE uploads SET status = 'pending', attempts = ?, next_attempt_at = ?, last_error = ? "
+                    "WHERE id = ?",
+                    (attempts, time.time() + delay, error, row["id"])
+                )
+                logger.warning(
+                    f"Upload of {row['local_file']} failed (attempt {attempts}), retrying in {delay:.1f}s"
+                )
+            else:
+                self.connection.execute(
+                    "UPDATE uploads SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                    (attempts, error, row["id"])
+                )
+            first_alert = (
+                url and row["kind"] == "frame" and row["event_id"] and
+                row["event_id"] not in self.first_alert_events
+            )
+            if first_alert:
+                self.first_alert_events.add(row["event_id"])
+            self.wakeup.notify_all()
+
+        if first_alert:
+            detected_at = self._get_detected_at(row["event_id"])
+            if detected_at is not None:
+                TIME_TO_FIRST_ALERT.observe(time.time() - detected_at)
+                logger.info(f"Time to first alert frame for event {row['event_id']}: {time.time() - detected_at:.1f}s")
+        if row["event_id"]:
+            self._check_event(row["event_id"])
+
+    def _get_detected_at(self, event_id):
+        """Get the detection time journaled with an event, if any."""
+        with self.queue_lock:
+            event = self.connection.execute("SELECT metadata FROM events WHERE event_id = ?", (event_id,)).fetchone()
+        if event is None:
+            return None
+        return json.loads(event["metadata"]).get("detected_at")
+
+    def _check_event(self, event_id):
+        """Notify the event listeners once none of an event's uploads is outstanding.
+
+        Args:
+            event_id: Event identifier
+        """
+        with self.queue_lock:
+            if event_id in self.completing:
+                return
+            event = self.connection.execute(
+                "SELECT metadata, completed FROM events WHERE event_id = ?", (event_id,)
+            ).fetchone()
+            if event is None or event["completed"]:
+                return
+            outstanding = self.connection.execute(
+                "SELECT COUNT(*) FROM uploads WHERE event_id = ? AND status IN ('pending', 'uploading', 'deferred')",
+                (event_id,)
+            ).fetchone()[0]
+            if outstanding:
+                return
+            uploads = [
+                {"kind": row["kind"], "local_file": row["local_file"], "s3_key": row["s3_key"], "url": row["url"]}
+                for row in self.connection.execute(
+                    "SELECT * FROM uploads WHERE event_id = ? ORDER BY id", (event_id,)
+                )
+            ]
+            self.completing.add(event_id)
+
+        metadata = json.loads(event["metadata"])
+        if metadata.get("detected_at") is not None:
+            TIME_TO_EVENT_UPLOADED.observe(time.time() - metadata["detected_at"])
+        self.first_alert_events.discard(event_id)
+        try:
+            self._notify_event_listeners(event_id, metadata, uploads)
+            with self.queue_lock:
+                self.connection.execute("UPDATE events SET completed = 1 WHERE event_id = ?", (event_id,))
+        finally:
+            with self.queue_lock:
+                self.completing.discard(event_id)
+
+    def _notify_event_listeners(self, event_id, metadata, uploads):
+        """Call the event listeners for a completed event."""
+        for callback in self.event_listeners:
+            try:
+                callback(event_id, metadata, uploads)
+            except Exception as e:
+                logger.error(f"Error in upload event listener: {e}")
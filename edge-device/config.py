@@ -15,16 +15,64 @@ CLIENT_ID = "iot_edge_device1"
 TOPIC_ALERT = "security/camera/alerts"
 RANGE = 20
 
+# Camera backend: "picamera2" on the Pi, "mock" for off-device runs and benchmarks
+CAMERA_BACKEND = "picamera2"
+MOCK_CAMERA_SOURCE = None  # video file looped by the mock backend, synthetic frames if None
+
 # Local storage directories
 CLIPS_DIR = "clips"
 FRAMES_DIR = "frames"
+INDEX_DIR = "index"  # per-day event indexes, uploaded to index/<device>/<YYYY>/<MM>/<DD>.json
+INDEX_RETENTION_DAYS = 7  # days a local index is kept for updates
+
+# Local storage quota (clips and frames are evicted beyond this)
+STORAGE_STATE_FILE = "storage_state.json"
+STORAGE_QUOTA_BYTES = 4 * 1024 * 1024 * 1024
+STORAGE_MIN_FREE_SPACE = 500 * 1024 * 1024  # bytes always kept free on the SD card
+STORAGE_STATE_SAVE_INTERVAL = 30.0  # seconds between storage state writes for new and uploaded files
 
 # S3 bucket configuration
 S3_BUCKET = "jalil-iot-project"
+S3_ENDPOINT_URL = None  # S3-compatible endpoint, e.g. benchmarks/s3_standin.py; None for AWS
+S3_UPLOAD_WORKERS = 3  # files of one event uploaded concurrently
+S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024  # bytes
+S3_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024  # bytes per part, at least 5 MiB
+S3_MAX_CONCURRENCY = 2  # parts of one file in flight
+S3_MAX_UPLOAD_MEMORY = 32 * 1024 * 1024  # bytes of part data buffered per file
+S3_MAX_POOL_CONNECTIONS = 10  # HTTP connections kept open to S3
+S3_PREWARM_CONNECTIONS = 3  # connections opened when the radar first reports a target
+S3_POOL_IDLE_TIMEOUT = 20.0  # seconds after which S3 may have closed idle connections
+UPLOAD_QUEUE_DB = "upload_queue.db"  # durable journal of pending uploads
+UPLOAD_RETRY_BASE_DELAY = 2.0  # seconds before the first retry, doubled per failure
+UPLOAD_RETRY_MAX_DELAY = 300.0  # seconds
+UPLOAD_BACKLOG_AGE = 600.0  # seconds after which queued uploads yield to newer events
+MULTIPART_RESUME_MAX_AGE = 24 * 3600  # seconds an unfinished multipart upload is kept for resuming
+STREAM_RECORDINGS_TO_S3 = True  # upload clips while recording instead of writing them to the SD card
+STREAM_UPLOAD_PART_SIZE = 5 * 1024 * 1024  # bytes, S3 minimum part size
+STREAM_UPLOAD_MAX_BUFFERED = 16 * 1024 * 1024  # bytes held in memory before parts spill to the SD card
+
+# Uplink bandwidth shared by S3 uploads and the live stream
+BANDWIDTH_GOVERNOR_ENABLED = True
+UPLINK_CEILING = 2 * 1024 * 1024  # bytes/s, never exceeded
+UPLINK_FLOOR = 64 * 1024  # bytes/s, lowest capacity estimate
+S3_MIN_SHARE = 0.3  # guaranteed fraction of the uplink for uploads
+STREAM_MIN_SHARE = 0.4  # guaranteed fraction of the uplink for the live stream
 
 # Frame extraction settings
 FRAMES_TO_EXTRACT = 3
 RECORDING_DURATION = 20  # seconds
+BURST_INTERVAL = 0.5  # seconds between directly captured frames
+BURST_JPEG_QUALITY = 90
+BURST_ENCODE_WORKERS = 2
+
+# Adaptive encoder settings
+ENCODER_MIN_BITRATE = 1000000   # bits/s
+ENCODER_MAX_BITRATE = 10000000  # bits/s
+ENCODER_RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080)]
+ENCODER_MIN_IPERIOD = 15  # frames between keyframes at max bitrate
+ENCODER_MAX_IPERIOD = 60  # frames between keyframes at min bitrate
+ENCODER_UPLOAD_WINDOW = 60  # seconds allowed to upload a clip plus backlog
+ENCODER_MIN_FREE_SPACE = 500 * 1024 * 1024  # bytes kept free on the SD card
 
 # Privacy mode settings
 PRIVACY_COMMAND_TOPIC = "home/cameras/privacy/command"
@@ -35,6 +83,14 @@ PRIVACY_STATE_FILE = "privacy_state.json"
 STREAM_COMMAND_TOPIC = "home/cameras/livestream/command"
 STREAM_STATUS_TOPIC = "home/cameras/livestream/status"
 STREAM_PORT = 8080
+HLS_ENABLED = True  # publish a low-bandwidth HLS stream at /hls/stream.m3u8
+HLS_BITRATE = 1000000  # bits/s
+HLS_IPERIOD = 30  # frames between keyframes, at most one segment long
+HLS_SEGMENT_DURATION = 2.0  # seconds
+HLS_MAX_SEGMENTS = 6
+STREAM_WS_MAX_IN_FLIGHT = 2  # unacknowledged frames per WebSocket viewer
+SNAPSHOT_MAX_AGE = 2  # seconds clients may cache /snapshot.jpg
+OVERLAY_LABEL = None  # optional device label drawn after the timestamp
 
 # Motion detection thresholds
 MOTION_SPEED_THRESHOLD = 0.1  # m/s
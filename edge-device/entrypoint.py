@@ -9,11 +9,13 @@ import threading
 import config
 
 # Import modules
-from utils import logger, ensure_dirs_exist
-from cloud import MQTTClient, S3Client
-from camera import CameraManager, VideoRecorder
+from utils import logger, ensure_dirs_exist, TimestampOverlay, registry, BandwidthGovernor
+from cloud import MQTTClient, S3Client, UploadQueue, MultipartJournal, StreamingUpload, EventIndex
+from camera import CameraManager, VideoRecorder, EncoderController
+from camera.outputs import FragmentedMp4Output
 from motion import MotionDetector
 from privacy import PrivacyManager
+from storage import StorageManager
 from streaming import LiveStreamManager
 
 import os
@@ -31,6 +33,16 @@ def main():
         # Create required directories
         ensure_dirs_exist([config.CLIPS_DIR, config.FRAMES_DIR])
         
+        # Initialize storage manager for clips and frames
+        storage_manager = StorageManager(
+            directories=[config.CLIPS_DIR, config.FRAMES_DIR],
+            state_file=config.STORAGE_STATE_FILE,
+            quota_bytes=config.STORAGE_QUOTA_BYTES,
+            min_free_space=config.STORAGE_MIN_FREE_SPACE,
+            save_interval=config.STORAGE_STATE_SAVE_INTERVAL
+        )
+        storage_manager.enforce_quota()
+        
         # Initialize MQTT client
         mqtt_client = MQTTClient(
             endpoint=config.ENDPOINT,
@@ -45,8 +57,72 @@ def main():
             logger.error("Failed to connect to MQTT. Exiting...")
             return
             
+        # Share the uplink between uploads and the live stream
+        s3_bandwidth = None
+        stream_bandwidth = None
+        if config.BANDWIDTH_GOVERNOR_ENABLED:
+            bandwidth_governor = BandwidthGovernor(ceiling=config.UPLINK_CEILING, floor=config.UPLINK_FLOOR)
+            s3_bandwidth = bandwidth_governor.register("s3", config.S3_MIN_SHARE)
+            stream_bandwidth = bandwidth_governor.register("stream", config.STREAM_MIN_SHARE)
+            
         # Initialize S3 client
-        s3_client = S3Client(bucket_name=config.S3_BUCKET)
+        s3_client = S3Client(
+            bucket_name=config.S3_BUCKET,
+            upload_workers=config.S3_UPLOAD_WORKERS,
+            multipart_threshold=config.S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=config.S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=config.S3_MAX_CONCURRENCY,
+            max_upload_memory=config.S3_MAX_UPLOAD_MEMORY,
+            bandwidth=s3_bandwidth,
+            multipart_journal=MultipartJournal(config.UPLOAD_QUEUE_DB),
+            max_pool_connections=config.S3_MAX_POOL_CONNECTIONS,
+            prewarm_connections=config.S3_PREWARM_CONNECTIONS,
+            pool_idle_timeout=config.S3_POOL_IDLE_TIMEOUT,
+            device_id=config.CLIENT_ID,
+            endpoint_url=config.S3_ENDPOINT_URL
+        )
+        s3_client.abort_stale_uploads(config.MULTIPART_RESUME_MAX_AGE)
+        
+        # Initialize encoder controller, fed by measured upload throughput
+        encoder_controller = EncoderController(
+            clips_dir=config.CLIPS_DIR,
+            min_bitrate=config.ENCODER_MIN_BITRATE,
+            max_bitrate=config.ENCODER_MAX_BITRATE,
+            resolutions=config.ENCODER_RESOLUTIONS,
+            min_iperiod=config.ENCODER_MIN_IPERIOD,
+            max_iperiod=config.ENCODER_MAX_IPERIOD,
+            upload_window=config.ENCODER_UPLOAD_WINDOW,
+            min_free_space=config.ENCODER_MIN_FREE_SPACE,
+            storage_manager=storage_manager
+        )
+        s3_client.add_upload_observer(encoder_controller.record_upload)
+        s3_client.add_upload_observer(storage_manager.mark_uploaded)
+        
+        # Durable upload queue; alerts go out once an event's uploads finish
+        upload_queue = UploadQueue(
+            db_path=config.UPLOAD_QUEUE_DB,
+            s3_client=s3_client,
+            max_in_flight=config.S3_UPLOAD_WORKERS,
+            base_delay=config.UPLOAD_RETRY_BASE_DELAY,
+            max_delay=config.UPLOAD_RETRY_MAX_DELAY,
+            backlog_age=config.UPLOAD_BACKLOG_AGE
+        )
+        # Files being uploaded are not evicted from under the upload
+        storage_manager.add_eviction_guard(upload_queue.get_uploading_files)
+        upload_queue.add_event_listener(
+            lambda event_id, metadata, uploads: send_motion_alert(mqtt_client, metadata, uploads)
+        )
+        registry.gauge("upload_queue_depth", "Uploads waiting in the upload queue").set_function(
+            upload_queue.get_pending_count
+        )
+        upload_queue.start()
+        
+        # Per-day event index, so the gallery reads a day with one GET
+        event_index = EventIndex(
+            index_dir=config.INDEX_DIR,
+            device_id=config.CLIENT_ID,
+            retention_days=config.INDEX_RETENTION_DAYS
+        )
         
         # Initialize privacy manager
         privacy_manager = PrivacyManager(
@@ -65,8 +141,18 @@ def main():
         # Start privacy status heartbeat
         privacy_manager.start_status_heartbeat()
         
+        # Shared timestamp overlay for streamed and captured frames
+        overlay = TimestampOverlay(label=config.OVERLAY_LABEL)
+        
         # Initialize camera manager
-        camera_manager = CameraManager()
+        camera_manager = CameraManager(
+            overlay=overlay,
+            burst_interval=config.BURST_INTERVAL,
+            jpeg_quality=config.BURST_JPEG_QUALITY,
+            encode_workers=config.BURST_ENCODE_WORKERS,
+            backend=config.CAMERA_BACKEND,
+            source=config.MOCK_CAMERA_SOURCE
+        )
 
         # Initialize camera if needed
         if not camera_initialized:
@@ -80,11 +166,21 @@ def main():
             mqtt_client=mqtt_client,
             command_topic=config.STREAM_COMMAND_TOPIC,
             status_topic=config.STREAM_STATUS_TOPIC,
-            client_id=config.CLIENT_ID
+            client_id=config.CLIENT_ID,
+            overlay=overlay,
+            hls_enabled=config.HLS_ENABLED,
+            hls_bitrate=config.HLS_BITRATE,
+            hls_iperiod=config.HLS_IPERIOD,
+            hls_segment_duration=config.HLS_SEGMENT_DURATION,
+            hls_max_segments=config.HLS_MAX_SEGMENTS,
+            ws_max_in_flight=config.STREAM_WS_MAX_IN_FLIGHT,
+            snapshot_max_age=config.SNAPSHOT_MAX_AGE,
+            bandwidth=stream_bandwidth
         )
         
         logger.info("Starting main detection loop. Press CTRL+C to exit.")
         
+        target_present = False
         while True:
             # Check privacy state
             if privacy_manager.is_privacy_enabled():
@@ -97,6 +193,7 @@ def main():
                 # If privacy mode is enabled, make sure camera is off
                 if camera_initialized:
                     logger.info("Privacy mode active, shutting down camera")
+                    live_stream_manager.wait_until_camera_idle()
                     camera_manager.shutdown()
                     camera_initialized = False
                 
@@ -156,6 +253,13 @@ def main():
                 
                 motion_detected, data = detector.detect_motion(debug=True)
                 
+                # The radar sees a target before it counts as motion; open the
+                # S3 connections now so the first upload does not wait for TLS
+                target_was_present = target_present
+                target_present = bool(data) and data.get('target_number', 0) > 0
+                if target_present and not target_was_present:
+                    s3_client.prewarm()
+                
                 # Current time for flush calculations
                 current_time = time.time()
                 
@@ -179,8 +283,12 @@ def main():
                     # Process the motion detection event
                     process_motion_detection(
                         camera_manager=camera_manager,
+                        upload_queue=upload_queue,
+                        encoder_controller=encoder_controller,
+                        storage_manager=storage_manager,
+                        motion_data=data,
                         s3_client=s3_client,
-                        mqtt_client=mqtt_client
+                        event_index=event_index
                     )
                         
                     logger.info("Motion detection flow finished. Sleeping now.")
@@ -192,6 +300,7 @@ def main():
                     # This prevents any possibility of repeated detections
                     # Start the stream
                     print("Reinitialising camera and starting stream")
+                    live_stream_manager.wait_until_camera_idle()
                     camera_initialized = camera_manager.initialize()
                     live_stream_manager.set_recording(False)
                     live_stream_manager.start_stream()
@@ -214,10 +323,26 @@ def main():
     finally:
         # Cleanup
         try:
+            # Stop the streaming server
+            if 'live_stream_manager' in locals() and live_stream_manager:
+                live_stream_manager.shutdown()
+                
             # Shutdown camera if initialized
             if 'camera_manager' in locals() and camera_manager:
                 camera_manager.shutdown()
                 
+            # Stop dispatching uploads; unfinished ones resume on next start
+            if 'upload_queue' in locals() and upload_queue:
+                upload_queue.stop()
+            
+            # Let running uploads finish
+            if 's3_client' in locals() and s3_client:
+                s3_client.shutdown()
+                
+            # Write upload marks not saved yet
+            if 'storage_manager' in locals() and storage_manager:
+                storage_manager.flush()
+                
             # Disconnect MQTT if connected
             if 'mqtt_client' in locals() and mqtt_client:
                 mqtt_client.disconnect()
@@ -227,45 +352,177 @@ def main():
             logger.error(f"Error during cleanup: {e}")
 
 
-def process_motion_detection(camera_manager, s3_client, mqtt_client):
+def send_motion_alert(mqtt_client, metadata, uploads):
+    """Send the motion alert for an event whose uploads have finished.
+    
+    Args:
+        mqtt_client: MQTTClient instance
+        metadata: Event metadata journaled with the uploads
+        uploads: Upload results from the upload queue
+    """
+    video_s3_url = next((upload["url"] for upload in uploads if upload["kind"] == "video"), None)
+    frame_s3_urls = [upload["url"] for upload in uploads if upload["kind"] == "frame" and upload["url"]]
+    
+    # Send notification to MQTT broker with both video and frame URLs  
+    if video_s3_url and frame_s3_urls:
+        message = {
+            "device_id": config.CLIENT_ID,
+            "alert": "Motion detected",
+            "timestamp": metadata.get("timestamp"),
+            "video_url": video_s3_url,
+            "frame_urls": frame_s3_urls
+        }
+        
+        mqtt_client.publish(topic=config.TOPIC_ALERT, payload=message)
+        logger.info("Notification sent with video and frame URLs")
+    else:
+        logger.error("Failed to upload media, notification not sent")
+
+
+def write_event_manifest(manifest_filename, event_id, iso_timestamp, detected_at, motion_data, uploads,
+                         checksums=None):
+    """Write the JSON manifest that triggers the cloud analysis of an event.
+    
+    Args:
+        manifest_filename: Local path of the manifest
+        event_id: Event identifier (the filename timestamp)
+        iso_timestamp: ISO 8601 detection time
+        detected_at: Detection time as time.time()
+        motion_data: Radar readings that triggered the event, or None
+        uploads: List of (kind, local_file, s3_key) tuples of the event's artifacts
+        checksums: Optional dict of known SHA-256 by S3 key, e.g. of a streamed clip
+    """
+    from utils.checksums import get_checksum, get_recorded_checksum, write_file
+    import json
+    
+    # Checksums let the cloud side verify the objects. The frames are small
+    # and were hashed as they were written; the clip is not hashed here, as
+    # that would read it again on the detection thread, so its checksum is
+    # listed only if known (the object's sha256 metadata always carries it)
+    checksums = checksums or {}
+    artifacts = [
+        {
+            "key": s3_key,
+            "sha256": checksums.get(s3_key) or (
+                get_recorded_checksum(local_file) if kind == "video" else get_checksum(local_file)
+            )
+        }
+        for kind, local_file, s3_key in uploads
+    ]
+    manifest = {
+        "version": 1,
+        "event_id": event_id,
+        "device_id": config.CLIENT_ID,
+        "timestamp": iso_timestamp,
+        "detected_at": detected_at,
+        "written_at": time.time(),
+        "radar": motion_data,
+        "frames": [artifact for (kind, _, _), artifact in zip(uploads, artifacts) if kind == "frame"],
+        "video": next((artifact for (kind, _, _), artifact in zip(uploads, artifacts) if kind == "video"), None)
+    }
+    os.makedirs(os.path.dirname(manifest_filename), exist_ok=True)
+    write_file(manifest_filename, json.dumps(manifest, indent=2).encode())
+
+
+def process_motion_detection(camera_manager, upload_queue, s3_client, encoder_controller=None,
+                             storage_manager=None, motion_data=None, event_index=None):
     """Process a motion detection event.
     
     Args:
         camera_manager: CameraManager instance
-        s3_client: S3Client instance
-        mqtt_client: MQTTClient instance
+        upload_queue: UploadQueue receiving the event's artifacts
+        s3_client: S3Client naming the event's objects; with
+            STREAM_RECORDINGS_TO_S3 the clip is uploaded through it while it
+            is recorded instead of being written locally
+        encoder_controller: Optional EncoderController choosing per-clip encoder settings
+        storage_manager: Optional StorageManager tracking and evicting local artifacts
+        motion_data: Optional radar readings that triggered the event
+        event_index: Optional EventIndex the event is added to
     """
     from utils import generate_timestamp, extract_frames_from_video
     import os
     
+    detected_at = time.time()
+    
     # Create timestamps for filenames
     filename_timestamp, iso_timestamp = generate_timestamp()
     
     # Define paths
     video_filename = f"{config.CLIPS_DIR}/motion_{filename_timestamp}.mp4"
+    video_key = s3_client.event_key("clips", filename_timestamp, f"motion_{filename_timestamp}.mp4")
     frames_subdir = os.path.join(config.FRAMES_DIR, filename_timestamp)
     
     # Record the video
     logger.info(f"Recording video: {video_filename}")
     camera = camera_manager.get_camera()
+    encoder_settings = None
+    if storage_manager:
+        # Make room for a worst-case clip before the controller looks at headroom
+        storage_manager.enforce_quota(
+            required_bytes=config.ENCODER_MAX_BITRATE * config.RECORDING_DURATION // 8
+        )
+    if encoder_controller:
+        encoder_settings = encoder_controller.select_settings(config.RECORDING_DURATION)
+        if encoder_settings is None:
+            logger.error("Not enough storage headroom, skipping this detection")
+            return
+    
+    stream_upload = None
+    output = None
+    frame_futures = []
+    if config.STREAM_RECORDINGS_TO_S3:
+        # Encoded bytes go straight into S3 parts; video_filename is only
+        # written if the network falls behind
+        stream_upload = StreamingUpload(
+            s3_client,
+            video_key,
+            spill_file=video_filename,
+            part_size=config.STREAM_UPLOAD_PART_SIZE,
+            max_buffered_bytes=config.STREAM_UPLOAD_MAX_BUFFERED
+        )
+        output = FragmentedMp4Output(stream_upload)
+        # With no local clip to extract frames from, capture them across the recording
+        frame_futures = camera_manager.capture_burst(
+            frames_dir=frames_subdir,
+            timestamp=filename_timestamp,
+            num_frames=config.FRAMES_TO_EXTRACT,
+            interval=config.RECORDING_DURATION / config.FRAMES_TO_EXTRACT
+        )
+    
     recorded_video = VideoRecorder.record_video(
         camera=camera,
         video_filename=video_filename,
-        duration=config.RECORDING_DURATION
+        duration=config.RECORDING_DURATION,
+        encoder_settings=encoder_settings,
+        output=output
     )
     
     if not recorded_video:
         logger.error("Failed to record video, skipping this detection")
+        if stream_upload:
+            stream_upload.abort()
         return
     
-    # Try to extract frames from the recorded video
-    logger.info("Attempting to extract frames from the recorded video")
-    frame_files = extract_frames_from_video(
-        video_path=video_filename,
-        frames_dir=frames_subdir,
-        timestamp=filename_timestamp,
-        num_frames=config.FRAMES_TO_EXTRACT
-    )
+    if stream_upload:
+        video_future = stream_upload.close()
+        frame_files = []
+        for i, future in enumerate(frame_futures):
+            try:
+                frame_files.append(future.result())
+            except Exception as e:
+                logger.error(f"Error capturing frame {i} during recording: {e}")
+    else:
+        if storage_manager:
+            storage_manager.register(video_filename)
+        
+        # Try to extract frames from the recorded video
+        logger.info("Attempting to extract frames from the recorded video")
+        frame_files = extract_frames_from_video(
+            video_path=video_filename,
+            frames_dir=frames_subdir,
+            timestamp=filename_timestamp,
+            num_frames=config.FRAMES_TO_EXTRACT
+        )
     
     # If no frames were extracted, capture them directly
     if not frame_files:
@@ -280,33 +537,64 @@ def process_motion_detection(camera_manager, s3_client, mqtt_client):
         logger.warning("No frames were captured")
     else:
         logger.info(f"Successfully captured {len(frame_files)} frames")
+        if storage_manager:
+            for frame_file in frame_files:
+                storage_manager.register(frame_file)
     
-    # Upload video to S3
-    video_s3_key = f"clips/motion_{filename_timestamp}.mp4"
-    video_s3_url = s3_client.upload_file(video_filename, video_s3_key)
-    
-    # Upload frames to S3
-    frame_s3_urls = []
-    for i, frame_file in enumerate(frame_files):
-        frame_s3_key = f"frames/{filename_timestamp}/frame_{i}.jpg"
-        frame_s3_url = s3_client.upload_file(frame_file, frame_s3_key)
-        if frame_s3_url:
-            frame_s3_urls.append(frame_s3_url)
-    
-    # Send notification to MQTT broker with both video and frame URLs  
-    if video_s3_url and frame_s3_urls:
-        message = {
-            "device_id": config.CLIENT_ID,
-            "alert": "Motion detected",
+    # Journal the frames, manifest, video and day index; the upload queue
+    # uploads the frames first, then the manifest that triggers their cloud
+    # analysis as one unit, and sends the alert once all are in S3
+    uploads = [
+        ("frame", frame_file, s3_client.event_key("frames", filename_timestamp, f"{filename_timestamp}/frame_{i}.jpg"))
+        for i, frame_file in enumerate(frame_files)
+    ]
+    uploads.append(("video", video_filename, video_key))
+    checksums = {video_key: stream_upload.sha256} if stream_upload else None
+    if frame_files:
+        manifest_filename = os.path.join(frames_subdir, "manifest.json")
+        write_event_manifest(
+            manifest_filename, filename_timestamp, iso_timestamp, detected_at, motion_data, uploads, checksums
+        )
+        if storage_manager:
+            storage_manager.register(manifest_filename)
+        manifest_key = s3_client.event_key("events", filename_timestamp, f"{filename_timestamp}/manifest.json")
+        uploads.append(("manifest", manifest_filename, manifest_key))
+    if event_index:
+        # Uploaded once the event's other objects are in S3
+        day = filename_timestamp[:8]
+        index_filename = event_index.add_event(day, {
+            "event_id": filename_timestamp,
             "timestamp": iso_timestamp,
-            "video_url": video_s3_url,
-            "frame_urls": frame_s3_urls
-        }
+            "duration": config.RECORDING_DURATION,
+            "video_key": video_key,
+            "thumbnail_key": next((s3_key for kind, _, s3_key in uploads if kind == "frame"), None),
+            "detections": {"radar": motion_data}
+        })
+        if index_filename:
+            uploads.append(("index", index_filename, s3_client.index_key(day)))
+    upload_queue.enqueue_event(
+        filename_timestamp,
+        uploads,
+        metadata={"timestamp": iso_timestamp, "detected_at": detected_at},
+        deferred=(video_key,) if stream_upload else ()
+    )
+    
+    if stream_upload:
+        def on_streamed(future):
+            # The queue finishes the clip from the spill file if streaming fell behind
+            try:
+                url = future.result()
+            except Exception as e:
+                upload_queue.resolve_deferred(filename_timestamp, video_key, error=str(e))
+                return
+            if url is None and storage_manager:
+                storage_manager.register(video_filename)
+            upload_queue.resolve_deferred(filename_timestamp, video_key, url=url)
         
-        mqtt_client.publish(topic=config.TOPIC_ALERT, payload=message)
-        logger.info("Notification sent with video and frame URLs")
-    else:
-        logger.error("Failed to upload media, notification not sent")
+        video_future.add_done_callback(on_streamed)
+    
+    if storage_manager:
+        storage_manager.enforce_quota()
 
 
 if __name__ == "__main__":
@@ -3,6 +3,10 @@ import os
 import time
 import RPi.GPIO as GPIO
 from motion.DFRobot_C4001 import *
+from utils.metrics import registry
+
+RADAR_READS = registry.counter("radar_reads_total", "Radar sensor reads by the detection loop")
+RADAR_READ_SECONDS = registry.histogram("radar_read_seconds", "Time to read one radar sample")
 
 class MotionDetector:
     """
@@ -232,7 +236,10 @@ class MotionDetector:
             bool: True if motion is detected, False otherwise
             dict: Dictionary containing the sensor data
         """
+        start = time.perf_counter()
         data = self.get_sensor_data()
+        RADAR_READ_SECONDS.observe(time.perf_counter() - start)
+        RADAR_READS.inc()
         
         if data is None:
             return False, None
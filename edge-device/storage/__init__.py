@@ -0,0 +1,7 @@
+"""
+Storage module initialization
+"""
+
+from storage.storage_manager import StorageManager
+
+__all__ = ['StorageManager']
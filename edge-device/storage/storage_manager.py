@@ -0,0 +1,275 @@
+"""
+Local storage quota management for the IoT security camera system.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from utils.logger import logger
+
+class StorageManager:
+    """Tracks clips and frames on disk and evicts them to stay within a quota.
+
+    Every artifact is tracked with its size and upload state. When the quota
+    or the free-space reserve is exceeded, uploaded artifacts are deleted
+    first, then the oldest ones; files the eviction guards report as in use
+    are skipped. Registrations and upload marks are written to the state file
+    at most every save_interval seconds; after a crash, the directory scan
+    picks up files registered since, and artifacts uploaded since merely
+    lose their eviction precedence.
+    """
+
+    def __init__(self, directories, state_file, quota_bytes, min_free_space, save_interval=30.0):
+        """Initialize the storage manager.
+
+        Args:
+            directories: Directories holding managed artifacts (clips, frames)
+            state_file: File path to persist artifact sizes and upload state
+            quota_bytes: Maximum bytes the managed artifacts may use
+            min_free_space: Bytes to always keep free on the volume
+            save_interval: Minimum seconds between state file writes for
+                registrations and upload marks
+        """
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.state_file = state_file
+        self.quota_bytes = quota_bytes
+        self.min_free_space = min_free_space
+        self.save_interval = save_interval
+        self.artifacts = {}
+        self.eviction_guards = []
+        self.dirty = False
+        self.last_saved = 0.0
+        self.storage_lock = threading.Lock()
+
+        self.load_state()
+        self.scan_directories()
+
+    def load_state(self):
+        """Load tracked artifacts from the state file if it exists."""
+        try:
+            if os.path.exists(self.state_file):
+                with open(self.state_file, 'r') as f:
+                    self.artifacts = json.load(f).get("artifacts", {})
+                logger.info(f"Loaded storage state: {len(self.artifacts)} artifacts")
+        except Exception as e:
+            logger.error(f"Error loading storage state: {e}")
+            self.artifacts = {}
+
+    def save_state(self):
+        """Save tracked artifacts to the state file."""
+        try:
+            tmp_file = f"{self.state_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump({"artifacts": self.artifacts}, f)
+            os.replace(tmp_file, self.state_file)
+            self.dirty = False
+            self.last_saved = time.monotonic()
+        except Exception as e:
+            logger.error(f"Error saving storage state: {e}")
+
+    def _state_changed(self):
+        """Save the state if the last save is older than save_interval (called with storage_lock held)."""
+        self.dirty = True
+        if time.monotonic() - self.last_saved >= self.save_interval:
+            self.save_state()
+
+    def flush(self):
+        """Save changes not written to the state file yet, e.g. at shutdown."""
+        with self.storage_lock:
+            if self.dirty:
+                self.save_state()
+
+    def add_eviction_guard(self, callback):
+        """Register a callback reporting files that must not be evicted now.
+
+        Args:
+            callback: Function taking no arguments and returning a set of
+                absolute paths, e.g. the files being uploaded
+        """
+        self.eviction_guards.append(callback)
+
+    def scan_directories(self):
+        """Reconcile tracked artifacts with the files actually on disk."""
+        with self.storage_lock:
+            on_disk = set()
+            for directory in self.directories:
+                for root, _, files in os.walk(directory):
+                    for name in files:
+                        path = os.path.join(root, name)
+                        on_disk.add(path)
+                        if path not in self.artifacts:
+                            stat = os.stat(path)
+                            self.artifacts[path] = {
+                                "bytes": stat.st_size,
+                                "created": stat.st_mtime,
+                                "uploaded": False
+                            }
+
+            for path in list(self.artifacts):
+                if path not in on_disk:
+                    del self.artifacts[path]
+
+            self.save_state()
+
+    def register(self, local_file):
+        """Start tracking a newly written artifact.
+
+        Args:
+            local_file: Path to the artifact
+        """
+        path = os.path.abspath(local_file)
+        try:
+            size = os.path.getsize(path)
+        except OSError as e:
+            logger.error(f"Cannot register {local_file}: {e}")
+            return
+        with self.storage_lock:
+            self.artifacts[path] = {
+                "bytes": size,
+                "created": time.time(),
+                "uploaded": False
+            }
+            self._state_changed()
+
+    def mark_uploaded(self, local_file, num_bytes=None, seconds=None):
+        """Mark an artifact as uploaded, making it the first candidate for eviction.
+
+        Matches the S3Client upload observer signature.
+
+        Args:
+            local_file: Path to the uploaded artifact
+            num_bytes: Size of the upload in bytes (unused)
+            seconds: Time the upload took (unused)
+        """
+        path = os.path.abspath(local_file)
+        with self.storage_lock:
+            artifact = self.artifacts.get(path)
+            if artifact is None:
+                return
+            artifact["uploaded"] = True
+            self._state_changed()
+
+    def is_uploaded(self, local_file):
+        """Check whether an artifact has been uploaded.
+
+        Args:
+            local_file: Path to the artifact
+
+        Returns:
+            bool: True if the artifact is tracked and uploaded
+        """
+        with self.storage_lock:
+            artifact = self.artifacts.get(os.path.abspath(local_file))
+            return bool(artifact and artifact["uploaded"])
+
+    def get_used_bytes(self):
+        """Get the bytes used by all tracked artifacts.
+
+        Returns:
+            int: Used bytes
+        """
+        with self.storage_lock:
+            return sum(artifact["bytes"] for artifact in self.artifacts.values())
+
+    def get_pending_bytes(self, directory=None):
+        """Get the bytes of artifacts that have not been uploaded yet.
+
+        Args:
+            directory: Optional directory to restrict the count to
+
+        Returns:
+            int: Pending upload bytes
+        """
+        prefix = os.path.join(os.path.abspath(directory), "") if directory else ""
+        with self.storage_lock:
+            return sum(
+                artifact["bytes"] for path, artifact in self.artifacts.items()
+                if not artifact["uploaded"] and path.startswith(prefix)
+            )
+
+    def get_pending_count(self):
+        """Get the number of artifacts waiting to be uploaded.
+
+        Returns:
+            int: Pending upload count
+        """
+        with self.storage_lock:
+            return sum(1 for artifact in self.artifacts.values() if not artifact["uploaded"])
+
+    def get_headroom(self):
+        """Get how many more bytes can be written before eviction is needed.
+
+        Returns:
+            int: Bytes left under both the quota and the free-space reserve
+        """
+        quota_left = self.quota_bytes - self.get_used_bytes()
+        disk_left = shutil.disk_usage(self.directories[0]).free - self.min_free_space
+        return max(min(quota_left, disk_left), 0)
+
+    def enforce_quota(self, required_bytes=0):
+        """Evict artifacts until the quota and free-space reserve are met.
+
+        Uploaded artifacts are evicted first, then the oldest remaining ones;
+        files reported by the eviction guards are skipped.
+
+        Args:
+            required_bytes: Extra headroom the caller is about to use
+
+        Returns:
+            int: Number of bytes freed
+        """
+        freed = 0
+        # Asked before taking storage_lock, as the guards take their own locks
+        in_use = set()
+        for guard in self.eviction_guards:
+            try:
+                in_use |= guard()
+            except Exception as e:
+                logger.error(f"Error checking files in use before eviction: {e}")
+        with self.storage_lock:
+            used = sum(artifact["bytes"] for artifact in self.artifacts.values())
+            free = shutil.disk_usage(self.directories[0]).free
+            over_quota = used + required_bytes - self.quota_bytes
+            over_disk = self.min_free_space + required_bytes - free
+            to_free = max(over_quota, over_disk)
+            if to_free <= 0:
+                return 0
+
+            # Uploaded artifacts first, oldest first within each group
+            candidates = sorted(
+                self.artifacts.items(),
+                key=lambda item: (not item[1]["uploaded"], item[1]["created"])
+            )
+            for path, artifact in candidates:
+                if freed >= to_free:
+                    break
+                if path in in_use:
+                    continue
+                if not artifact["uploaded"]:
+                    logger.warning(f"Evicting {path} before it was uploaded")
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.error(f"Error evicting {path}: {e}")
+                    continue
+                freed += artifact["bytes"]
+                del self.artifacts[path]
+                self._remove_empty_parent(path)
+
+            self.save_state()
+
+        logger.info(f"Storage quota enforced: freed {freed // 1024} KB")
+        return freed
+
+    def _remove_empty_parent(self, path):
+        """Remove an artifact's directory if eviction left it empty."""
+        parent = os.path.dirname(path)
+        if parent in self.directories:
+            return
+        try:
+            os.rmdir(parent)
+        except OSError:
+            pass
@@ -0,0 +1,163 @@
+"""
+Encode-once frame fan-out for the IoT security camera live stream.
+"""
+import threading
+import time
+from collections import namedtuple
+from utils.metrics import registry
+
+FRAMES_DROPPED = registry.counter("stream_frames_dropped_total", "Frames skipped by slow stream clients")
+
+# An immutable JPEG frame shared by every viewer
+EncodedFrame = namedtuple("EncodedFrame", ["sequence", "jpeg", "timestamp"])
+
+class StreamClient:
+    """Per-client delivery counters for the live stream."""
+
+    def __init__(self, client_id):
+        """Initialize the client counters.
+
+        Args:
+            client_id: Identifier of the client connection
+        """
+        self.client_id = client_id
+        self.connected_at = time.time()
+        self.last_sequence = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.frames_acked = 0
+        self.ack_latency_total = 0.0
+
+    def record_sent(self, frame):
+        """Record that a frame was sent, counting any frames skipped over.
+
+        Args:
+            frame: EncodedFrame that was sent
+        """
+        if self.last_sequence:
+            dropped = max(frame.sequence - self.last_sequence - 1, 0)
+            self.frames_dropped += dropped
+            FRAMES_DROPPED.inc(dropped)
+        self.last_sequence = frame.sequence
+        self.frames_sent += 1
+
+    def record_ack(self, captured_at):
+        """Record a client acknowledgement of a displayed frame.
+    
+        Args:
+            captured_at: Capture time (time.time()) of the acknowledged frame
+        """
+        self.frames_acked += 1
+        self.ack_latency_total += max(time.time() - captured_at, 0.0)
+
+    def to_dict(self):
+        """Get the counters as a dict.
+
+        Returns:
+            dict: Client counters
+        """
+        return {
+            "client_id": self.client_id,
+            "connected_at": self.connected_at,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "frames_acked": self.frames_acked,
+            "avg_ack_latency_ms": (
+                round(self.ack_latency_total * 1000 / self.frames_acked, 1) if self.frames_acked else None
+            )
+        }
+
+class FrameBroadcaster:
+    """Holds the latest encoded frame for all stream clients.
+
+    The capture thread encodes each frame exactly once and publishes it here;
+    every client generator reads the same bytes object, so encode cost does
+    not grow with the number of viewers. Listeners are told when the sequence
+    advances and clients always jump to the newest frame, so a slow client
+    only lowers its own frame rate.
+    """
+
+    def __init__(self):
+        """Initialize the broadcaster."""
+        self.latest = None
+        self.sequence = 0
+        self.lock = threading.Lock()
+        self.clients = {}
+        self.next_client_id = 0
+        self.listeners = []
+
+    def publish(self, jpeg, timestamp=None):
+        """Publish a newly encoded frame.
+
+        Args:
+            jpeg: JPEG bytes of the frame
+            timestamp: Capture time (time.time()), defaults to now
+
+        Returns:
+            EncodedFrame: The published frame
+        """
+        with self.lock:
+            self.sequence += 1
+            frame = EncodedFrame(self.sequence, bytes(jpeg), timestamp or time.time())
+            self.latest = frame
+        self._notify_listeners()
+        return frame
+
+    def wake_all(self):
+        """Wake every waiting client, e.g. after a stream state change."""
+        self._notify_listeners()
+
+    def add_listener(self, callback):
+        """Register a callback run after every publish or wake-up.
+
+        Used by the asyncio server to wake its coroutines; callbacks run on
+        the publishing thread and must not block.
+
+        Args:
+            callback: Function taking no arguments
+        """
+        self.listeners.append(callback)
+
+    def _notify_listeners(self):
+        """Run the registered listener callbacks."""
+        for callback in self.listeners:
+            callback()
+
+    def register_client(self):
+        """Register a new stream client.
+
+        Returns:
+            StreamClient: Counters for the new client
+        """
+        with self.lock:
+            self.next_client_id += 1
+            client = StreamClient(self.next_client_id)
+            self.clients[client.client_id] = client
+        return client
+
+    def unregister_client(self, client):
+        """Remove a disconnected stream client.
+
+        Args:
+            client: StreamClient returned by register_client
+        """
+        with self.lock:
+            self.clients.pop(client.client_id, None)
+
+    def get_client_stats(self):
+        """Get counters for all connected clients.
+
+        Returns:
+            list: One dict of counters per client
+        """
+        with self.lock:
+            clients = list(self.clients.values())
+        return [client.to_dict() for client in clients]
+
+    def get_latest(self):
+        """Get the most recently published frame.
+
+        Returns:
+            EncodedFrame or None: Latest frame, None if nothing was published yet
+        """
+        return self.latest
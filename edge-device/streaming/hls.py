@@ -0,0 +1,183 @@
+"""
+HLS live output for the IoT security camera system.
+
+The H.264 encoder's output is cut into MPEG-TS segments at keyframes and kept
+in a bounded in-memory store, from which the streaming server serves the
+playlist and segments. One encode serves every HLS viewer.
+"""
+import io
+import math
+import threading
+import time
+from collections import deque, namedtuple
+from camera.outputs import EncoderOutput, H264Muxer
+from utils.logger import logger
+
+HlsSegment = namedtuple("HlsSegment", ["sequence", "duration", "data", "created", "discontinuity"])
+
+class HlsSegmentStore:
+    """Bounded in-memory store of recent HLS segments."""
+
+    def __init__(self, max_segments=6, target_duration=2.0):
+        """Initialize the segment store.
+
+        Args:
+            max_segments: Number of segments kept (and listed in the playlist)
+            target_duration: Nominal segment duration in seconds
+        """
+        self.segments = deque(maxlen=max_segments)
+        self.target_duration = target_duration
+        self.next_sequence = 0
+        # Counts discontinuities that have left the playlist window
+        self.discontinuity_sequence = 0
+        self.discontinuity_pending = False
+        self.store_lock = threading.Lock()
+
+    def add_segment(self, data, duration):
+        """Add a finished segment, dropping the oldest one if the store is full.
+
+        Args:
+            data: MPEG-TS bytes of the segment
+            duration: Segment duration in seconds
+
+        Returns:
+            HlsSegment: The stored segment
+        """
+        with self.store_lock:
+            segment = HlsSegment(self.next_sequence, duration, data, time.time(), self.discontinuity_pending)
+            if len(self.segments) == self.segments.maxlen and self.segments[0].discontinuity:
+                self.discontinuity_sequence += 1
+            self.segments.append(segment)
+            self.discontinuity_pending = False
+            self.next_sequence += 1
+        return segment
+
+    def get_segment(self, sequence):
+        """Get a segment by sequence number.
+
+        Args:
+            sequence: Segment sequence number
+
+        Returns:
+            HlsSegment or None: The segment, None if it has expired or never existed
+        """
+        with self.store_lock:
+            for segment in self.segments:
+                if segment.sequence == sequence:
+                    return segment
+        return None
+
+    def clear(self):
+        """Drop all segments, e.g. when the stream stops.
+
+        Sequence numbers keep counting, and the next segment is marked as a
+        discontinuity so players that kept the old playlist reset their decoder.
+        """
+        with self.store_lock:
+            self.discontinuity_sequence += sum(1 for segment in self.segments if segment.discontinuity)
+            self.segments.clear()
+            if self.next_sequence > 0:
+                self.discontinuity_pending = True
+
+    def get_playlist(self):
+        """Render the live media playlist.
+
+        Returns:
+            str or None: M3U8 playlist, None if no segment is available yet
+        """
+        with self.store_lock:
+            segments = list(self.segments)
+            discontinuity_sequence = self.discontinuity_sequence
+        if not segments:
+            return None
+
+        target = max(self.target_duration, max(segment.duration for segment in segments))
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{math.ceil(target)}",
+            f"#EXT-X-MEDIA-SEQUENCE:{segments[0].sequence}",
+            f"#EXT-X-DISCONTINUITY-SEQUENCE:{discontinuity_sequence}"
+        ]
+        for segment in segments:
+            if segment.discontinuity:
+                lines.append("#EXT-X-DISCONTINUITY")
+            lines.append(f"#EXTINF:{segment.duration:.3f},")
+            lines.append(f"segment_{segment.sequence}.ts")
+        return "\n".join(lines) + "\n"
+
+
+class HlsOutput(EncoderOutput):
+    """Encoder output that cuts H.264 frames into MPEG-TS segments.
+
+    Segments are cut on the first keyframe after the target duration, so the
+    encoder's keyframe period should be at most the segment duration.
+    """
+
+    def __init__(self, store, framerate=30):
+        """Initialize the output.
+
+        Args:
+            store: HlsSegmentStore receiving finished segments
+            framerate: Nominal frame rate of the stream
+        """
+        super().__init__()
+        self.store = store
+        self.framerate = framerate
+        self.buffer = None
+        self.muxer = None
+
+    def start(self):
+        """Start a new live stream."""
+        super().start()
+        self.store.clear()
+
+    def _finish_segment(self, end_timestamp):
+        """Close the current segment and hand it to the store."""
+        self.muxer.close()
+        duration = (end_timestamp - self.muxer.first_timestamp) / 1000000
+        self.store.add_segment(self.buffer.getvalue(), duration)
+        self.muxer = None
+        self.buffer = None
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+        """Mux one encoded frame, starting a new segment when one is due.
+
+        Args:
+            frame: Annex B H.264 bytes
+            keyframe: Whether the frame is a keyframe
+            timestamp: Presentation timestamp in microseconds
+            packet: Unused, present for API compatibility
+            audio: Unused, present for API compatibility
+        """
+        if audio or timestamp is None:
+            return
+        try:
+            if self.muxer is not None and keyframe:
+                if timestamp - self.muxer.first_timestamp >= self.store.target_duration * 1000000:
+                    self._finish_segment(timestamp)
+
+            if self.muxer is None:
+                # Segments must start on a keyframe to be independently decodable
+                if not keyframe:
+                    return
+                self.buffer = io.BytesIO()
+                self.muxer = H264Muxer(self.buffer, container_format="mpegts", framerate=self.framerate)
+
+            self.muxer.mux(frame, keyframe, timestamp)
+        except Exception as e:
+            logger.error(f"Error writing HLS segment: {e}")
+            self.muxer = None
+            self.buffer = None
+
+    def stop(self):
+        """Stop the live stream, discarding the unfinished and stored segments."""
+        super().stop()
+        if self.muxer is not None:
+            try:
+                self.muxer.close()
+            except Exception:
+                pass
+        self.muxer = None
+        self.buffer = None
+        self.store.clear()
@@ -6,12 +6,16 @@ import threading
 from datetime import datetime
 from utils.logger import logger
 from awscrt import mqtt
+from camera.backend import create_h264_encoder
 from streaming.live_stream_server import LiveStreamServer
+from streaming.hls import HlsOutput
 
 class LiveStreamManager:
     """Manages live streaming functionality."""
     
-    def __init__(self, camera_manager, mqtt_client, command_topic, status_topic, client_id, stream_port=8080):
+    def __init__(self, camera_manager, mqtt_client, command_topic, status_topic, client_id, stream_port=8080, overlay=None,
+                 hls_enabled=True, hls_bitrate=1000000, hls_iperiod=30, hls_segment_duration=2.0, hls_max_segments=6,
+                 ws_max_in_flight=2, snapshot_max_age=2, bandwidth=None):
         """Initialize the live stream manager.
         
         Args:
@@ -21,6 +25,15 @@ class LiveStreamManager:
             status_topic: Topic for stream status updates
             client_id: Device client ID
             stream_port: Port for the streaming server
+            overlay: Optional TimestampOverlay drawn onto streamed frames
+            hls_enabled: Whether to publish an HLS stream from the H.264 encoder
+            hls_bitrate: HLS encoder bitrate in bits/s
+            hls_iperiod: HLS encoder keyframe period in frames
+            hls_segment_duration: Target HLS segment duration in seconds
+            hls_max_segments: Number of HLS segments kept in memory
+            ws_max_in_flight: Unacknowledged frames allowed per WebSocket viewer
+            snapshot_max_age: Seconds clients may cache /snapshot.jpg
+            bandwidth: Optional BandwidthConsumer that the stream draws from
         """
         self.camera_manager = camera_manager
         self.mqtt_client = mqtt_client
@@ -28,9 +41,22 @@ class LiveStreamManager:
         self.status_topic = status_topic
         self.client_id = client_id
         self.streaming = False
+        self.hls_enabled = hls_enabled
+        self.hls_bitrate = hls_bitrate
+        self.hls_iperiod = hls_iperiod
+        self.hls_encoder = None
+        self.hls_camera = None
         
         # Create the streaming server
-        self.stream_server = LiveStreamServer(port=stream_port)
+        self.stream_server = LiveStreamServer(
+            port=stream_port,
+            overlay=overlay,
+            hls_segment_duration=hls_segment_duration,
+            hls_max_segments=hls_max_segments,
+            ws_max_in_flight=ws_max_in_flight,
+            snapshot_max_age=snapshot_max_age,
+            bandwidth=bandwidth
+        )
         
         # Start the streaming server
         self.stream_server.start_server()
@@ -80,14 +106,65 @@ class LiveStreamManager:
         self.stream_server.set_camera(camera)
         self.stream_server.enable_streaming(True)
         self.streaming = True
+        if self.hls_enabled:
+            self.start_hls(camera)
         logger.info("Live stream started")
         
     def stop_stream(self):
         """Stop the live stream."""
+        self.stop_hls()
         self.stream_server.enable_streaming(False)
+        self.stream_server.wait_until_camera_idle()
         self.streaming = False
         logger.info("Live stream stopped")
     
+    def start_hls(self, camera):
+        """Start the H.264 encoder feeding the HLS segment store.
+        
+        Args:
+            camera: Camera to encode from
+        """
+        self.stop_hls()
+        if camera is None:
+            return
+        try:
+            # Repeat SPS/PPS on every keyframe so each segment decodes on its own
+            encoder = create_h264_encoder(
+                camera,
+                bitrate=self.hls_bitrate,
+                repeat=True,
+                iperiod=self.hls_iperiod
+            )
+            camera.start_encoder(encoder, output=HlsOutput(self.stream_server.hls_store), name="main")
+            self.hls_encoder = encoder
+            self.hls_camera = camera
+            logger.info("HLS live output started")
+        except Exception as e:
+            logger.error(f"Failed to start HLS live output: {e}")
+    
+    def stop_hls(self):
+        """Stop the HLS encoder if it is running."""
+        if self.hls_encoder is None:
+            return
+        try:
+            self.hls_camera.stop_encoder(self.hls_encoder)
+            logger.info("HLS live output stopped")
+        except Exception as e:
+            logger.warning(f"Error stopping HLS live output: {e}")
+        self.hls_encoder = None
+        self.hls_camera = None
+        # Nothing captured before a stop (e.g. for privacy mode) may be served after it
+        self.stream_server.hls_store.clear()
+    
+    def shutdown(self):
+        """Stop the live stream and shut down the streaming server."""
+        self.stop_stream()
+        self.stream_server.stop_server()
+    
+    def wait_until_camera_idle(self):
+        """Wait until the stream's capture thread no longer uses the camera."""
+        self.stream_server.wait_until_camera_idle()
+    
     def set_privacy_mode(self, enabled):
         """Set privacy mode state for streaming.
         
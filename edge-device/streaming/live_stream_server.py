@@ -1,56 +1,256 @@
 """
 Live streaming functionality for the IoT security camera system.
-Provides a Flask-based web interface for streaming camera feed.
+Provides an asyncio (aiohttp) web interface for streaming camera feed.
 """
+import asyncio
+import json
 import os
+import struct
 import time
 import threading
+from collections import namedtuple
 import numpy as np
 import cv2
-from datetime import datetime
-from flask import Flask, Response, render_template
+from aiohttp import web
 from utils.logger import logger
+from utils.metrics import registry
+from utils.overlay import TimestampOverlay
+from streaming.frame_broadcaster import FrameBroadcaster
+from streaming.hls import HlsSegmentStore
+from streaming.renditions import RenditionSet, DEFAULT_RENDITION
+
+# WebSocket frame header: sequence, capture timestamp (time.time()), stream state
+WS_FRAME_HEADER = struct.Struct("!IdB")
+STREAM_STATE_LIVE = 0
+STREAM_STATE_PRIVACY = 1
+STREAM_STATE_RECORDING = 2
+STREAM_STATE_INITIALIZING = 3
+FRAMES_CAPTURED = registry.counter("stream_frames_captured_total", "Frames captured for the live stream")
+CAPTURE_SECONDS = registry.histogram("stream_capture_seconds", "Time to capture and prepare one stream frame")
+ENCODE_SECONDS = registry.histogram(
+    "stream_encode_seconds", "Time to JPEG-encode one stream frame", labels={"rendition": "main"}
+)
+MJPEG_BYTES_SENT = registry.counter("stream_bytes_sent_total", "Bytes sent to stream clients", labels={"transport": "mjpeg"})
+WS_BYTES_SENT = registry.counter("stream_bytes_sent_total", "Bytes sent to stream clients", labels={"transport": "websocket"})
+CAMERA_IDLE_WAIT_SECONDS = registry.histogram(
+    "stream_camera_idle_wait_seconds", "Time spent waiting for an in-flight stream capture to finish",
+    buckets=(0.0001, 0.001, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+VIEWERS = registry.gauge("stream_viewers", "Connected live stream clients")
+
+# Immutable snapshot of the stream controls; replaced as a whole on every change
+StreamState = namedtuple("StreamState", ["stream_enabled", "privacy_enabled", "recording", "camera"])
+
+STREAM_STATES = {
+    None: STREAM_STATE_LIVE,
+    "Privacy Mode Active": STREAM_STATE_PRIVACY,
+    "Recording in progress...": STREAM_STATE_RECORDING,
+    "Camera initializing...": STREAM_STATE_INITIALIZING
+}
 
 class LiveStreamServer:
-    """Flask-based live streaming server for the IoT security camera system."""
+    """Asyncio-based live streaming server for the IoT security camera system.
+    
+    Each viewer is a coroutine rather than an OS thread; writes await the
+    socket draining, so a slow viewer only holds back its own connection.
+    """
     
-    def __init__(self, port=8080):
+    def __init__(self, port=8080, overlay=None, placeholder_interval=1.0,
+                 write_buffer_limit=256 * 1024, shutdown_timeout=5.0,
+                 hls_segment_duration=2.0, hls_max_segments=6, ws_max_in_flight=2,
+                 snapshot_max_age=2, bandwidth=None):
         """Initialize the live streaming server.
         
         Args:
-            port: Port number for the Flask server (default: 8080)
+            port: Port number for the web server (default: 8080)
+            overlay: Optional TimestampOverlay drawn onto streamed frames
+            placeholder_interval: Seconds between keep-alive placeholder frames
+            write_buffer_limit: Bytes buffered per connection before writes wait
+            shutdown_timeout: Seconds connections get to close on shutdown
+            hls_segment_duration: Target HLS segment duration in seconds
+            hls_max_segments: Number of HLS segments kept in memory
+            ws_max_in_flight: Unacknowledged frames allowed per WebSocket client
+            snapshot_max_age: Seconds clients may cache /snapshot.jpg
+            bandwidth: Optional BandwidthConsumer that stream writes draw from
         """
         self.port = port
-        self.app = Flask(__name__)
+        self.overlay = overlay or TimestampOverlay()
+        self.write_buffer_limit = write_buffer_limit
+        self.shutdown_timeout = shutdown_timeout
+        self.ws_max_in_flight = ws_max_in_flight
+        self.snapshot_max_age = snapshot_max_age
+        self.bandwidth = bandwidth
+        # Distinguishes ETags across restarts, when sequence numbers start over
+        self.etag_prefix = f"{int(time.time()):x}"
+        self.app = web.Application()
         self.setup_routes()
         
         # Streaming variables
-        self.output_frame = None
+        self.broadcaster = FrameBroadcaster()
+        self.renditions = RenditionSet(listener=self._on_broadcast)
+        VIEWERS.set_function(self.get_viewer_count)
+        self.placeholder_frames = {}
+        self.hls_store = HlsSegmentStore(max_segments=hls_max_segments, target_duration=hls_segment_duration)
+        self.placeholder_interval = placeholder_interval
+        # Writers serialize on stream_lock; readers take the current snapshot
+        # without locking, so no reader ever waits on camera I/O
         self.stream_lock = threading.Lock()
-        self.stream_enabled = True
-        self.camera = None
-        self.privacy_enabled = False
-        self.recording = False
+        # Held by the capture thread for the length of one capture, so a state
+        # change can wait until the camera is no longer in use
+        self.capture_lock = threading.Lock()
+        self.state = StreamState(stream_enabled=True, privacy_enabled=False, recording=False, camera=None)
+        self.bgr_buffer = None
         
         # Create templates directory and index.html
         self.create_templates()
+        self.index_html = None
         
-        # Flask server thread
+        # Server thread and its event loop
         self.server_thread = None
         self.stream_thread = None
+        self.loop = None
+        self.runner = None
+        self.frame_event = None
+        self.state_event = None
+        self.stopped = None
+        self.shutting_down = False
     
     def setup_routes(self):
-        """Set up Flask routes."""
-        # Route for home page
-        @self.app.route('/')
-        def index():
-            return render_template('index.html')
-            
-        # Route for video feed
-        @self.app.route('/video_feed')
-        def video_feed():
-            return Response(self.generate_frames(),
-                          mimetype='multipart/x-mixed-replace; boundary=frame')
+        """Set up web routes."""
+        self.app.router.add_get('/', self.index)
+        self.app.router.add_get('/video_feed', self.video_feed)
+        self.app.router.add_get('/ws', self.websocket_feed)
+        self.app.router.add_get('/status', self.status)
+        self.app.router.add_get('/snapshot.jpg', self.snapshot)
+        self.app.router.add_get('/metrics', self.metrics)
+        self.app.router.add_get('/hls/stream.m3u8', self.hls_playlist)
+        self.app.router.add_get('/hls/segment_{sequence:\\d+}.ts', self.hls_segment)
+    
+    async def index(self, request):
+        """Serve the home page."""
+        if self.index_html is None:
+            templates_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+            with open(os.path.join(templates_dir, "index.html"), "rb") as f:
+                self.index_html = f.read()
+        return web.Response(body=self.index_html, content_type='text/html')
+    
+    async def hls_playlist(self, request):
+        """Serve the HLS live playlist."""
+        if self.get_stream_message() is not None:
+            raise web.HTTPNotFound(text="HLS stream not available")
+        playlist = self.hls_store.get_playlist()
+        if playlist is None:
+            raise web.HTTPNotFound(text="HLS stream not available")
+        return web.Response(
+            text=playlist,
+            content_type='application/vnd.apple.mpegurl',
+            headers={'Cache-Control': 'no-cache'}
+        )
+    
+    async def _pace(self, num_bytes):
+        """Wait as long as the stream's bandwidth allocation requires.
+        
+        Called after a frame is written, so the next frame a viewer gets is
+        the newest one when the wait ends rather than a stale one.
+        
+        Args:
+            num_bytes: Bytes just sent
+        """
+        if self.bandwidth is None:
+            return
+        wait = self.bandwidth.reserve(num_bytes)
+        if wait > 0:
+            await asyncio.sleep(wait)
+    
+    async def hls_segment(self, request):
+        """Serve one HLS segment from memory."""
+        if self.get_stream_message() is not None:
+            raise web.HTTPNotFound(text="HLS stream not available")
+        segment = self.hls_store.get_segment(int(request.match_info['sequence']))
+        if segment is None:
+            raise web.HTTPNotFound(text="Segment expired")
+        await self._pace(len(segment.data))
+        return web.Response(
+            body=segment.data,
+            content_type='video/mp2t',
+            headers={'Cache-Control': 'max-age=60'}
+        )
+    
+    async def status(self, request):
+        """Serve the current stream state and per-client counters as JSON."""
+        snapshot = self.state
+        state = {
+            "streaming": snapshot.stream_enabled,
+            "privacy_enabled": snapshot.privacy_enabled,
+            "recording": snapshot.recording,
+            "camera_available": snapshot.camera is not None
+        }
+        latest = self.broadcaster.get_latest()
+        state["sequence"] = latest.sequence if latest else 0
+        state["clients"] = self.broadcaster.get_client_stats()
+        for broadcaster in self.renditions.get_broadcasters():
+            state["clients"].extend(broadcaster.get_client_stats())
+        state["renditions"] = self.renditions.get_stats()
+        return web.json_response(state)
+    
+    async def snapshot(self, request):
+        """Serve the most recent encoded frame as a cacheable still image.
+        
+        The frame the broadcaster already holds is sent as is, so polling
+        costs no camera access or encoding. Supports If-None-Match and
+        If-Modified-Since; while the live feed is unavailable the matching
+        placeholder is served instead.
+        """
+        message = self.get_stream_message()
+        if message is None:
+            frame = self.broadcaster.get_latest()
+            if frame is None:
+                raise web.HTTPServiceUnavailable(text="No frame captured yet", headers={'Retry-After': '1'})
+            etag = f'"{self.etag_prefix}-{frame.sequence}"'
+            jpeg = frame.jpeg
+            last_modified = frame.timestamp
+        else:
+            jpeg = self.get_placeholder_frame(message)
+            if jpeg is None:
+                raise web.HTTPServiceUnavailable(text=message)
+            etag = f'"{self.etag_prefix}-{STREAM_STATES[message]}-placeholder"'
+            last_modified = None
+        
+        headers = {
+            'ETag': etag,
+            'Cache-Control': f'max-age={self.snapshot_max_age}'
+        }
+        
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            not_modified = if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+        else:
+            since = request.if_modified_since
+            not_modified = (
+                since is not None and last_modified is not None and
+                int(last_modified) <= since.timestamp()
+            )
+        
+        response = web.Response(status=304 if not_modified else 200, headers=headers)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        if not not_modified:
+            response.body = jpeg
+            response.content_type = 'image/jpeg'
+        return response
+    
+    async def metrics(self, request):
+        """Serve the process metrics in the Prometheus text format."""
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+    
+    def get_viewer_count(self):
+        """Get the number of connected stream clients across all renditions.
+        
+        Returns:
+            int: Connected clients
+        """
+        broadcasters = [self.broadcaster] + self.renditions.get_broadcasters()
+        return sum(len(broadcaster.clients) for broadcaster in broadcasters)
     
     def create_templates(self):
         """Create the templates directory and index.html file."""
@@ -146,7 +346,7 @@ class LiveStreamServer:
 <body>
     <div class="container">
         <div class="video-container">
-            <img class="stream" src="{{ url_for('video_feed') }}" alt="Video Stream">
+            <img class="stream" src="/video_feed" alt="Video Stream">
             <div class="status">
                 Live Stream - <span id="current-time"></span>
             </div>
@@ -154,6 +354,47 @@ class LiveStreamServer:
     </div>
     
     <script>
+        // Prefer the WebSocket feed: frames are acked after they are shown,
+        // which paces the server to this browser. Falls back to MJPEG.
+        function startWebSocketStream() {
+            const streamImg = document.querySelector('.stream');
+            const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+            const ws = new WebSocket(protocol + '//' + location.host + '/ws');
+            ws.binaryType = 'arraybuffer';
+            // Object URL of the frame on screen, revoked when it is replaced;
+            // a frame replaced before it loaded is covered by the next ack
+            let currentUrl = null;
+            function showFrame(url) {
+                if (currentUrl) {
+                    URL.revokeObjectURL(currentUrl);
+                }
+                currentUrl = url;
+                streamImg.src = url || '';
+            }
+            ws.onopen = function() {
+                streamImg.src = '';
+            };
+            ws.onmessage = function(event) {
+                const view = new DataView(event.data);
+                const sequence = view.getUint32(0);
+                streamImg.onload = function() {
+                    if (sequence > 0 && ws.readyState === WebSocket.OPEN) {
+                        ws.send(JSON.stringify({ack: sequence}));
+                    }
+                };
+                showFrame(URL.createObjectURL(new Blob([event.data.slice(13)], {type: 'image/jpeg'})));
+            };
+            ws.onerror = function() {
+                showFrame(null);
+                streamImg.onload = null;
+                streamImg.src = '/video_feed';
+            };
+        }
+        
+        if ('WebSocket' in window) {
+            startWebSocketStream();
+        }
+        
         // Update the current time display
         function updateTime() {
             const timeElement = document.getElementById('current-time');
@@ -200,118 +441,437 @@ class LiveStreamServer:
                 """)
             logger.info("Created index.html template file.")
     
-    def generate_frames(self):
-        """Generate frames for the video feed."""
-        while True:
-            # Wait until the lock is acquired
-            #print(self.stream_lock)
-            #print("Privacy enabled:")
-            #print(self.privacy_enabled)
-            #print("Stream enabled:")
-            #print(self.stream_enabled)
-            #print("Camera:")
-            #print(self.camera)
+    def get_placeholder_frame(self, message):
+        """Get the JPEG placeholder shown instead of the live feed.
+        
+        Each message is rendered and encoded once, then served from the cache.
+        
+        Args:
+            message: Status message to display
             
-            with self.stream_lock:
-                # Check if streaming is enabled and the output frame is available
-                if (self.privacy_enabled or 
-                    not self.stream_enabled or 
-                    self.output_frame is None or 
-                    self.camera is None):
-                    
-                    # Create appropriate message based on state
-                    if self.privacy_enabled:
-                        message = "Privacy Mode Active"
-                    elif self.recording:
-                        message = "Recording in progress..."
-                    else:
-                        message = "Camera initializing..."
-                    
-                    # Create a blank frame with status message
-                    dummy_frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                    cv2.putText(
-                        dummy_frame, 
-                        message, 
-                        (50, 240), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 
-                        1, 
-                        (255, 255, 255), 
-                        2
-                    )
-                    (flag, encoded_image) = cv2.imencode(".jpg", dummy_frame)
+        Returns:
+            bytes or None: Encoded placeholder, None if encoding failed
+        """
+        jpeg = self.placeholder_frames.get(message)
+        if jpeg is None:
+            # Create a blank frame with status message
+            dummy_frame = np.zeros((480, 640, 3), dtype=np.uint8)
+            cv2.putText(
+                dummy_frame, 
+                message, 
+                (50, 240), 
+                cv2.FONT_HERSHEY_SIMPLEX, 
+                1, 
+                (255, 255, 255), 
+                2
+            )
+            (flag, encoded_image) = cv2.imencode(".jpg", dummy_frame)
+            if not flag:
+                return None
+            jpeg = encoded_image.tobytes()
+            self.placeholder_frames[message] = jpeg
+        return jpeg
+    
+    def get_stream_message(self):
+        """Get the placeholder message for the current state.
+        
+        Returns:
+            str or None: Placeholder message, None if the live feed is available
+        """
+        state = self.state
+        if state.privacy_enabled:
+            return "Privacy Mode Active"
+        if not state.stream_enabled or state.camera is None:
+            if state.recording:
+                return "Recording in progress..."
+            return "Camera initializing..."
+        return None
+    
+    def _notify_frame(self):
+        """Wake every coroutine waiting for a frame (runs on the event loop)."""
+        event, self.frame_event = self.frame_event, asyncio.Event()
+        event.set()
+    
+    def _on_broadcast(self):
+        """Broadcaster listener, called from the capture and control threads."""
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._notify_frame)
+    
+    def _notify_state(self):
+        """Wake every coroutine waiting for a state change (runs on the event loop)."""
+        if self.state_event is None:
+            return
+        event, self.state_event = self.state_event, asyncio.Event()
+        event.set()
+    
+    async def wait_for_state_change(self, timeout):
+        """Wait until the stream state changes or the timeout expires.
+        
+        Paces placeholder frames: unlike wait_for_frame it does not return
+        early because the broadcaster holds a frame the viewer has not seen.
+        
+        Args:
+            timeout: Maximum seconds to wait
+        """
+        try:
+            await asyncio.wait_for(self.state_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def wait_for_frame(self, after_sequence, timeout, broadcaster=None):
+        """Wait for a frame newer than the given sequence.
+        
+        Args:
+            after_sequence: Sequence number of the last frame the caller has
+            timeout: Maximum seconds to wait
+            broadcaster: FrameBroadcaster to read (default: the main feed)
+            
+        Returns:
+            EncodedFrame or None: Newest frame, or None on timeout or wake-up
+        """
+        broadcaster = broadcaster or self.broadcaster
+        latest = broadcaster.get_latest()
+        if latest is None or latest.sequence <= after_sequence:
+            try:
+                await asyncio.wait_for(self.frame_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            latest = broadcaster.get_latest()
+        if latest is None or latest.sequence <= after_sequence:
+            return None
+        return latest
+    
+    def _subscribe(self, request):
+        """Pick the broadcaster for a viewer from its query parameters.
+        
+        Args:
+            request: aiohttp request with optional resolution, quality and fps
+            
+        Returns:
+            tuple: (Rendition or None, FrameBroadcaster); the rendition is None
+                for the main feed, otherwise it must be passed to _unsubscribe
+        """
+        try:
+            rendition = self.renditions.select(request.query)
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        if rendition == DEFAULT_RENDITION:
+            return None, self.broadcaster
+        return rendition, self.renditions.subscribe(rendition)
+    
+    def _unsubscribe(self, rendition):
+        """Release a rendition returned by _subscribe."""
+        if rendition is not None:
+            self.renditions.unsubscribe(rendition)
+    
+    async def video_feed(self, request):
+        """Stream frames to one viewer as multipart JPEG.
+        
+        Waits until the broadcaster publishes a newer frame and always sends
+        the newest one, so a slow client skips frames instead of queueing them.
+        While the live feed is unavailable, a cached placeholder is re-sent at
+        a low keep-alive rate.
+        
+        Query parameters resolution, quality (low/medium/high) and fps select
+        a rendition; omitting them gives the full-quality main feed.
+        """
+        rendition, broadcaster = self._subscribe(request)
+        response = web.StreamResponse(headers={
+            'Content-Type': 'multipart/x-mixed-replace; boundary=frame',
+            'Cache-Control': 'no-cache'
+        })
+        try:
+            await response.prepare(request)
+        except Exception:
+            self._unsubscribe(rendition)
+            raise
+        if request.transport is not None:
+            request.transport.set_write_buffer_limits(high=self.write_buffer_limit)
+        
+        client = broadcaster.register_client()
+        last_sequence = 0
+        try:
+            while not self.shutting_down:
+                message = self.get_stream_message()
+                
+                if message is None:
+                    # Wait for the capture thread to publish a newer frame
+                    frame = await self.wait_for_frame(last_sequence, timeout=1.0, broadcaster=broadcaster)
+                    if frame is None:
+                        continue
+                    client.record_sent(frame)
+                    last_sequence = frame.sequence
+                    jpeg = frame.jpeg
                 else:
-                    # Encode the frame in JPEG format
-                    (flag, encoded_image) = cv2.imencode(".jpg", self.output_frame)
+                    jpeg = self.get_placeholder_frame(message)
+                
+                if jpeg is not None:
+                    # Waits for the socket to drain when this viewer falls behind
+                    chunk = (
+                        b'--frame\r\n'
+                        b'Content-Type: image/jpeg\r\n\r\n' +
+                        jpeg + b'\r\n'
+                    )
+                    await response.write(chunk)
+                    MJPEG_BYTES_SENT.inc(len(chunk))
+                    await self._pace(len(chunk))
                 
-                # Ensure the frame was successfully encoded
-                if not flag:
+                if message is not None:
+                    # Keep-alive pacing; state changes wake the wait early
+                    await self.wait_for_state_change(self.placeholder_interval)
+        except ConnectionError:
+            # The viewer went away; cancellation propagates to aiohttp
+            pass
+        finally:
+            broadcaster.unregister_client(client)
+            self._unsubscribe(rendition)
+            logger.info(
+                f"Stream client {client.client_id} disconnected: "
+                f"{client.frames_sent} frames sent, {client.frames_dropped} dropped"
+            )
+        return response
+    
+    async def _read_acks(self, ws, client, in_flight, acked):
+        """Consume acknowledgements from a WebSocket client.
+        
+        Acks are JSON text messages of the form {"ack": sequence} and are
+        cumulative: acknowledging a frame also releases every older one.
+        
+        Args:
+            ws: WebSocketResponse of the client
+            client: StreamClient counters of the client
+            in_flight: Dict of unacknowledged sequence -> capture timestamp
+            acked: asyncio.Event set whenever in-flight frames are released
+        """
+        async for msg in ws:
+            if msg.type != web.WSMsgType.TEXT:
+                continue
+            try:
+                sequence = int(json.loads(msg.data)["ack"])
+            except (ValueError, KeyError, TypeError):
+                logger.warning(f"Ignoring malformed message from stream client {client.client_id}")
+                continue
+            for pending in [seq for seq in in_flight if seq <= sequence]:
+                captured_at = in_flight.pop(pending)
+                if pending == sequence:
+                    client.record_ack(captured_at)
+            acked.set()
+        acked.set()
+    
+    async def websocket_feed(self, request):
+        """Push frames to one viewer as binary WebSocket messages.
+        
+        Each message is a WS_FRAME_HEADER followed by the JPEG bytes. At most
+        ws_max_in_flight live frames are unacknowledged at a time; once the
+        window is full the server waits for an ack and then sends the newest
+        frame, so pacing follows the client's decode rate. Placeholder frames
+        carry sequence 0 and need no ack. Accepts the same rendition query
+        parameters as /video_feed.
+        """
+        rendition, broadcaster = self._subscribe(request)
+        ws = web.WebSocketResponse(heartbeat=30.0)
+        try:
+            await ws.prepare(request)
+        except Exception:
+            self._unsubscribe(rendition)
+            raise
+        
+        client = broadcaster.register_client()
+        in_flight = {}
+        acked = asyncio.Event()
+        reader = asyncio.ensure_future(self._read_acks(ws, client, in_flight, acked))
+        last_sequence = 0
+        try:
+            while not self.shutting_down and not ws.closed:
+                if len(in_flight) >= self.ws_max_in_flight:
+                    acked.clear()
+                    try:
+                        await asyncio.wait_for(acked.wait(), timeout=1.0)
+                    except asyncio.TimeoutError:
+                        pass
                     continue
+                
+                message = self.get_stream_message()
+                if message is None:
+                    frame = await self.wait_for_frame(last_sequence, timeout=1.0, broadcaster=broadcaster)
+                    if frame is None:
+                        continue
+                    client.record_sent(frame)
+                    last_sequence = frame.sequence
+                    in_flight[frame.sequence] = frame.timestamp
+                    header = WS_FRAME_HEADER.pack(frame.sequence, frame.timestamp, STREAM_STATE_LIVE)
+                    jpeg = frame.jpeg
+                else:
+                    header = WS_FRAME_HEADER.pack(0, time.time(), STREAM_STATES[message])
+                    jpeg = self.get_placeholder_frame(message)
+                
+                if jpeg is not None:
+                    await ws.send_bytes(header + jpeg)
+                    WS_BYTES_SENT.inc(len(header) + len(jpeg))
+                    await self._pace(len(header) + len(jpeg))
+                
+                if message is not None:
+                    await self.wait_for_state_change(self.placeholder_interval)
+        except ConnectionError:
+            # The viewer went away; cancellation propagates to aiohttp
+            pass
+        finally:
+            reader.cancel()
+            broadcaster.unregister_client(client)
+            self._unsubscribe(rendition)
+            await ws.close()
+            logger.info(
+                f"WebSocket client {client.client_id} disconnected: "
+                f"{client.frames_sent} frames sent, {client.frames_dropped} dropped"
+            )
+        return ws
+    
+    def _capture_frame(self, camera):
+        """Capture one BGR frame with the overlay applied.
+        
+        Runs without holding stream_lock. The RGB to BGR conversion writes
+        into a reused buffer, which is safe because the frame is encoded on
+        this thread before the next capture.
+        
+        Args:
+            camera: Camera to capture from
             
-            # Yield the output frame in the byte format
-            yield(b'--frame\r\n' 
-                  b'Content-Type: image/jpeg\r\n\r\n' + 
-                  bytearray(encoded_image) + b'\r\n')
+        Returns:
+            numpy.ndarray or None: BGR frame, None if the capture failed
+        """
+        try:
+            # Capture a frame from the camera
+            frame = camera.capture_array()
+            
+            # Convert the frame from RGB to BGR (OpenCV format)
+            if self.bgr_buffer is None or self.bgr_buffer.shape != frame.shape:
+                self.bgr_buffer = np.empty_like(frame)
+            cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=self.bgr_buffer)
             
-            # Add a small delay to control frame rate and CPU usage
-            time.sleep(0.03)  # Approximately 30 FPS
+            # Add timestamp to the frame (re-rendered once per second)
+            self.overlay.apply(self.bgr_buffer)
+            return self.bgr_buffer
+        except Exception as e:
+            logger.error(f"Error capturing frame for stream: {e}")
+            return None
     
     def stream_capture_thread(self):
         """Thread function to capture frames for streaming."""
         logger.info("Streaming capture thread started")
         
         while True:
-            # Only capture if streaming is enabled, privacy mode is off, and camera is initialized
-            with self.stream_lock:
-                if (self.stream_enabled and 
-                    not self.privacy_enabled and 
-                    self.camera is not None):
-                    try:
-                        # Capture a frame from the camera
-                        frame = self.camera.capture_array()
-                        
-                        # Convert the frame from RGB to BGR (OpenCV format)
-                        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-                        
-                        # Optional: Add timestamp to the frame
-                        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        cv2.putText(
-                            frame, 
-                            current_time, 
-                            (10, 30), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 
-                            0.8, 
-                            (255, 255, 255), 
-                            2, 
-                            cv2.LINE_AA
-                        )
-                        
-                        # Update the global frame that will be sent to clients
-                        self.output_frame = frame.copy()
-                    except Exception as e:
-                        logger.error(f"Error capturing frame for stream: {e}")
+            frame = None
+            captured_at = None
+            
+            with self.capture_lock:
+                # Only capture if streaming is enabled, privacy mode is off, and camera is initialized
+                state = self.state
+                if (state.stream_enabled and 
+                    not state.privacy_enabled and 
+                    state.camera is not None):
+                    start = time.perf_counter()
+                    frame = self._capture_frame(state.camera)
+                    captured_at = time.time()
+                    CAPTURE_SECONDS.observe(time.perf_counter() - start)
+                    
+                    # Drop the frame if the controls changed while capturing,
+                    # e.g. privacy mode was switched on mid-capture
+                    if self.state is not state:
+                        frame = None
+            
+            # Encode once for every connected client, and once per active rendition
+            if frame is not None:
+                FRAMES_CAPTURED.inc()
+                start = time.perf_counter()
+                (flag, encoded_image) = cv2.imencode(".jpg", frame)
+                ENCODE_SECONDS.observe(time.perf_counter() - start)
+                if flag:
+                    self.broadcaster.publish(encoded_image.tobytes(), captured_at)
+                self.renditions.publish(frame, captured_at)
             
             # Control the capture rate
             time.sleep(0.03)  # ~30 FPS
     
+    async def _serve(self, started):
+        """Run the web server until stop_server is called."""
+        self.frame_event = asyncio.Event()
+        self.state_event = asyncio.Event()
+        self.runner = web.AppRunner(self.app, shutdown_timeout=self.shutdown_timeout)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host='0.0.0.0', port=self.port, backlog=512)
+        await site.start()
+        started.set()
+        self.stopped = asyncio.Event()
+        await self.stopped.wait()
+        
+        # Graceful shutdown: let streaming coroutines finish, then close connections
+        self.shutting_down = True
+        self._notify_frame()
+        self._notify_state()
+        await self.runner.cleanup()
+        logger.info("Streaming server stopped")
+    
+    def _run_loop(self, started):
+        """Server thread entry point."""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._serve(started))
+        except Exception as e:
+            logger.error(f"Streaming server error: {e}")
+        finally:
+            started.set()
+            self.loop.close()
+    
     def start_server(self):
-        """Start the Flask server and streaming thread."""
+        """Start the web server and streaming thread."""
         # Start the streaming capture thread
         self.stream_thread = threading.Thread(target=self.stream_capture_thread, daemon=True)
         self.stream_thread.start()
         
-        # Start the Flask web server
+        # Start the asyncio web server on its own thread
         logger.info(f"Starting streaming server on http://0.0.0.0:{self.port}/")
-        self.server_thread = threading.Thread(
-            target=lambda: self.app.run(
-                host='0.0.0.0', 
-                port=self.port, 
-                debug=False, 
-                threaded=True, 
-                use_reloader=False
-            ),
-            daemon=True
-        )
+        self.broadcaster.add_listener(self._on_broadcast)
+        started = threading.Event()
+        self.server_thread = threading.Thread(target=self._run_loop, args=(started,), daemon=True)
         self.server_thread.start()
+        started.wait()
+    
+    def stop_server(self):
+        """Stop the web server, closing client connections gracefully."""
+        loop = self.loop
+        if loop is None or loop.is_closed() or self.server_thread is None:
+            return
+        loop.call_soon_threadsafe(self.stopped.set)
+        self.server_thread.join(self.shutdown_timeout + 1)
+    
+    def _update_state(self, **changes):
+        """Swap in a new state snapshot and wake the stream clients.
+        
+        Returns without waiting for the camera: a capture started under the
+        previous state may still be running, see wait_until_camera_idle.
+        
+        Args:
+            **changes: StreamState fields to change
+        """
+        with self.stream_lock:
+            self.state = self.state._replace(**changes)
+        self.broadcaster.wake_all()
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._notify_state)
+    
+    def wait_until_camera_idle(self):
+        """Wait until no capture started under an earlier state is running.
+        
+        Call after disabling streaming (or enabling privacy mode) and before
+        handing the camera to another user, e.g. shutting it down or
+        recording from it.
+        """
+        start = time.perf_counter()
+        with self.capture_lock:
+            CAMERA_IDLE_WAIT_SECONDS.observe(time.perf_counter() - start)
     
     def set_camera(self, camera):
         """Set the camera instance for streaming.
@@ -319,8 +879,7 @@ class LiveStreamServer:
         Args:
             camera: Picamera2 instance
         """
-        with self.stream_lock:
-            self.camera = camera
+        self._update_state(camera=camera)
     
     def set_privacy_mode(self, enabled):
         """Set the privacy mode state.
@@ -328,8 +887,7 @@ class LiveStreamServer:
         Args:
             enabled: True to enable privacy mode, False to disable
         """
-        with self.stream_lock:
-            self.privacy_enabled = enabled
+        self._update_state(privacy_enabled=enabled)
     
     def set_recording(self, recording):
         """Set the recording state.
@@ -337,8 +895,7 @@ class LiveStreamServer:
         Args:
             recording: True if recording, False otherwise
         """
-        with self.stream_lock:
-            self.recording = recording
+        self._update_state(recording=recording)
     
     def enable_streaming(self, enabled=True):
         """Enable or disable streaming.
@@ -346,5 +903,4 @@ class LiveStreamServer:
         Args:
             enabled: True to enable streaming, False to disable
         """
-        with self.stream_lock:
-            self.stream_enabled = enabled
+        self._update_state(stream_enabled=enabled)
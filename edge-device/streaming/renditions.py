@@ -0,0 +1,171 @@
+"""
+On-demand stream renditions for the IoT security camera live stream.
+"""
+import threading
+import time
+from collections import namedtuple
+import cv2
+from streaming.frame_broadcaster import FrameBroadcaster
+from utils.metrics import registry
+
+# Frame width (None keeps the camera size), JPEG quality and frame rate
+Rendition = namedtuple("Rendition", ["width", "quality", "fps"])
+
+RESOLUTION_TIERS = {"low": 320, "medium": 640, "high": None}
+QUALITY_TIERS = {"low": 50, "medium": 70, "high": 95}
+FPS_TIERS = (5, 15, 30)
+
+# What a viewer gets without query parameters (the main broadcaster)
+DEFAULT_RENDITION = Rendition(RESOLUTION_TIERS["high"], QUALITY_TIERS["high"], FPS_TIERS[-1])
+
+class RenditionSet:
+    """Encodes extra stream renditions while they have subscribers.
+
+    Viewers pick a rendition through query parameters. Each rendition has its
+    own FrameBroadcaster and is resized and encoded once per frame for all of
+    its subscribers; it is reference counted and dropped when the last
+    subscriber leaves, so unwatched renditions cost nothing.
+    """
+
+    def __init__(self, listener=None):
+        """Initialize the rendition set.
+
+        Args:
+            listener: Optional callback added to every rendition broadcaster
+        """
+        self.listener = listener
+        self.renditions = {}
+        self.renditions_lock = threading.Lock()
+
+    @staticmethod
+    def select(params):
+        """Map request query parameters to a rendition.
+
+        Args:
+            params: Mapping with optional 'resolution' and 'quality'
+                ('low', 'medium' or 'high') and 'fps' (frames per second)
+
+        Returns:
+            Rendition: Selected rendition
+
+        Raises:
+            ValueError: If a parameter is not recognised
+        """
+        resolution = params.get("resolution", "high")
+        quality = params.get("quality", "high")
+        if resolution not in RESOLUTION_TIERS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        if quality not in QUALITY_TIERS:
+            raise ValueError(f"Unknown quality: {quality}")
+
+        fps = FPS_TIERS[-1]
+        if "fps" in params:
+            requested = float(params["fps"])
+            # Highest tier not above the request, never below the lowest tier
+            fps = max([tier for tier in FPS_TIERS if tier <= requested] or [FPS_TIERS[0]])
+        return Rendition(RESOLUTION_TIERS[resolution], QUALITY_TIERS[quality], fps)
+
+    def subscribe(self, rendition):
+        """Add a subscriber to a rendition, starting it if needed.
+
+        Args:
+            rendition: Rendition from select()
+
+        Returns:
+            FrameBroadcaster: Broadcaster publishing the rendition
+        """
+        with self.renditions_lock:
+            entry = self.renditions.get(rendition)
+            if entry is None:
+                broadcaster = FrameBroadcaster()
+                if self.listener is not None:
+                    broadcaster.add_listener(self.listener)
+                label = f"{rendition.width or 'full'}w_q{rendition.quality}_{rendition.fps}fps"
+                entry = {
+                    "broadcaster": broadcaster,
+                    "subscribers": 0,
+                    "last_publish": 0.0,
+                    "encode_seconds": registry.histogram(
+                        "stream_encode_seconds", "Time to JPEG-encode one stream frame", labels={"rendition": label}
+                    )
+                }
+                self.renditions[rendition] = entry
+            entry["subscribers"] += 1
+            return entry["broadcaster"]
+
+    def unsubscribe(self, rendition):
+        """Remove a subscriber, stopping the rendition after the last one.
+
+        Args:
+            rendition: Rendition passed to subscribe()
+        """
+        with self.renditions_lock:
+            entry = self.renditions.get(rendition)
+            if entry is None:
+                return
+            entry["subscribers"] -= 1
+            if entry["subscribers"] <= 0:
+                del self.renditions[rendition]
+
+    def publish(self, frame, timestamp=None):
+        """Encode a captured frame for every active rendition that is due.
+
+        Frames are resized once per width and encoded once per rendition.
+
+        Args:
+            frame: BGR frame at camera resolution
+            timestamp: Capture time (time.time()), defaults to now
+        """
+        with self.renditions_lock:
+            active = list(self.renditions.items())
+        if not active:
+            return
+
+        timestamp = timestamp or time.time()
+        now = time.monotonic()
+        resized = {}
+        for rendition, entry in active:
+            # Half a capture interval of slack, so 15 fps keeps every other 30 fps frame
+            if now - entry["last_publish"] < 1.0 / rendition.fps - 0.5 / FPS_TIERS[-1]:
+                continue
+
+            image = resized.get(rendition.width)
+            if image is None:
+                image = frame
+                if rendition.width is not None and rendition.width < frame.shape[1]:
+                    height = round(frame.shape[0] * rendition.width / frame.shape[1])
+                    image = cv2.resize(frame, (rendition.width, height), interpolation=cv2.INTER_AREA)
+                resized[rendition.width] = image
+
+            start = time.perf_counter()
+            (flag, encoded_image) = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, rendition.quality])
+            entry["encode_seconds"].observe(time.perf_counter() - start)
+            if flag:
+                entry["last_publish"] = now
+                entry["broadcaster"].publish(encoded_image.tobytes(), timestamp)
+
+    def get_broadcasters(self):
+        """Get the broadcasters of the active renditions.
+
+        Returns:
+            list: FrameBroadcaster instances
+        """
+        with self.renditions_lock:
+            return [entry["broadcaster"] for entry in self.renditions.values()]
+
+    def get_stats(self):
+        """Get the active renditions and their subscriber counts.
+
+        Returns:
+            list: One dict per active rendition
+        """
+        with self.renditions_lock:
+            return [
+                {
+                    "width": rendition.width,
+                    "quality": rendition.quality,
+                    "fps": rendition.fps,
+                    "subscribers": entry["subscribers"]
+                }
+                for rendition, entry in self.renditions.items()
+            ]
@@ -0,0 +1,259 @@
+"""
+Uplink bandwidth governor for the IoT security camera system.
+"""
+import io
+import threading
+import time
+from contextlib import contextmanager
+from utils.logger import logger
+from utils.metrics import registry
+
+CAPACITY = registry.gauge("bandwidth_capacity_bytes_per_second", "Estimated uplink capacity shared by all consumers")
+
+class BandwidthConsumer:
+    """Token bucket through which one consumer sends its bytes."""
+
+    def __init__(self, governor, name, min_share, burst_seconds=0.25):
+        """Initialize the consumer.
+
+        Args:
+            governor: Owning BandwidthGovernor
+            name: Consumer name, used as the metrics label
+            min_share: Guaranteed fraction of the capacity
+            burst_seconds: Bucket size in seconds of the current rate
+        """
+        self.governor = governor
+        self.name = name
+        self.min_share = min_share
+        self.burst_seconds = burst_seconds
+        self.rate = governor.capacity * min_share
+        self.tokens = 0.0
+        self.last_refill = time.monotonic()
+        self.bucket_lock = threading.Lock()
+
+        # Demand seen since the governor last reallocated
+        self.window_bytes = 0
+        self.window_wait = 0.0
+        self.transfers = 0
+
+        self.allocation_gauge = registry.gauge(
+            "bandwidth_allocation_bytes_per_second", "Current bandwidth allocation", labels={"consumer": name}
+        )
+        self.granted_counter = registry.counter(
+            "bandwidth_granted_bytes_total", "Bytes granted by the bandwidth governor", labels={"consumer": name}
+        )
+        self.throttle_counter = registry.counter(
+            "bandwidth_throttle_seconds_total", "Time consumers were told to wait", labels={"consumer": name}
+        )
+        self.allocation_gauge.set(self.rate)
+
+    def reserve(self, num_bytes):
+        """Take tokens for bytes about to be (or just) sent, without blocking.
+
+        The bucket may go into debt; the caller waits the returned time,
+        which keeps the average rate at the allocation.
+
+        Args:
+            num_bytes: Bytes sent
+
+        Returns:
+            float: Seconds the caller should wait
+        """
+        self.governor.maybe_reallocate()
+        with self.bucket_lock:
+            now = time.monotonic()
+            burst = max(self.rate * self.burst_seconds, 65536)
+            self.tokens = min(burst, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= num_bytes
+            self.window_bytes += num_bytes
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.window_wait += wait
+        self.granted_counter.inc(num_bytes)
+        if wait > 0:
+            self.throttle_counter.inc(wait)
+        return wait
+
+    def acquire(self, num_bytes):
+        """Take tokens, sleeping as long as the allocation requires.
+
+        Matches the boto3 transfer Callback signature, so it can throttle
+        managed uploads directly.
+
+        Args:
+            num_bytes: Bytes sent
+        """
+        wait = self.reserve(num_bytes)
+        if wait > 0:
+            time.sleep(wait)
+
+    @contextmanager
+    def busy(self):
+        """Mark a transfer that would send faster if it could, e.g. an upload.
+
+        While busy, a consumer that does not reach its allocation tells the
+        governor that the link, not the allocation, is the limit.
+        """
+        with self.bucket_lock:
+            self.transfers += 1
+        try:
+            yield self
+        finally:
+            with self.bucket_lock:
+                self.transfers -= 1
+
+    def set_rate(self, rate):
+        """Set the allocation in bytes per second (called by the governor)."""
+        with self.bucket_lock:
+            self.rate = max(rate, 1.0)
+        self.allocation_gauge.set(self.rate)
+
+    def take_window(self):
+        """Return and reset the demand seen since the last reallocation.
+
+        Returns:
+            tuple: (bytes granted, seconds told to wait, whether a transfer is busy)
+        """
+        with self.bucket_lock:
+            window = (self.window_bytes, self.window_wait, self.transfers > 0)
+            self.window_bytes = 0
+            self.window_wait = 0.0
+        return window
+
+class BandwidthGovernor:
+    """Shares an uplink between consumers with guaranteed minimum shares.
+
+    Every consumer always gets its min_share of the estimated capacity; the
+    rest, and whatever other consumers leave unused of their guarantee, goes
+    to saturated consumers (busy transfers, or throttled for most of the
+    last interval) in proportion to their shares. The capacity
+    estimate moves between floor and ceiling: when saturated consumers fall
+    well short of their allocation the link is the bottleneck and the
+    estimate drops to the total achieved, and when they use it fully the
+    estimate is probed upwards.
+    """
+
+    def __init__(self, ceiling, floor=64 * 1024, reallocate_interval=1.0):
+        """Initialize the governor.
+
+        Args:
+            ceiling: Maximum uplink bytes per second to use
+            floor: Minimum capacity estimate in bytes per second
+            reallocate_interval: Seconds between reallocations
+        """
+        self.ceiling = ceiling
+        self.floor = floor
+        self.capacity = ceiling
+        self.reallocate_interval = reallocate_interval
+        self.consumers = {}
+        self.governor_lock = threading.Lock()
+        self.last_reallocate = time.monotonic()
+        CAPACITY.set(self.capacity)
+
+    def register(self, name, min_share):
+        """Add a consumer.
+
+        Args:
+            name: Consumer name, e.g. 's3' or 'stream'
+            min_share: Guaranteed fraction of the capacity (all shares should sum to at most 1)
+
+        Returns:
+            BandwidthConsumer: Token bucket for the consumer
+        """
+        with self.governor_lock:
+            consumer = BandwidthConsumer(self, name, min_share)
+            self.consumers[name] = consumer
+        return consumer
+
+    def maybe_reallocate(self):
+        """Reallocate if the interval has passed; cheap otherwise."""
+        if time.monotonic() - self.last_reallocate < self.reallocate_interval:
+            return
+        if not self.governor_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.monotonic()
+            elapsed = now - self.last_reallocate
+            if elapsed < self.reallocate_interval:
+                return
+            self.last_reallocate = now
+            self._reallocate(elapsed)
+        finally:
+            self.governor_lock.release()
+
+    def _reallocate(self, elapsed):
+        """Update the capacity estimate and the consumer rates.
+
+        Must be called with governor_lock held.
+        """
+        windows = {name: consumer.take_window() for name, consumer in self.consumers.items()}
+        saturated = [
+            name for name, (_, wait, busy) in windows.items()
+            if busy or wait >= 0.5 * elapsed
+        ]
+        if saturated:
+            achieved = sum(windows[name][0] for name in saturated) / elapsed
+            allocated = sum(self.consumers[name].rate for name in saturated)
+            if achieved < 0.8 * allocated:
+                total = sum(granted for granted, _, _ in windows.values()) / elapsed
+                capacity = max(self.floor, min(self.capacity, total * 1.1))
+            elif achieved >= 0.95 * allocated:
+                capacity = min(self.ceiling, self.capacity * 1.1)
+            else:
+                capacity = self.capacity
+            if abs(capacity - self.capacity) > 0.05 * self.capacity:
+                logger.info(f"Uplink capacity estimate: {capacity / 1024:.0f} KiB/s")
+            self.capacity = capacity
+            CAPACITY.set(capacity)
+
+        # Guaranteed shares first, the remainder to the saturated consumers.
+        # They also borrow what the others left unused of their guarantee;
+        # the guarantee itself stays allocated, so it is there the moment it
+        # is needed and the next reallocation evens out the overshoot.
+        spare = self.capacity * (1.0 - sum(consumer.min_share for consumer in self.consumers.values()))
+        if saturated:
+            spare += sum(
+                max(0.0, self.capacity * consumer.min_share - windows[name][0] / elapsed)
+                for name, consumer in self.consumers.items() if name not in saturated
+            )
+        receivers = saturated or list(self.consumers)
+        receiver_shares = sum(self.consumers[name].min_share for name in receivers)
+        for name, consumer in self.consumers.items():
+            rate = self.capacity * consumer.min_share
+            if name in receivers and receiver_shares > 0:
+                rate += spare * consumer.min_share / receiver_shares
+            consumer.set_rate(rate)
+
+class ThrottledBody(io.BytesIO):
+    """In-memory request body that draws from a bandwidth consumer as it is sent.
+
+    botocore may read a body to checksum it before sending it. Only reads
+    after signal_transferring, which the S3 client's request-created hooks
+    call (as s3transfer does for its own bodies), count against the bucket.
+    """
+
+    def __init__(self, data, consumer):
+        """Initialize the body.
+
+        Args:
+            data: Bytes to send
+            consumer: BandwidthConsumer to draw from
+        """
+        super().__init__(data)
+        self.consumer = consumer
+        self.transferring = False
+
+    def read(self, size=-1):
+        """Read and, while transferring, wait for bandwidth."""
+        data = super().read(size)
+        if data and self.transferring:
+            self.consumer.acquire(len(data))
+        return data
+
+    def signal_transferring(self):
+        """Called by botocore before the body is sent."""
+        self.transferring = True
+
+    def signal_not_transferring(self):
+        """Called by botocore before the body is read for checksums."""
+        self.transferring = False
@@ -0,0 +1,150 @@
+"""
+File checksums for the IoT security camera system.
+
+Writers that produce a file sequentially hash it as they write and record
+the SHA-256 in an extended attribute of the file, so the uploader does not
+have to read the file a second time. The attribute carries the size and
+modification time it was computed for, and disappears with the file.
+Files without a valid attribute (e.g. clips written by ffmpeg, or
+filesystems without user xattrs) are hashed on demand.
+"""
+import hashlib
+import os
+
+CHECKSUM_XATTR = "user.sha256"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+class ChecksumWriter:
+    """Writable file that computes its SHA-256 while it is written.
+
+    Only for sequential writers: seeking back and rewriting (as a plain MP4
+    muxer does for its index) would make the digest wrong.
+    """
+
+    def __init__(self, path):
+        """Open the file for writing.
+
+        Args:
+            path: File to create
+        """
+        self.path = path
+        self.file = open(path, "wb")
+        self.hasher = hashlib.sha256()
+
+    def write(self, data):
+        """Write and hash bytes.
+
+        Args:
+            data: Bytes to append
+
+        Returns:
+            int: Number of bytes written
+        """
+        self.hasher.update(data)
+        return self.file.write(data)
+
+    def flush(self):
+        """Flush the underlying file."""
+        self.file.flush()
+
+    def close(self):
+        """Close the file and record its checksum.
+
+        Returns:
+            str: Hex SHA-256 of everything written
+        """
+        if not self.file.closed:
+            self.file.close()
+            record_checksum(self.path, self.hasher.hexdigest())
+        return self.hasher.hexdigest()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def write_file(path, data):
+    """Write bytes to a file and record their checksum.
+
+    Args:
+        path: File to create
+        data: File contents
+
+    Returns:
+        str: Hex SHA-256 of the contents
+    """
+    with ChecksumWriter(path) as writer:
+        writer.write(data)
+    return writer.close()
+
+def record_checksum(path, digest):
+    """Store a checksum for the current version of a file.
+
+    Args:
+        path: File the digest was computed for
+        digest: Hex SHA-256
+
+    Returns:
+        bool: True if the checksum was stored
+    """
+    if not hasattr(os, "setxattr"):
+        return False
+    try:
+        stat = os.stat(path)
+        os.setxattr(path, CHECKSUM_XATTR, f"{stat.st_size}:{stat.st_mtime_ns}:{digest}".encode())
+        return True
+    except OSError:
+        # Filesystem without user xattrs; get_checksum falls back to hashing
+        return False
+
+def file_sha256(path):
+    """Hash a file by reading it in chunks.
+
+    Args:
+        path: File to hash
+
+    Returns:
+        str: Hex SHA-256
+    """
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def get_recorded_checksum(path):
+    """Get the recorded SHA-256 of a file without reading the file.
+
+    Args:
+        path: File to check
+
+    Returns:
+        str or None: Hex SHA-256, None if no valid checksum is recorded
+    """
+    if not hasattr(os, "getxattr"):
+        return None
+    try:
+        stat = os.stat(path)
+        size, mtime_ns, digest = os.getxattr(path, CHECKSUM_XATTR).decode().split(":")
+    except (OSError, ValueError):
+        return None
+    if int(size) == stat.st_size and int(mtime_ns) == stat.st_mtime_ns:
+        return digest
+    return None
+
+def get_checksum(path):
+    """Get the SHA-256 of a file, from its recorded checksum if still valid.
+
+    Args:
+        path: File to check
+
+    Returns:
+        str: Hex SHA-256
+    """
+    digest = get_recorded_checksum(path)
+    if digest is not None:
+        return digest
+    digest = file_sha256(path)
+    record_checksum(path, digest)
+    return digest
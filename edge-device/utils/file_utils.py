@@ -3,7 +3,8 @@ File utility functions for the IoT security camera system.
 """
 import os
 import cv2
-from datetime import datetime
+from datetime import datetime, timezone
+from utils.checksums import write_file
 from utils.logger import logger
 
 def ensure_dirs_exist(directories):
@@ -70,7 +71,11 @@ def extract_frames_from_video(video_path, frames_dir, timestamp, num_frames=3):
             if ret:
                 # Save the frame
                 frame_filename = os.path.join(frames_dir, f"frame_{timestamp}_{i}.jpg")
-                cv2.imwrite(frame_filename, frame)
+                (flag, encoded_image) = cv2.imencode(".jpg", frame)
+                if not flag:
+                    logger.error(f"Error: Could not encode frame at position {frame_pos}")
+                    continue
+                write_file(frame_filename, encoded_image.tobytes())
                 frame_filenames.append(frame_filename)
                 logger.info(f"Extracted frame {i} (position {frame_pos}) to {frame_filename}")
             else:
@@ -87,10 +92,13 @@ def extract_frames_from_video(video_path, frames_dir, timestamp, num_frames=3):
 def generate_timestamp():
     """Generate a timestamp for filenames.
     
+    In UTC: the date in the filename is the day partition of the event's S3
+    keys and index, which viewers in other timezones look up by date.
+    
     Returns:
-        tuple: (filename_timestamp, iso_timestamp)
+        tuple: (filename_timestamp, iso_timestamp with its +00:00 offset)
     """
-    now = datetime.now()
+    now = datetime.now(timezone.utc)
     filename_timestamp = now.strftime("%Y%m%d_%H%M%S")
     iso_timestamp = now.isoformat()
     return filename_timestamp, iso_timestamp
@@ -0,0 +1,248 @@
+"""
+Lightweight in-process metrics registry for the IoT security camera system.
+
+Metrics are plain Python objects. Each one guards its updates with its own
+uncontended lock: "value += amount" is a read-modify-write that the GIL does
+not make atomic, and threads updating the same metric would otherwise lose
+increments. The registry renders them in the Prometheus text exposition format.
+"""
+import math
+import threading
+from bisect import bisect_left
+
+# Default histogram buckets in seconds, from 1 ms to 10 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_value(value):
+    """Format a sample value, spelling non-finite floats as Prometheus does."""
+    if isinstance(value, float) and not math.isfinite(value):
+        if math.isnan(value):
+            return "NaN"
+        return "+Inf" if value > 0 else "-Inf"
+    return str(value)
+
+def _format_labels(labels, extra=None):
+    """Format a label dict as a Prometheus label set."""
+    items = list(labels.items()) + list((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+class Counter:
+    """Monotonically increasing count."""
+
+    metric_type = "counter"
+
+    def __init__(self, name, help_text, labels=None):
+        """Initialize the counter.
+
+        Args:
+            name: Metric name
+            help_text: Description shown in the exposition
+            labels: Optional dict of fixed label values
+        """
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels or {}
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        """Increase the counter.
+
+        Args:
+            amount: Amount to add
+        """
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        """Get the exposition lines of this series."""
+        return [f"{self.name}{_format_labels(self.labels)} {_format_value(self.value)}"]
+
+class Gauge:
+    """Value that can go up and down, or be computed when scraped."""
+
+    metric_type = "gauge"
+
+    def __init__(self, name, help_text, labels=None):
+        """Initialize the gauge.
+
+        Args:
+            name: Metric name
+            help_text: Description shown in the exposition
+            labels: Optional dict of fixed label values
+        """
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels or {}
+        self.value = 0
+        self.function = None
+        self.lock = threading.Lock()
+
+    def set(self, value):
+        """Set the gauge value."""
+        with self.lock:
+            self.value = value
+
+    def inc(self, amount=1):
+        """Increase the gauge value."""
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        """Decrease the gauge value."""
+        with self.lock:
+            self.value -= amount
+
+    def set_function(self, function):
+        """Compute the value with a callback at scrape time instead.
+
+        Args:
+            function: Callable taking no arguments and returning a number
+        """
+        self.function = function
+
+    def samples(self):
+        """Get the exposition lines of this series."""
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                value = float("nan")
+        return [f"{self.name}{_format_labels(self.labels)} {_format_value(value)}"]
+
+class Histogram:
+    """Distribution of observed values in fixed buckets."""
+
+    metric_type = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS, labels=None):
+        """Initialize the histogram.
+
+        Args:
+            name: Metric name
+            help_text: Description shown in the exposition
+            buckets: Sorted bucket upper bounds
+            labels: Optional dict of fixed label values
+        """
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels or {}
+        self.upper_bounds = tuple(buckets)
+        # One slot per bucket plus +Inf; cumulated only when rendering
+        self.bucket_counts = [0] * (len(self.upper_bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        """Record one observation.
+
+        Args:
+            value: Observed value (seconds for timings)
+        """
+        index = bisect_left(self.upper_bounds, value)
+        with self.lock:
+            self.bucket_counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self):
+        """Get the exposition lines of this series."""
+        # Snapshot under the lock so the buckets, sum and count agree
+        with self.lock:
+            bucket_counts = list(self.bucket_counts)
+            total = self.sum
+            count = self.count
+        lines = []
+        cumulative = 0
+        for upper_bound, bucket_count in zip(self.upper_bounds + ("+Inf",), bucket_counts):
+            cumulative += bucket_count
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, {'le': upper_bound})} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labels)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labels)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Holds all metrics of the process and renders them for scraping."""
+
+    def __init__(self):
+        """Initialize an empty registry."""
+        self.metrics = {}
+        self.registry_lock = threading.Lock()
+
+    def _get_or_create(self, metric_class, name, help_text, labels, **kwargs):
+        """Return the registered series for name and labels, creating it if needed."""
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.registry_lock:
+            metric = self.metrics.get(key)
+            if metric is None:
+                metric = metric_class(name, help_text, labels=labels, **kwargs)
+                self.metrics[key] = metric
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} is already registered as a {metric.metric_type}")
+        return metric
+
+    def counter(self, name, help_text, labels=None):
+        """Get or create a counter.
+
+        Args:
+            name: Metric name
+            help_text: Description shown in the exposition
+            labels: Optional dict of fixed label values
+
+        Returns:
+            Counter: Registered counter
+        """
+        return self._get_or_create(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=None):
+        """Get or create a gauge.
+
+        Args:
+            name: Metric name
+            help_text: Description shown in the exposition
+            labels: Optional dict of fixed label values
+
+        Returns:
+            Gauge: Registered gauge
+        """
+        return self._get_or_create(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS, labels=None):
+        """Get or create a histogram.
+
+        Args:
+            name: Metric name
+            help_text: Description shown in the exposition
+            buckets: Sorted bucket upper bounds
+            labels: Optional dict of fixed label values
+
+        Returns:
+            Histogram: Registered histogram
+        """
+        return self._get_or_create(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: Exposition text
+        """
+        with self.registry_lock:
+            metrics = sorted(self.metrics.items(), key=lambda item: item[0])
+
+        lines = []
+        current_name = None
+        for (name, _), metric in metrics:
+            if name != current_name:
+                lines.append(f"# HELP {name} {metric.help_text}")
+                lines.append(f"# TYPE {name} {metric.metric_type}")
+                current_name = name
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry served at /metrics
+registry = MetricsRegistry()
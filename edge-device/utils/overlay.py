@@ -0,0 +1,149 @@
+"""
+Cached text overlay rendering for the IoT security camera system.
+"""
+import threading
+import time
+import cv2
+import numpy as np
+from datetime import datetime
+
+class TimestampOverlay:
+    """Draws a timestamp (plus optional label and status) onto frames.
+
+    The text only changes once per second, so it is rasterized into a small
+    colour patch and alpha mask once per second and then blended into every
+    frame with a NumPy slice operation instead of calling cv2.putText.
+    """
+
+    def __init__(self, origin=(10, 30), font_scale=0.8, color=(255, 255, 255),
+                 thickness=2, label=None, time_format="%Y-%m-%d %H:%M:%S"):
+        """Initialize the overlay renderer.
+
+        Args:
+            origin: (x, y) position of the first text baseline, as for cv2.putText
+            font_scale: OpenCV font scale
+            color: Text colour in the frame's channel order
+            thickness: Text stroke thickness
+            label: Optional device label drawn after the timestamp
+            time_format: strftime format for the timestamp
+        """
+        self.origin = origin
+        self.font = cv2.FONT_HERSHEY_SIMPLEX
+        self.font_scale = font_scale
+        self.color = color
+        self.thickness = thickness
+        self.label = label
+        self.status = None
+        self.time_format = time_format
+
+        # (cache key, top-left, colour patch, inverse alpha), swapped as one reference
+        self._cache = None
+        # Blend scratch buffer per thread: the capture, stream and burst
+        # threads apply the same overlay concurrently
+        self._local = threading.local()
+
+    def set_label(self, label):
+        """Set the device label shown next to the timestamp.
+
+        Args:
+            label: Label text, or None to hide it
+        """
+        self.label = label
+
+    def set_status(self, status):
+        """Set the status line shown below the timestamp.
+
+        Args:
+            status: Status text, or None to hide it
+        """
+        self.status = status
+
+    def _render(self, key, lines, channels):
+        """Rasterize the given lines into a cached colour patch and mask."""
+        line_sizes = [cv2.getTextSize(line, self.font, self.font_scale, self.thickness) for line in lines]
+        line_height = max(height + baseline for (_, height), baseline in line_sizes) + self.thickness
+        width = max(text_width for (text_width, _), _ in line_sizes) + 2 * self.thickness
+        first_ascent = line_sizes[0][0][1] + self.thickness
+        height = first_ascent + line_height * len(lines)
+
+        mask = np.zeros((height, width), dtype=np.uint8)
+        for i, line in enumerate(lines):
+            cv2.putText(
+                mask,
+                line,
+                (self.thickness, first_ascent + i * line_height),
+                self.font,
+                self.font_scale,
+                255,
+                self.thickness,
+                cv2.LINE_AA
+            )
+
+        # Keep only the rows and columns that were actually drawn on
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        if rows.size == 0:
+            self._cache = (key, None, None, None)
+            return self._cache
+        mask = mask[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+        top_left = (
+            self.origin[0] - self.thickness + cols[0],
+            self.origin[1] - first_ascent + rows[0]
+        )
+
+        # Premultiplied colour patch and inverse alpha, with the frame's channel count
+        alpha = np.repeat(mask[:, :, np.newaxis], channels, axis=2)
+        color = (tuple(self.color) + (255,) * channels)[:channels]
+        patch = cv2.multiply(np.full_like(alpha, color), alpha, scale=1 / 255)
+        inverse_alpha = cv2.bitwise_not(alpha)
+        self._cache = (key, top_left, patch, inverse_alpha)
+        return self._cache
+
+    def apply(self, frame, now=None):
+        """Blend the overlay into a frame in place.
+
+        Args:
+            frame: HxWxC uint8 frame (live, snapshot or analysis frame)
+            now: Optional datetime to render instead of the current time
+
+        Returns:
+            numpy.ndarray: The same frame, with the overlay applied
+        """
+        second = int(now.timestamp()) if now is not None else int(time.time())
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        key = (second, self.label, self.status, channels)
+
+        cache = self._cache
+        if cache is None or cache[0] != key:
+            lines = [datetime.fromtimestamp(second).strftime(self.time_format)]
+            if self.label:
+                lines[0] = f"{lines[0]}  {self.label}"
+            if self.status:
+                lines.append(self.status)
+            cache = self._render(key, lines, channels)
+
+        _, top_left, patch, inverse_alpha = cache
+        if patch is None:
+            return frame
+
+        # Clip the patch against the frame edges
+        x0, y0 = top_left
+        frame_height, frame_width = frame.shape[:2]
+        px0, py0 = max(-x0, 0), max(-y0, 0)
+        x1 = min(x0 + patch.shape[1], frame_width)
+        y1 = min(y0 + patch.shape[0], frame_height)
+        x0, y0 = max(x0, 0), max(y0, 0)
+        if x1 <= x0 or y1 <= y0:
+            return frame
+        px1, py1 = px0 + (x1 - x0), py0 + (y1 - y0)
+
+        # roi = roi * (1 - alpha) + colour * alpha, computed on slice views
+        roi = frame[y0:y1, x0:x1]
+        patch = patch[py0:py1, px0:px1].reshape(roi.shape)
+        inverse_alpha = inverse_alpha[py0:py1, px0:px1].reshape(roi.shape)
+        scratch = getattr(self._local, "scratch", None)
+        if scratch is None or scratch.shape != patch.shape:
+            scratch = self._local.scratch = np.empty_like(patch)
+        cv2.multiply(roi, inverse_alpha, dst=scratch, scale=1 / 255)
+        cv2.add(scratch, patch, dst=roi)
+        return frame
@@ -20,6 +20,23 @@ const s3Client = new S3Client({
 // Define the bucket name
 const BUCKET_NAME = process.env.S3_BUCKET_NAME || "my_bucket_name";
 
+// Clips under clips/<device>/<YYYY>/<MM>/<DD>/ keep their frames in the same
+// partition of frames/; older flat clips have them under frames/<dateStr>/
+const thumbnailKeyFor = (clipKey: string, dateStr: string): string => {
+	const partition = path.posix.dirname(clipKey).replace(/^clips\//, "");
+	return partition === "clips"
+		? `frames/${dateStr}/frame_0.jpg`
+		: `frames/${partition}/${dateStr}/frame_0.jpg`;
+};
+
+// Sign a GET for an object (valid for 1 hour)
+const signedGetUrl = (key: string): Promise<string> =>
+	getSignedUrl(
+		s3Client,
+		new GetObjectCommand({ Bucket: BUCKET_NAME, Key: key }),
+		{ expiresIn: 3600 },
+	);
+
 videoRoutes.get("/videos", async (_: Request, res: Response): Promise<void> => {
 	try {
 		const params = {
@@ -62,7 +79,7 @@ videoRoutes.get("/videos", async (_: Request, res: Response): Promise<void> => {
 				if (dateMatch) {
 					const dateStr = dateMatch[1];
 					// Create a signed URL for the thumbnail
-					const thumbnailKey = `frames/${dateStr}/frame_0.jpg`;
+					const thumbnailKey = thumbnailKeyFor(file.Key!, dateStr);
 					const thumbnailCommand = new GetObjectCommand({
 						Bucket: BUCKET_NAME,
 						Key: thumbnailKey,
@@ -102,6 +119,60 @@ videoRoutes.get("/videos", async (_: Request, res: Response): Promise<void> => {
 	}
 });
 
+// List one day of events from the device's per-day index (a single GET)
+videoRoutes.get(
+	"/events/:deviceId/:date",
+	async (req: Request, res: Response): Promise<void> => {
+		try {
+			const { deviceId, date } = req.params;
+
+			// Validate the date format (YYYY-MM-DD)
+			const dateMatch = date.match(/^(\d{4})-(\d{2})-(\d{2})$/);
+			if (!dateMatch || !deviceId.match(/^[\w-]+$/)) {
+				res.status(400).json({ error: "Invalid device or date" });
+				return;
+			}
+			const [, year, month, day] = dateMatch;
+
+			let index: { events?: any[] };
+			try {
+				const data = await s3Client.send(
+					new GetObjectCommand({
+						Bucket: BUCKET_NAME,
+						Key: `index/${deviceId}/${year}/${month}/${day}.json`,
+					}),
+				);
+				index = JSON.parse((await data.Body?.transformToString()) || "{}");
+			} catch (err) {
+				if ((err as Error).name === "NoSuchKey") {
+					res.status(200).json({ events: [] });
+					return;
+				}
+				throw err;
+			}
+
+			const events = await Promise.all(
+				(index.events || []).map(async (event) => ({
+					...event,
+					url: await signedGetUrl(event.video_key),
+					thumbnailUrl: event.thumbnail_key
+						? await signedGetUrl(event.thumbnail_key)
+						: "",
+				})),
+			);
+			// Newest first, as for /videos
+			events.reverse();
+			res.status(200).json({ events });
+		} catch (error) {
+			console.error("Error fetching event index from S3:", error);
+			res.status(500).json({
+				error: "Failed to fetch events",
+				message: (error as Error).message,
+			});
+		}
+	},
+);
+
 // Handle thumbnail requests for a specific date and frame
 videoRoutes.get(
 	"/thumbnails/frames/:dateStr/frame_:frameNum.jpg",
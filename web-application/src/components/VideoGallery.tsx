@@ -1,6 +1,7 @@
 import type React from 'react';
 import type { VideoData } from '../types';
 import { ScrollArea } from './ui/scroll-area';
+import { Input } from './ui/input';
 import { Video } from 'lucide-react';
 import { formatDetailedDate } from '../utils/formatters';
 
@@ -10,6 +11,8 @@ interface VideoGalleryProps {
     onSelectVideo: (video: VideoData) => void;
     selectedVideo: VideoData | null;
     onThumbnailError?: (videoId: string) => void;
+    date?: string;
+    onDateChange?: (date: string) => void;
 }
 
 export const VideoGallery: React.FC<VideoGalleryProps> = ({
@@ -17,10 +20,22 @@ export const VideoGallery: React.FC<VideoGalleryProps> = ({
     loading,
     onSelectVideo,
     selectedVideo,
-    onThumbnailError
+    onThumbnailError,
+    date,
+    onDateChange
 }) => {
     return (
         <div className="pl-4 lg:w-80 shrink-0">
+            {onDateChange && (
+                <Input
+                    type="date"
+                    value={date}
+                    onChange={(e) => e.target.value && onDateChange(e.target.value)}
+                    className="m-2 w-auto"
+                    aria-label="Day of recordings (UTC)"
+                    title="Day of recordings (UTC)"
+                />
+            )}
             <div>
                 <ScrollArea className="h-[70vh] md:h-[70vh] lg:h-[calc(100vh-9rem)]">
                     {loading && videos.length === 0 ? (
@@ -29,7 +44,7 @@ export const VideoGallery: React.FC<VideoGalleryProps> = ({
                         </div>
                     ) : videos.length === 0 ? (
                         <div className="flex items-center justify-center h-24">
-                            <p className="">No security footage available</p>
+                            <p className="">{date ? 'No security footage on this day' : 'No security footage available'}</p>
                         </div>
                     ) : (
                         <div className="flex flex-col gap-3">
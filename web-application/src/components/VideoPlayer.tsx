@@ -35,7 +35,7 @@ export const VideoPlayer: React.FC<VideoPlayerProps> = ({ video, onClick }) => {
                         {video.filename}
                     </span>
                     <span className="text-xs text-zinc-600">
-                        {formatFileSize(video.size)}
+                        {video.size ? formatFileSize(video.size) : ''}
                     </span>
                     <Button
                         variant="secondary"
@@ -16,6 +16,8 @@ interface VideoSectionProps {
     onSelectVideo: (video: VideoData) => void;
     onVideoError: () => void;
     onTogglePrivacy: () => void;
+    date?: string;
+    onDateChange?: (date: string) => void;
 }
 
 export const VideoSection: React.FC<VideoSectionProps> = ({
@@ -26,6 +28,8 @@ export const VideoSection: React.FC<VideoSectionProps> = ({
     privacyMode,
     onSelectVideo,
     onVideoError,
+    date,
+    onDateChange,
 }) => {
     return (
         <div className="flex flex-1 gap-4">
@@ -102,6 +106,8 @@ export const VideoSection: React.FC<VideoSectionProps> = ({
                 videos={videos}
                 loading={loading}
                 onSelectVideo={onSelectVideo}
+                date={date}
+                onDateChange={onDateChange}
             />
         </div>
     );
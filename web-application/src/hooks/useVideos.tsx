@@ -2,7 +2,36 @@
 import { useState, useEffect } from "react";
 import type { VideoData } from "../types";
 
+// Use environment variables if available (for production), otherwise use localhost
+const API_URL = import.meta.env.VITE_API_URL || "http://localhost:3000";
+// Device whose events the gallery lists (CLIENT_ID in the edge device's config)
+const DEVICE_ID = import.meta.env.VITE_DEVICE_ID || "iot_edge_device1";
+
+// Today as YYYY-MM-DD in UTC, the day the device partitions events by
+const today = (): string => new Date().toISOString().slice(0, 10);
+
+// Clips of one day from the full clip listing, for days without an index
+// (recorded before the device uploaded one); the filename carries the date
+const fetchClipsOfDay = async (date: string): Promise<VideoData[]> => {
+	const response = await fetch(`${API_URL}/videos`);
+
+	if (!response.ok) {
+		throw new Error(`Error fetching videos: ${response.statusText}`);
+	}
+
+	const data = await response.json();
+	const day = date.replace(/-/g, "");
+	return data.videos
+		.filter((video: any) => video.filename?.match(/(\d{8})_\d{6}/)?.[1] === day)
+		.map((video: any) => ({
+			...video,
+			lastModified: new Date(video.lastModified),
+			thumbnailUrl: video.thumbnailUrl || undefined,
+		}));
+};
+
 export const useVideos = () => {
+	const [date, setDate] = useState<string>(today);
 	const [videos, setVideos] = useState<VideoData[]>([]);
 	const [selectedVideo, setSelectedVideo] = useState<VideoData | null>(null);
 	const [loading, setLoading] = useState<boolean>(true);
@@ -11,9 +40,9 @@ export const useVideos = () => {
 	const fetchVideos = async () => {
 		try {
 			setLoading(true);
-			// Use environment variable if available (for production), otherwise use localhost
-			const apiUrl = "http://localhost:3000";
-			const response = await fetch(`${apiUrl}/videos`);
+			// One day of events from the device's per-day index, instead of
+			// listing every clip in the bucket
+			const response = await fetch(`${API_URL}/events/${DEVICE_ID}/${date}`);
 
 			if (!response.ok) {
 				throw new Error(`Error fetching videos: ${response.statusText}`);
@@ -21,23 +50,16 @@ export const useVideos = () => {
 
 			const data = await response.json();
 
-			// Convert string dates to Date objects and add thumbnail URLs
-			const processedVideos = data.videos.map((video: any) => {
-				// Extract date part from video key or filename to construct thumbnail path
-				const dateMatch = video.key.match(/(\d{8}_\d{6})/); // Matches format like 20250520_024522
-				const dateStr = dateMatch ? dateMatch[1] : '';
-				
-				// Construct thumbnail URL using the same date pattern
-				const thumbnailUrl = dateStr 
-					? `${apiUrl}/thumbnails/frames/${dateStr}/frame_0.jpg` 
-					: '';
-
-				return {
-					...video,
-					lastModified: new Date(video.lastModified),
-					thumbnailUrl
-				};
-			});
+			// Map index entries to videos, converting string dates to Date objects
+			const processedVideos = data.events.length > 0
+				? data.events.map((event: any) => ({
+					key: event.video_key,
+					filename: event.video_key.split("/").pop(),
+					lastModified: new Date(event.timestamp),
+					url: event.url,
+					thumbnailUrl: event.thumbnailUrl || undefined,
+				}))
+				: await fetchClipsOfDay(date);
 
 			// Sort videos by date (newest first)
 			processedVideos.sort(
@@ -68,7 +90,7 @@ export const useVideos = () => {
 		const intervalId = setInterval(fetchVideos, 5 * 60 * 1000);
 
 		return () => clearInterval(intervalId);
-	}, []);
+	}, [date]);
 
 	const handleVideoError = () => {
 		setError(
@@ -88,6 +110,8 @@ export const useVideos = () => {
 	};
 
 	return {
+		date,
+		setDate,
 		videos,
 		selectedVideo,
 		loading,
@@ -4,6 +4,8 @@ import { useVideos } from '../hooks/useVideos';
 
 const HomePage = () => {
     const {
+        date,
+        setDate,
         videos,
         selectedVideo,
         loading,
@@ -27,6 +29,8 @@ const HomePage = () => {
                 onSelectVideo={setSelectedVideo}
                 onVideoError={handleVideoError}
                 onTogglePrivacy={() => setPrivacyMode(!privacyMode)}
+                date={date}
+                onDateChange={setDate}
             />
         </div>
 
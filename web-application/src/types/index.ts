@@ -1,7 +1,7 @@
 export interface VideoData {
 	key: string;
 	filename: string;
-	size: number;
+	size?: number;
 	lastModified: Date;
 	url: string;
 	thumbnailUrl?: string;